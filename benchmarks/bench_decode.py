@@ -0,0 +1,132 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: bench_decode.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+"""
+Measures the CPU time spent per page by SimpleChecker matching and finding
+links on the bytes of a page, against decoding it first, either as it
+arrives or through r.text, which guesses the charset with chardet when the
+headers do not give one.
+
+    $ python benchmarks/bench_decode.py
+"""
+
+import os
+import sys
+import time
+import codecs
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from techscav import Domain, Property, Request, SimpleChecker
+
+TEXTS = {
+    "utf-8": u"Ol\u00e1, \u4e2d\u6587 \u0438 \u0440\u0443\u0441\u0441\u043a\u0438\u0439 ",
+    "windows-1252": u"Caf\u00e9 \u201cquotes\u201d \u20ac ",
+    "shift_jis": u"\u65e5\u672c\u8a9e\u306e\u30da\u30fc\u30b8 ",
+}
+LINK = u"<p>%s</p><a href='/page/%d'>page</a>\n"
+SCRIPT = u'<script src="http://cdn.foo.com/x.js"></script>'
+CHUNK_SIZE = 16384
+
+
+class Response(object):
+    """
+    A response already downloaded, read by SimpleChecker.scan
+    """
+
+    def __init__(self, body, encoding):
+        self.body = body
+        self.encoding = encoding
+        self.headers = {}
+
+    def iter_content(self, chunk_size):
+        for i in xrange(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+def page(encoding, size):
+    lines = []
+    length = 0
+    while length < size:
+        line = LINK % (TEXTS[encoding] * 4, len(lines))
+        lines.append(line)
+        length += len(line)
+    lines.append(SCRIPT)
+    return u"".join(lines).encode(encoding)
+
+
+def decoded(checker, request, body, encoding):
+    """
+    The checker as it was: the page is decoded as it arrives
+    """
+    scanner = checker.matcher.scanner()
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    chunks = []
+    for chunk in Response(body, encoding).iter_content(CHUNK_SIZE):
+        text = decoder.decode(chunk)
+        scanner.feed(text)
+        chunks.append(text)
+    text = u"".join(chunks)
+    links = checker.follow_links(request, request.url, text)
+    return scanner.found, links
+
+
+def guessed(checker, request, body, encoding):
+    """
+    The page is decoded through r.text, with no charset in the headers
+    """
+    r = requests.models.Response()
+    r._content = body
+    r._content_consumed = True
+    text = r.text
+    links = checker.follow_links(request, request.url, text)
+    return checker.matcher.match(text), links
+
+
+def raw(checker, request, body, encoding):
+    """
+    The checker as it is: the page is matched and parsed as bytes
+    """
+    found, content = checker.scan(request, Response(body, encoding))
+    return found, checker.follow_links(request, request.url, *content.markup())
+
+
+def timed(function, repeat, *args):
+    started = time.clock()
+    for i in xrange(repeat):
+        function(*args)
+    return (time.clock() - started) / repeat
+
+
+def main():
+    p = Property("Foo", ["cdn.foo.com"])
+    checker = SimpleChecker({p.key: p}, chunk_size=CHUNK_SIZE)
+    domain = Domain("bar.com", use_robots=False)
+
+    print "%14s %6s %6s %12s %12s %12s %10s" % ("encoding", "KB", "depth", "chardet (ms)", "decode (ms)", "bytes (ms)", "saved (ms)")
+    for encoding in sorted(TEXTS):
+        for size in (64, 512):
+            body = page(encoding, size * 1024)
+            for depth in (1, 2):
+                request = Request("http://bar.com/", domain, depth)
+                expected = decoded(checker, request, body, encoding)
+                assert raw(checker, request, body, encoding) == expected
+                t_guessed = timed(guessed, 1, checker, request, body, encoding) if size == 64 else float('nan')
+                t_decoded = timed(decoded, 10, checker, request, body, encoding)
+                t_raw = timed(raw, 10, checker, request, body, encoding)
+                print "%14s %6d %6d %12.2f %12.2f %12.2f %10.2f" % (encoding, size, depth, t_guessed * 1000,
+                                                                    t_decoded * 1000, t_raw * 1000,
+                                                                    (t_decoded - t_raw) * 1000)
+
+if __name__ == '__main__':
+    main()
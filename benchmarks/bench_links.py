@@ -0,0 +1,76 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: bench_links.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+"""
+Measures how many pages per second each link extractor gets through, on a
+folder of saved HTML pages or on synthetic ones.
+
+    $ python benchmarks/bench_links.py [folder with .html files]
+"""
+
+import os
+import sys
+import glob
+import random
+import codecs
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from techscav import Domain, LINK_EXTRACTORS, Property, Request, SimpleChecker
+
+
+def make_page(rnd, size=60000):
+    parts = [u"<html><head><title>Page</title><script src='http://cdn.foo.com/x.js'></script></head><body>\n"]
+    total = 0
+    while total < size:
+        r = rnd.random()
+        if r < 0.3:
+            part = u'<a href="/page/%d" class="nav">Page %d</a>\n' % (rnd.randint(0, 10000), rnd.randint(0, 100))
+        elif r < 0.4:
+            part = u'<a href="http://other%d.com/">Other</a>\n' % rnd.randint(0, 100)
+        else:
+            part = u'<div class="c%d"><p>lorem <b>ipsum</b> dolor sit amet, consectetur</p></div>\n' % rnd.randint(0, 10)
+        parts.append(part)
+        total += len(part)
+    parts.append(u"</body></html>")
+    return u"".join(parts)
+
+
+def load_pages(folder):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.html"))):
+        with codecs.open(path, encoding="utf-8", errors="replace") as f:
+            pages.append(f.read())
+    return pages
+
+
+def main():
+    if len(sys.argv) > 1:
+        pages = load_pages(sys.argv[1])
+    else:
+        rnd = random.Random(1)
+        pages = [make_page(rnd) for i in xrange(50)]
+    p = Property("Foo", ["foo.com"])
+    request = Request("http://example.com/", Domain("example.com", use_robots=False), 2)
+
+    print "%d page(s), %d KB" % (len(pages), sum(len(x) for x in pages) / 1024)
+    print "%8s %12s %8s" % ("backend", "pages/sec", "links")
+    for name in sorted(LINK_EXTRACTORS):
+        checker = SimpleChecker({p.key: p}, links=name)
+        links = sum(len(checker.follow_links(request, request.url, page)) for page in pages)
+        elapsed = min(timeit.repeat(lambda: [checker.follow_links(request, request.url, page) for page in pages],
+                                    number=1, repeat=3))
+        print "%8s %12.1f %8d" % (name, len(pages) / elapsed, links)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: bench_matcher.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+"""
+Compares the PropertyMatcher with one re.search per Property on a page, and
+the HostMatcher with both on the resource urls PhantomJS reports.
+
+    $ python benchmarks/bench_matcher.py
+"""
+
+import os
+import sys
+import random
+import re
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from techscav import HostMatcher, Property, PropertyMatcher
+
+
+def make_properties(n, rnd):
+    properties = {}
+    for i in xrange(n):
+        domains = ["%s%d.%s" % (rnd.choice(["cdn", "api", "static", "js"]), i,
+                                rnd.choice(["com", "net", "io"]))
+                   for j in xrange(rnd.randint(1, 3))]
+        p = Property("Property %d" % i, domains)
+        properties[p.key] = p
+    return properties
+
+
+def make_page(properties, rnd, size=200000):
+    domains = [d for p in properties.values() for d in p.domains]
+    parts = []
+    total = 0
+    while total < size:
+        if rnd.random() < 0.02:
+            part = '<script src="https://%s/x.js"></script>\n' % rnd.choice(domains)
+        else:
+            part = '<a href="/page/%d">link text here</a> <p>lorem ipsum dolor</p>\n' % rnd.randint(0, 10000)
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)
+
+
+def make_urls(properties, rnd, count=300):
+    domains = [d for p in properties.values() for d in p.domains]
+    hosts = ["www.shop.com", "img.shop.com", "fonts.example.net"]
+    return ["https://%s/asset/%d.js" % (rnd.choice(domains) if rnd.random() < 0.1 else rnd.choice(hosts), i)
+            for i in xrange(count)]
+
+
+def loop(properties, text):
+    return [p.key for p in properties.values() if re.search(p.re, text)]
+
+
+def loop_urls(properties, urls):
+    return set(p.key for url in urls for p in properties.values() if re.search(p.re, url))
+
+
+def match_urls(matcher, urls):
+    found = set()
+    for url in urls:
+        found |= matcher.match(url)
+    return found
+
+
+def main():
+    rnd = random.Random(1)
+    repeat = 5
+    print "%8s %12s %12s %8s" % ("props", "loop (ms)", "matcher (ms)", "speedup")
+    for n in (10, 100, 1000):
+        properties = make_properties(n, rnd)
+        text = make_page(properties, rnd)
+        matcher = PropertyMatcher(properties)
+        assert set(loop(properties, text)) == matcher.match(text)
+        t_loop = min(timeit.repeat(lambda: loop(properties, text), number=1, repeat=repeat))
+        t_match = min(timeit.repeat(lambda: matcher.match(text), number=1, repeat=repeat))
+        print "%8d %12.2f %12.2f %7.1fx" % (n, t_loop * 1000, t_match * 1000, t_loop / t_match)
+
+    print
+    print "%8s %6s %12s %12s %12s" % ("props", "urls", "loop (ms)", "matcher (ms)", "hosts (ms)")
+    for n in (10, 100, 1000):
+        properties = make_properties(n, rnd)
+        urls = make_urls(properties, rnd)
+        matcher = PropertyMatcher(properties)
+        hosts = HostMatcher(properties)
+        assert match_urls(matcher, urls) == hosts.match(urls)
+        t_loop = float('nan')
+        if n <= 100:
+            # past the cache of the re module every search compiles again
+            assert loop_urls(properties, urls) == hosts.match(urls)
+            t_loop = min(timeit.repeat(lambda: loop_urls(properties, urls), number=1, repeat=repeat))
+        t_match = min(timeit.repeat(lambda: match_urls(matcher, urls), number=1, repeat=repeat))
+        t_hosts = min(timeit.repeat(lambda: hosts.match(urls), number=1, repeat=repeat))
+        print "%8d %6d %12.2f %12.2f %12.2f" % (n, len(urls), t_loop * 1000, t_match * 1000, t_hosts * 1000)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: bench_queue.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+"""
+Compares sending whole Request objects through a multiprocessing queue, one
+per message, with sending them packed in batches the way the Manager does.
+
+    $ python benchmarks/bench_queue.py
+"""
+
+import os
+import sys
+import time
+import cPickle
+from multiprocessing import Process, JoinableQueue
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from techscav import DomainsFile, Manager, Request
+
+
+def consume_objects(queue):
+    while True:
+        request = queue.get()
+        queue.task_done()
+        if request is None:
+            break
+
+
+def consume_batches(queue, manager):
+    while True:
+        batch = manager.fetch_new_requests()
+        queue.task_done()
+        if batch is None:
+            break
+
+
+def make_requests(manager, domains, per_domain):
+    requests = []
+    for i in xrange(domains):
+        domain = manager.register("domain%d.com" % i)
+        requests.extend(Request("http://domain%d.com/page/%d" % (i, j), domain, 2) for j in xrange(per_domain))
+    return requests
+
+
+def timed(target, args, queue, messages):
+    consumer = Process(target=target, args=args)
+    consumer.start()
+    started = time.time()
+    for message in messages:
+        queue.put(message)
+    queue.put(None)
+    queue.join()
+    consumer.join()
+    return time.time() - started
+
+
+def main():
+    print "%10s %12s %14s %14s" % ("format", "batch", "requests/sec", "bytes/request")
+    manager = Manager(DomainsFile(open(os.devnull)), {}, 1, None, use_robots=True, depth=2)
+    requests = make_requests(manager, 1000, 20)
+
+    queue = JoinableQueue()
+    size = len(cPickle.dumps(requests[0], cPickle.HIGHEST_PROTOCOL))
+    elapsed = timed(consume_objects, (queue,), queue, requests)
+    print "%10s %12d %14.0f %14d" % ("objects", 1, len(requests) / elapsed, size)
+
+    for batch in (1, 4, 16, 64):
+        manager.queue = queue = JoinableQueue()
+        messages = [(time.time(), manager.pack_requests(requests[i:i + batch])) for i in xrange(0, len(requests), batch)]
+        size = len(cPickle.dumps(messages[0], cPickle.HIGHEST_PROTOCOL)) / float(batch)
+        elapsed = timed(consume_batches, (queue, manager), queue, messages)
+        print "%10s %12d %14.0f %14d" % ("packed", batch, len(requests) / elapsed, size)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: bench_stream.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+"""
+Compares reading whole pages through r.text with the streaming scan of
+SimpleChecker, on large pages served locally.
+
+    $ python benchmarks/bench_stream.py
+"""
+
+import os
+import sys
+import time
+import threading
+import requests
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from techscav import Domain, Property, PropertyMatcher, Request, SimpleChecker
+
+PORT_NUMBER = 9599
+FILLER = "<p>lorem ipsum dolor sit amet</p><a href='/page'>page</a>\n" * 1000
+SCRIPT = '<script src="http://cdn.foo.com/x.js"></script>'
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the client hung up before the page was over
+        pass
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    /<where>/<MB> serves a page of that size with the property at the start,
+    at the end or nowhere
+    """
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+    def do_GET(self):
+        where, size = self.path.strip("/").split("/")
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.end_headers()
+        try:
+            if where == "start":
+                self.wfile.write(SCRIPT)
+            for i in xrange(int(size) * 1024 * 1024 / len(FILLER)):
+                self.wfile.write(FILLER)
+            if where == "end":
+                self.wfile.write(SCRIPT)
+        except IOError:
+            pass
+
+
+def whole(matcher, url):
+    r = requests.get(url, timeout=60)
+    return matcher.match(r.text)
+
+
+def main():
+    server = ThreadingServer(('', PORT_NUMBER), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    p = Property("Foo", ["cdn.foo.com"])
+    properties = {p.key: p}
+    matcher = PropertyMatcher(properties)
+    checker = SimpleChecker(properties)
+    domain = Domain("localhost:%d" % PORT_NUMBER, use_robots=False)
+
+    print "%8s %6s %12s %12s %8s" % ("match", "MB", "whole (ms)", "stream (ms)", "speedup")
+    for where in ("start", "end", "none"):
+        for size in (1, 8, 32):
+            url = "http://localhost:%d/%s/%d" % (PORT_NUMBER, where, size)
+            started = time.time()
+            expected = whole(matcher, url)
+            t_whole = time.time() - started
+            started = time.time()
+            found = checker.check(Request(url, domain, 1), None)
+            t_stream = time.time() - started
+            if where == "start" or size * 1024 * 1024 <= checker.max_bytes:
+                assert set(found) == expected
+            print "%8s %6d %12.1f %12.1f %7.1fx" % (where, size, t_whole * 1000, t_stream * 1000, t_whole / t_stream)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
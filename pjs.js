@@ -5,30 +5,110 @@ if (!String.prototype.startsWith) {
   };
 }
 
-var page = require('webpage').create();
+var webpage = require('webpage');
 var system = require('system');
 var args = system.args;
-var urls = []
 
-page.onResourceRequested = function(request) {
-  if(request['url'].startsWith("http")){
-    urls.push(request['url'])
+// --block=<extensions> aborts the resources with those extensions after
+// recording their url, --budget=<ms> emits whatever was loaded once a page
+// takes longer than that
+var blocked = {};
+var budget = 0;
+var target = null;
+for (var i = 1; i < args.length; i++) {
+  if (args[i].startsWith("--block=")) {
+    args[i].substr(8).split(",").forEach(function(extension) {
+      if (extension) {
+        blocked[extension.toLowerCase()] = true;
+      }
+    });
+  } else if (args[i].startsWith("--budget=")) {
+    budget = parseInt(args[i].substr(9), 10) || 0;
+  } else {
+    target = args[i];
   }
-};
+}
+
+function extension(url) {
+  var path = url.split('#')[0].split('?')[0];
+  var dot = path.lastIndexOf('.');
+  if (dot <= path.lastIndexOf('/')) {
+    return '';
+  }
+  return path.substr(dot + 1).toLowerCase();
+}
+
+// Renders a page and prints its final url, DOM, every url it requested and
+// how many of them were blocked as a single JSON line
+function render(url, done) {
+  var page = webpage.create();
+  var urls = [];
+  var finished = false;
+  var aborted = 0;
+  var timer = null;
 
-page.onResourceReceived = function(response) {
-  if(response['url'].startsWith("http")){
-    urls.push(response['url'])
+  page.onResourceRequested = function(request, networkRequest) {
+    if(request['url'].startsWith("http")){
+      urls.push(request['url'])
+      if (blocked[extension(request['url'])]) {
+        aborted++;
+        networkRequest.abort();
+      }
+    }
+  };
+
+  page.onResourceReceived = function(response) {
+    if(response['url'].startsWith("http")){
+      urls.push(response['url'])
+    }
+  };
+
+  function finish(partial) {
+    if (finished) {
+      return;
+    }
+    finished = true;
+    if (timer) {
+      clearTimeout(timer);
+    }
+    console.log(JSON.stringify({
+      url:page.url || url,
+      content:page.content,
+      urls:urls,
+      blocked:aborted,
+      partial:partial
+    }))
+    page.stop();
+    page.close();
+    done();
   }
-};
-
-page.onLoadFinished = function(status) {
-  console.log(JSON.stringify({
-    url:page.url,
-    content:page.content,
-    urls:urls
-  }))
-  phantom.exit(0);
-};
-
-page.open(args[1]);
+
+  page.onLoadFinished = function(status) {
+    finish(false);
+  };
+
+  if (budget) {
+    timer = setTimeout(function() { finish(true); }, budget);
+  }
+  page.open(url);
+}
+
+// Reads one url per line from stdin until it is closed, so the same process
+// renders many pages. "ping" is answered right away as a health check.
+function next() {
+  var url = system.stdin.readLine();
+  if (!url) {
+    phantom.exit(0);
+  } else if (url === "ping") {
+    console.log(JSON.stringify({pong:true}));
+    setTimeout(next, 0);
+  } else {
+    render(url, function() { setTimeout(next, 0); });
+  }
+}
+
+if (target) {
+  render(target, function() { phantom.exit(0); });
+} else {
+  next();
+}
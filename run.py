@@ -1,37 +1,189 @@
+import sys
 import json
+import time
+import datetime
 import argparse
 import logging
 
 from techscav import *
 
+def parse_date(text):
+    """
+    Gets the time of a date given on the command line, None if it is not one
+    """
+    for format in ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return time.mktime(datetime.datetime.strptime(text, format).timetuple())
+        except ValueError:
+            pass
+
 def main():
     """
     The main function
     """
     parser = argparse.ArgumentParser(description='Detects the usage of web properties')
   
-    parser.add_argument('file', metavar='<file>', type=argparse.FileType('r'), nargs=1,
-                     help='file with the domains to be searched')
+    parser.add_argument('file', metavar='<file>', type=argparse.FileType('r'), nargs='*',
+                     help='file with the domains to be searched, not needed by --worker')
     
     parser.add_argument('-v', '--verbose', action="count", help="verbose level... repeat up to three times.")
 
-    parser.add_argument('-p', "--properties", metavar='<properties>', type=argparse.FileType('r'), nargs=1,
+    parser.add_argument('-p', "--properties", metavar='<properties>', type=argparse.FileType('r'),
                      help='file describing the properties and the domains related to them (default: sites.json)', default="properties.json")
 
     parser.add_argument('-i', "--ignore-robots-txt", action="store_true", help='ignores robots.txt while crawling')
 
     parser.add_argument('-m', "--mode", metavar='<mode>', type=str, nargs=1,
-                     help='how the properties are found. Can be "simple" or "phantomjs" (default: simple)', default=["simple"])
+                     help='how the properties are found. Can be "simple", "phantomjs", "tiered" or "async" (default: simple)', default=["simple"])
 
     parser.add_argument('-j', "--phantomjs-bin", metavar='<phantomjs>', type=str, nargs=1,
                      help='the location of the phantomjs binary (default: ./node_modules/phantomjs/bin/phantomjs)', default=["./node_modules/phantomjs/bin/phantomjs"])
 
+    parser.add_argument('--render-timeout', nargs=1, help='seconds a page can take to render on PhantomJS (default: 30)', 
+                     metavar='<seconds>', type=float, default=[30])
+
+    parser.add_argument('--max-renders', nargs=1, help='pages a PhantomJS renderer renders before being replaced (default: 100)', 
+                     metavar='<pages>', type=int, default=[100])
+
+    parser.add_argument('--max-renderer-memory', nargs=1, help='resident memory in KB that gets a PhantomJS renderer replaced (default: no limit)', 
+                     metavar='<KB>', type=int, default=[None])
+
+    parser.add_argument('--block-resources', nargs=1, help='comma separated resource types (image, font, media, stylesheet) or extensions PhantomJS records but does not download (default: image,font,media)', 
+                     metavar='<types>', type=str, default=["image,font,media"])
+
+    parser.add_argument('--render-budget', nargs=1, help='seconds a page has on PhantomJS before whatever was loaded is used (default: 15)', 
+                     metavar='<seconds>', type=float, default=[15])
+
+    parser.add_argument('--escalate-scripts', nargs=1, help='<script> tags a page with nothing found needs to be rendered on tiered mode (default: 3)', 
+                     metavar='<scripts>', type=int, default=[3])
+
+    parser.add_argument('--escalate-text', nargs=1, help='characters of text a page with nothing found can have and still be rendered on tiered mode (default: 500)', 
+                     metavar='<characters>', type=int, default=[500])
+
+    parser.add_argument('--escalate-marker', metavar='<regexp>', type=str, action="append",
+                     help='a regular expression that gets a page with nothing found rendered on tiered mode, can be repeated (default: common application roots)')
+
+    parser.add_argument('--escalate-all', action="store_true", help='renders every page with nothing found on tiered mode')
+
+    parser.add_argument('--max-bytes', nargs=1, help='bytes of a page read before giving up on the rest, 0 for no limit (default: 2097152)', 
+                     metavar='<bytes>', type=int, default=[2097152])
+
+    parser.add_argument('--any-content-type', action="store_true", help='reads pages of every content type, not only HTML')
+
+    parser.add_argument('--link-extractor', metavar='<extractor>', type=str, nargs=1, choices=sorted(LINK_EXTRACTORS),
+                     help='how links are found on a page. Can be "lxml" or "soup" (default: lxml)', default=["lxml"])
+
+    parser.add_argument('--content-cache', nargs=1, help='page bodies whose links are kept so the same body is not parsed again, 0 for none (default: 1000)', 
+                     metavar='<pages>', type=int, default=[1000])
+
+    parser.add_argument('--connections-per-host', nargs=1, help='keep-alive connections each process keeps open to a host (default: 2)', 
+                     metavar='<connections>', type=int, default=[2])
+
+    parser.add_argument('--dead-host-ttl', nargs=1, help='seconds the requests to a host that could not be connected to fail right away, 0 to always try (default: 300)', 
+                     metavar='<seconds>', type=int, default=[300])
+
+    parser.add_argument('--resolver-threads', nargs=1, help='threads resolving the domains before they are crawled, 0 to let each fetch resolve its own, not used on async mode (default: 32)', 
+                     metavar='<threads>', type=int, default=[32])
+
+    parser.add_argument('--dns-cache', nargs=1, help='sqlite file where the addresses of the domains are kept between runs (default: a temporary file)', 
+                     metavar='<file>', type=str, default=[None])
+
+    parser.add_argument('--dns-ttl', nargs=1, help='how many seconds the address of a domain is valid for (default: 300)', 
+                     metavar='<seconds>', type=int, default=[300])
+
+    parser.add_argument('--incremental', nargs=1, help='sqlite file where the pages fetched are kept, so the next runs only ask for them if they changed (default: not kept, only used by the simple and tiered modes)', 
+                     metavar='<file>', type=str, default=[None])
+
+    parser.add_argument('--since', nargs=1, help='date, as YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS, before which the pages kept by --incremental are fetched whole (default: any date)', 
+                     metavar='<date>', type=str, default=[None])
+
+    parser.add_argument('--incremental-size', nargs=1, help='megabytes the pages kept by --incremental can take (default: 1024)', 
+                     metavar='<megabytes>', type=int, default=[1024])
+
     parser.add_argument('-t','--threads', nargs=1, help='number of threads used (default: CPUs)', 
                      metavar='<threads>', type=int, default=[cpu_count()])
 
+    parser.add_argument('--adaptive', action="store_true", help='adapts how many requests are in flight to the latency and CPU use, between --min-threads and --max-window')
+
+    parser.add_argument('--min-threads', nargs=1, help='the fewest requests in flight on adaptive mode (default: 1)', 
+                     metavar='<threads>', type=int, default=[1])
+
+    parser.add_argument('--max-window', nargs=1, help='the most requests in flight on adaptive mode, may be more than --threads for hosts slow to answer (default: threads * 2 * batch size)', 
+                     metavar='<requests>', type=int, default=[None])
+
+    parser.add_argument('--batch-size', nargs=1, help='number of requests sent to a process at once (default: 4)', 
+                     metavar='<requests>', type=int, default=[4])
+
+    parser.add_argument('-c','--concurrency', nargs=1, help='number of requests in flight on async mode (default: 1000)', 
+                     metavar='<concurrency>', type=int, default=[1000])
+
     parser.add_argument('-d','--depth', nargs=1, help='how deep the crawler should go (default: 1)', 
                      metavar='<depth>', type=int, default=[1])
 
+    parser.add_argument('--max-pages', nargs=1, help='pages crawled on each domain, 0 for no limit (default: 100)', 
+                     metavar='<pages>', type=int, default=[100])
+
+    parser.add_argument('--priority-keywords', nargs=1, help='comma separated words that get a page crawled sooner when in its url (default: %s)' % ",".join(KEYWORDS), 
+                     metavar='<words>', type=str, default=[",".join(KEYWORDS)])
+
+    parser.add_argument('--frontier-memory', nargs=1, help='requests waiting to be crawled kept in memory, the rest go to disk, 0 to keep them all (default: 100000)', 
+                     metavar='<requests>', type=int, default=[100000])
+
+    parser.add_argument('--spill-dir', nargs=1, help='where the requests that do not fit in memory go (default: the temporary directory)', 
+                     metavar='<dir>', type=str, default=[None])
+
+    parser.add_argument('--max-per-host', nargs=1, help='number of requests in flight for the same host (default: 2)', 
+                     metavar='<requests>', type=int, default=[2])
+
+    parser.add_argument('--host-delay', nargs=1, help='minimum seconds between requests to the same host, robots.txt may ask for more (default: 0)', 
+                     metavar='<seconds>', type=float, default=[0])
+
+    parser.add_argument('--robots-cache', nargs=1, help='sqlite file where robots.txt files are kept between runs (default: a temporary file)', 
+                     metavar='<file>', type=str, default=[None])
+
+    parser.add_argument('--robots-ttl', nargs=1, help='how many seconds a cached robots.txt file is valid for (default: 86400)', 
+                     metavar='<seconds>', type=int, default=[86400])
+
+    parser.add_argument('-o', '--output', metavar='<output>', type=str, nargs=1,
+                     help='file where the results are written as each domain is done, - for stdout (default: stdout)', default=["-"])
+
+    parser.add_argument('-f', '--format', metavar='<format>', type=str, nargs=1, choices=FORMATS,
+                     help='format of the results. Can be "text", "jsonl" or "csv" (default: text)', default=["text"])
+
+    parser.add_argument('--dedup-capacity', nargs=1, help='how many urls the visited url filter is sized for (default: 1000000)', 
+                     metavar='<urls>', type=int, default=[1000000])
+
+    parser.add_argument('--checkpoint', nargs=1, help='file where the state of the crawl is saved every so often (default: not saved)', 
+                     metavar='<file>', type=str, default=[None])
+
+    parser.add_argument('--checkpoint-interval', nargs=1, help='seconds between checkpoints (default: 60)', 
+                     metavar='<seconds>', type=float, default=[60])
+
+    parser.add_argument('--resume', action="store_true", help='resumes the crawl saved on the checkpoint, appending to the output')
+
+    parser.add_argument('--coordinator', nargs=1, help='runs the crawl for workers on other machines, listening on this address, which needs --secret unless it is localhost, not used on async mode (default: crawls on this machine)', 
+                     metavar='<host:port>', type=str, default=[None])
+
+    parser.add_argument('--worker', nargs=1, help='works for the coordinator on this address with --threads processes, the domains file is not read (default: crawls on this machine)', 
+                     metavar='<host:port>', type=str, default=[None])
+
+    parser.add_argument('--secret', nargs=1, help='key the workers need to connect to the coordinator, needed unless it listens on localhost (default: none)', 
+                     metavar='<key>', type=str, default=[None])
+
+    parser.add_argument('--lease-ttl', nargs=1, help='seconds a worker can go without sending a page before its requests go to another one (default: 60)', 
+                     metavar='<seconds>', type=float, default=[60])
+
+    parser.add_argument('--progress', action="store_true", help='shows a progress bar on stderr while crawling')
+
+    parser.add_argument('--metrics-file', nargs=1, help='file where the timings and counters are written in the Prometheus text format every --metrics-interval seconds (default: not written)', 
+                     metavar='<file>', type=str, default=[None])
+
+    parser.add_argument('--metrics-port', nargs=1, help='port on localhost serving the timings and counters on /metrics, in the Prometheus text format, those of this machine with --worker (default: not served)', 
+                     metavar='<port>', type=int, default=[None])
+
+    parser.add_argument('--metrics-interval', nargs=1, help='seconds between updates of the progress bar and the metrics file (default: 5)', 
+                     metavar='<seconds>', type=float, default=[5])
+
     args = parser.parse_args()
 
 
@@ -53,23 +205,128 @@ def main():
     
     logging.debug("%s properties loaded and parsed" % len(propdict['properties']))
 
+    if not args.file and not args.worker[0]:
+        parser.error("the file with the domains to be searched is needed")
+
+    address = None
+    if args.coordinator[0] or args.worker[0]:
+        if args.coordinator[0] and args.worker[0]:
+            parser.error("--coordinator and --worker can not be used together")
+        if args.mode[0] == "async":
+            parser.error("--coordinator and --worker are not used on async mode")
+        try:
+            address = parse_address(args.coordinator[0] or args.worker[0])
+        except ValueError as e:
+            parser.error(str(e))
+        if args.coordinator[0] and not args.secret[0] and not is_loopback(address[0]):
+            parser.error("--coordinator needs --secret unless it listens on localhost, the workers send pickles")
+
+    resolver = None
+    if args.resolver_threads[0] and args.mode[0] != "async" and not args.worker[0]:
+        resolver = DomainResolver(cache=DNSCache(args.dns_cache[0], args.dns_ttl[0]), threads=args.resolver_threads[0])
+    metrics = Metrics(args.threads[0] + 1)
+    http = SessionPool(per_host=args.connections_per_host[0], dead_ttl=args.dead_host_ttl[0],
+                       dns=resolver.cache if resolver else None, metrics=metrics)
+
+    pages = None
+    if args.incremental[0]:
+        since = None
+        if args.since[0]:
+            since = parse_date(args.since[0])
+            if since is None:
+                parser.error("--since takes YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS")
+        pages = PageCache(args.incremental[0], properties_signature(properties), args.incremental_size[0] * 1024 * 1024, since)
+    elif args.since[0]:
+        parser.error("--since needs --incremental")
+
     if args.mode[0] == "simple":
         logging.debug("Using SimpleChecker")
-        checker = SimpleChecker(properties)
-    elif args.mode[0] == "phantomjs":
+        checker = SimpleChecker(properties, max_bytes=args.max_bytes[0] or None,
+                                content_types=None if args.any_content_type else HTML_TYPES,
+                                links=args.link_extractor[0], cache_size=args.content_cache[0], http=http, pages=pages,
+                                metrics=metrics)
+    elif args.mode[0] == "async":
+        logging.debug("Using SimpleChecker on an event loop")
+        checker = SimpleChecker(properties, max_bytes=args.max_bytes[0] or None, links=args.link_extractor[0],
+                                cache_size=args.content_cache[0], metrics=metrics)
+    elif args.mode[0] in ("phantomjs", "tiered"):
         logging.debug("Using PhantomJSChecker")
-        checker = PhantomJSChecker(properties, args.phantomjs_bin[0])
+        checker = PhantomJSChecker(properties, args.phantomjs_bin[0], max_pages=args.max_renders[0],
+                                   max_memory=args.max_renderer_memory[0], render_timeout=args.render_timeout[0],
+                                   block=[x for x in args.block_resources[0].split(",") if x], render_budget=args.render_budget[0] or None,
+                                   metrics=metrics)
+        if args.mode[0] == "tiered":
+            logging.debug("Using TieredChecker")
+            policy = EscalationPolicy(min_scripts=args.escalate_scripts[0], max_text=args.escalate_text[0],
+                                      markers=args.escalate_marker or MARKERS, always=args.escalate_all)
+            checker = TieredChecker(properties, checker, policy, max_bytes=args.max_bytes[0] or None,
+                                    content_types=None if args.any_content_type else HTML_TYPES,
+                                    links=args.link_extractor[0], cache_size=args.content_cache[0], http=http,
+                                    pages=pages, metrics=metrics)
     else:
         logging.error("unkonwn mode: %s" % args.mode)
         raise Exception("unkonwn mode: %s" % args.mode)
 
-    manager = Manager(DomainsFile(args.file[0]), properties, args.threads[0], checker, use_robots=args.ignore_robots_txt, depth=args.depth[0])
+    if args.worker[0]:
+        node = Node(address, properties, args.threads[0], checker, args.secret[0],
+                    robots_cache=args.robots_cache[0], robots_ttl=args.robots_ttl[0], metrics=metrics)
+        reporter = MetricsReporter(metrics, None, args.metrics_interval[0], args.metrics_file[0],
+                                   args.metrics_port[0], args.progress)
+        reporter.start()
+        try:
+            node.start()
+        except:
+            logging.debug("Exception on the main thread, bailing...")
+        reporter.stop()
+        if pages:
+            pages.close()
+        node.log_stats()
+        return
+
+    checkpoint = None
+    state = None
+    if args.checkpoint[0]:
+        checkpoint = Checkpoint(args.checkpoint[0], args.checkpoint_interval[0])
+        if args.resume:
+            state = checkpoint.load()
+            if state is None:
+                logging.warning("No checkpoint on %s, starting from the beginning" % args.checkpoint[0])
+    elif args.resume:
+        parser.error("--resume needs --checkpoint")
+
+    if args.output[0] == "-":
+        output = sys.stdout
+    else:
+        output = open(args.output[0], "a" if state else "w")
+    writer = ResultWriter(output, properties, args.format[0])
+
+    controller = None
+    if args.adaptive:
+        controller = AIMDController(minimum=args.min_threads[0], maximum=args.max_window[0] or args.threads[0] * 2 * args.batch_size[0])
+
+    priority = KeywordPriority([x for x in args.priority_keywords[0].split(",") if x])
+
+    if args.coordinator[0]:
+        manager = Coordinator(DomainsFile(args.file[0]), properties, args.threads[0], address, authkey=args.secret[0], lease_ttl=args.lease_ttl[0], use_robots=not args.ignore_robots_txt, depth=args.depth[0], dedup_capacity=args.dedup_capacity[0], max_per_host=args.max_per_host[0], host_delay=args.host_delay[0], robots_cache=args.robots_cache[0], robots_ttl=args.robots_ttl[0], writer=writer, checkpoint=checkpoint, batch_size=args.batch_size[0], max_pages=args.max_pages[0] or None, priority=priority, frontier_memory=args.frontier_memory[0] or None, spill_dir=args.spill_dir[0], resolver=resolver, metrics=metrics)
+    elif args.mode[0] == "async":
+        manager = AsyncManager(DomainsFile(args.file[0]), properties, args.threads[0], checker, use_robots=not args.ignore_robots_txt, depth=args.depth[0], dedup_capacity=args.dedup_capacity[0], max_per_host=args.max_per_host[0], host_delay=args.host_delay[0], robots_cache=args.robots_cache[0], robots_ttl=args.robots_ttl[0], writer=writer, checkpoint=checkpoint, max_pages=args.max_pages[0] or None, priority=priority, frontier_memory=args.frontier_memory[0] or None, spill_dir=args.spill_dir[0], concurrency=args.concurrency[0], metrics=metrics)
+    else:
+        manager = Manager(DomainsFile(args.file[0]), properties, args.threads[0], checker, use_robots=not args.ignore_robots_txt, depth=args.depth[0], dedup_capacity=args.dedup_capacity[0], max_per_host=args.max_per_host[0], host_delay=args.host_delay[0], robots_cache=args.robots_cache[0], robots_ttl=args.robots_ttl[0], writer=writer, checkpoint=checkpoint, batch_size=args.batch_size[0], controller=controller, max_pages=args.max_pages[0] or None, priority=priority, frontier_memory=args.frontier_memory[0] or None, spill_dir=args.spill_dir[0], resolver=resolver, metrics=metrics)
+    if state:
+        manager.restore(state)
+    reporter = MetricsReporter(metrics, manager, args.metrics_interval[0], args.metrics_file[0],
+                               args.metrics_port[0], args.progress)
+    reporter.start()
     try:
         manager.start()
     except:
         logging.debug("Exception on the main thread, bailing...")    
-    logging.debug("Finished, dumping %s result(s)" % len(manager.domains))
+    reporter.stop()
+    if pages:
+        pages.close()
+    manager.log_stats()
     manager.dump()
+    logging.debug("Finished, %s domain(s) written" % writer.written)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
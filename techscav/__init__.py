@@ -1 +1,20 @@
-from structures import *
\ No newline at end of file
+from structures import *
+from matcher import *
+from asyncmanager import *
+from dedup import *
+from scheduler import *
+from robots import *
+from renderer import *
+from output import *
+from links import *
+from concurrency import *
+from escalation import *
+from checkpoint import *
+from body import *
+from frontier import *
+from canonical import *
+from session import *
+from resolver import *
+from pagecache import *
+from distributed import *
+from metrics import *
\ No newline at end of file
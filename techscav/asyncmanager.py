@@ -0,0 +1,342 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: asyncmanager.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import time
+import logging
+from multiprocessing import Pool
+
+from twisted.internet import defer, error, reactor, threads
+from twisted.internet.protocol import Protocol
+from twisted.internet.task import LoopingCall
+from twisted.web.client import Agent, BrowserLikeRedirectAgent, ContentDecoderAgent, GzipDecoder, HTTPConnectionPool, ResponseDone, ResponseFailed
+from twisted.web.error import InfiniteRedirection, RedirectWithNoLocation
+from twisted.web.http import PotentialDataLoss
+from twisted.web.http_headers import Headers
+
+from structures import Manager, Request
+from canonical import url_digest
+
+_manager = None
+
+def _init_parser(manager):
+    """
+    Sets up the manager whose checker is used by a parsing process
+    """
+    global _manager
+    _manager = manager
+
+
+def _parse(message, url, body):
+    """
+    Parses a page inside a parsing process. The request comes packed by
+    Manager.pack_requests. Errors are swallowed since the pool has no way to
+    report them back.
+    """
+    try:
+        request, = _manager.unpack_requests(message)
+        return _manager.checker.parse(request, url, body)
+    except:
+        logging.debug("Some error happened while parsing %s, ignoring" % url)
+        _manager.metrics.error('check')
+        return [], []
+
+
+def _error_type(failure):
+    """
+    Gets which of the metrics ERRORS a fetch failed with
+    """
+    if failure.check(defer.CancelledError, error.TimeoutError):
+        return 'timeout'
+    if failure.check(error.ConnectError, error.ConnectionLost, ResponseFailed):
+        return 'connection'
+    if failure.check(InfiniteRedirection, RedirectWithNoLocation):
+        return 'redirects'
+    return 'other'
+
+
+class _BoundedBody(Protocol):
+    """
+    Reads the body of a response up to max_bytes, then stops the transfer
+    and keeps what was read. Bodies without a length that end when the
+    connection closes are accepted, like requests does.
+
+    Attributes:
+        finished     the Deferred that gets the body
+        max_bytes    how many bytes are read, None for no limit
+        truncated    did more than max_bytes come, and was cut
+    """
+
+    def __init__(self, finished, max_bytes):
+        self.finished = finished
+        self.max_bytes = max_bytes
+        self.truncated = False
+        self._chunks = []
+        self._size = 0
+
+    def dataReceived(self, data):
+        if self.truncated:
+            return
+        if self.max_bytes is not None and self._size + len(data) > self.max_bytes:
+            data = data[:self.max_bytes - self._size]
+            self.truncated = True
+        self._chunks.append(data)
+        self._size += len(data)
+        if self.truncated:
+            self.transport.stopProducing()
+
+    def connectionLost(self, reason):
+        if self.finished.called:
+            return
+        if self.truncated or reason.check(ResponseDone, PotentialDataLoss):
+            self.finished.callback(''.join(self._chunks))
+        else:
+            self.finished.errback(reason)
+
+
+class AsyncManager(Manager):
+    """
+    A manager that fetches pages from a single event loop, keeping lots of
+    requests in flight, and hands the pages to a pool of processes for parsing
+    and matching.
+
+    Attributes:
+        concurrency  how many requests can be in flight at the same time
+        timeout      how many seconds to wait for a page
+        in_flight    the number of requests being made
+        parsing      the number of pages waiting for the parsing processes
+        parses       the pages waiting for the parsing processes, by the
+                     digest of their request, with the AsyncResult of each
+                     and when it is given up on
+        parse_timeout  how many seconds a page may wait for the parsing
+                     processes. A page whose process died never comes back,
+                     so it is done with nothing found once this is over.
+    """
+
+    def __init__(self, domainsFile, properties, smp, checker, useragent="*", use_robots=True, depth=1, dedup_capacity=1000000, max_per_host=2, host_delay=0, robots_cache=None, robots_ttl=86400, writer=None, checkpoint=None, max_pages=None, priority=None, frontier_memory=None, spill_dir=None, concurrency=1000, timeout=10, metrics=None, parse_timeout=60):
+        super(AsyncManager, self).__init__(domainsFile, properties, smp, checker, useragent=useragent, use_robots=use_robots, depth=depth, dedup_capacity=dedup_capacity, max_per_host=max_per_host, host_delay=host_delay, robots_cache=robots_cache, robots_ttl=robots_ttl, writer=writer, checkpoint=checkpoint, max_pages=max_pages, priority=priority, frontier_memory=frontier_memory, spill_dir=spill_dir, metrics=metrics)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.in_flight = 0
+        self.parsing = 0
+        self.parses = {}
+        self.parse_timeout = parse_timeout
+        self._wakeup = None
+
+    def add_new_request(self, request):
+        """
+        Adds a new request to the scheduler
+        """
+        if self.hits.add(request.digest):
+            logging.debug("Addding request to scheduler %s d: %d" % (request.url, request.depth))
+            self.scheduler.push(request)
+        else:
+            logging.debug("Cache hit %s d: %d" % (request.url, request.depth))
+
+    def add_redirect(self, request, url):
+        """
+        Marks the url a request was redirected to as visited
+        """
+        digest = url_digest(url)
+        if digest != request.digest and self.hits.add(digest):
+            logging.debug("Redirected from %s to %s" % (request.url, url))
+
+    def fetch_new_request(self):
+        """
+        Gets a request that can be made now, reading new domains while the
+        scheduler has few hosts to choose from
+        """
+        while len(self.scheduler.hosts) < self.concurrency and not self.domainsFile.finished:
+            domain = self.read_domain()
+            if domain:
+                self.start_domain(domain)
+        return self.scheduler.pop(time.time())
+
+    def pump(self):
+        """
+        Starts as many requests as the concurrency allows, and stops the loop
+        once everything is done. If every host waiting is on its delay, it
+        comes back when the first one is ready.
+        """
+        while self.in_flight < self.concurrency:
+            request = self.fetch_new_request()
+            if not request:
+                break
+            self.fetch(request)
+        self.pending.value = len(self.scheduler) + self.in_flight + self.parsing
+
+        if not self.in_flight and not self.parsing and not len(self.scheduler) and self.domainsFile.finished:
+            logging.debug("Nothing else to do, stopping")
+            self.finish_checkpoint()
+            reactor.stop()
+            return
+        self.save_checkpoint()
+
+        ready = self.scheduler.next_ready()
+        if ready is not None and self.in_flight < self.concurrency:
+            if self._wakeup and self._wakeup.active():
+                self._wakeup.cancel()
+            self._wakeup = reactor.callLater(max(0, ready - time.time()), self.pump)
+
+    def fetch(self, request):
+        """
+        Starts a request to a url
+        """
+        logging.debug("Making request into %s" % request.url)
+        self.in_flight += 1
+        self.active[request.digest] = request
+        url = request.url
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        started = time.time()
+        d = defer.maybeDeferred(self.agent.request, 'GET', url, Headers({}))
+        d.addCallback(self.read, request)
+        d.addCallback(self.downloaded, started)
+        timeout = reactor.callLater(self.timeout, d.cancel)
+
+        def finished(result):
+            if timeout.active():
+                timeout.cancel()
+            return result
+
+        d.addBoth(finished)
+        d.addCallbacks(self.fetched, self.failed, callbackArgs=(request,), errbackArgs=(request,))
+
+    def read(self, response, request):
+        """
+        Reads the body of a response, up to the max_bytes of the checker
+        """
+        d = defer.Deferred()
+        body = _BoundedBody(d, self.checker.max_bytes)
+        response.deliverBody(body)
+
+        def done(data):
+            if body.truncated:
+                with self.checker.truncated.get_lock():
+                    self.checker.truncated.value += 1
+            return response.request.absoluteURI, data
+
+        d.addCallback(done)
+        return d
+
+    def downloaded(self, page, started):
+        """
+        Counts how long a page took and how big it was
+        """
+        self.metrics.observe('download', time.time() - started)
+        self.metrics.count('bytes', len(page[1]))
+        return page
+
+    def fetched(self, page, request):
+        """
+        Sends a page to the parsing processes
+        """
+        url, body = page
+        self.in_flight -= 1
+        if url != request.url:
+            self.add_redirect(request, url)
+        self.parsing += 1
+        result = self.pool.apply_async(_parse, (self.pack_requests([request]), url, body),
+                                       callback=lambda page: reactor.callFromThread(self.parsed, request, page))
+        self.parses[request.digest] = (result, time.time() + self.parse_timeout)
+        self.pump()
+
+    def failed(self, failure, request):
+        """
+        Gives up on a request
+        """
+        logging.debug("Some error happened on %s, ignoring: %s" % (request.url, failure.getErrorMessage()))
+        self.metrics.error(_error_type(failure))
+        self.metrics.count('pages')
+        self.in_flight -= 1
+        self.active.pop(request.digest, None)
+        self.page_done(request.domain, [])
+        self.pump()
+
+    def watch(self):
+        """
+        Gives up on the pages the parsing processes failed on, or took too
+        long with, so a process that died does not keep the loop running
+        """
+        now = time.time()
+        for digest, (result, deadline) in self.parses.items():
+            if result.ready() and result.successful():
+                continue
+            if result.ready() or now > deadline:
+                request = self.active[digest]
+                logging.warning("Parsing %s failed or took too long, giving up on it" % request.url)
+                self.metrics.error('check')
+                del self.parses[digest]
+                self.queue_links([], request, [])
+
+    def parsed(self, request, page):
+        """
+        Saves the properties found on a page and queues its links, unless it
+        was given up on meanwhile
+        """
+        if self.parses.pop(request.digest, None) is None:
+            return
+        result, links = page
+        if links and request.domain.use_robots:
+            d = threads.deferToThread(self.allowed_links, request, links)
+            d.addErrback(lambda failure: [])
+            d.addCallback(self.queue_links, request, result)
+        else:
+            self.queue_links(links, request, result)
+
+    def allowed_links(self, request, links):
+        """
+        Checks the links against robots.txt, outside of the loop thread since
+        that may need to fetch it
+        """
+        return filter(lambda link: request.domain.can_i_visit(link, self.robots), links)
+
+    def queue_links(self, links, request, result):
+        """
+        Queues the links that can be visited, and frees the slot of the host
+        """
+        for link in links:
+            self.add_new_request(Request(link, request.domain, request.depth - 1))
+        self.metrics.count('pages')
+        self.active.pop(request.digest, None)
+        self.page_done(request.domain, result)
+        self.parsing -= 1
+        self.pump()
+
+    def start(self):
+        """
+        The main loop
+        """
+        self.pool = Pool(self.smp, _init_parser, (self,))
+        self.prefetch_restored()
+        connections = HTTPConnectionPool(reactor)
+        connections.maxPersistentPerHost = 2
+        self.agent = ContentDecoderAgent(
+            BrowserLikeRedirectAgent(Agent(reactor, connectTimeout=self.timeout, pool=connections)),
+            [('gzip', GzipDecoder)])
+
+        logging.debug("Fetching up to %s pages at once, parsing with %s processes" % (self.concurrency, self.smp))
+        reactor.callWhenRunning(self.pump)
+        watchdog = LoopingCall(self.watch)
+        watchdog.start(1, now=False)
+        try:
+            reactor.run(installSignalHandlers=False)
+        except:
+            self.save_checkpoint(True)
+            raise
+        finally:
+            if watchdog.running:
+                watchdog.stop()
+            self.pool.terminate()
+            self.pool.join()
+            self.scheduler.cleanup()
+            if self.robots:
+                self.robots.close()
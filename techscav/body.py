@@ -0,0 +1,177 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: body.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import codecs
+import string
+import hashlib
+from collections import OrderedDict
+from multiprocessing import Value
+
+ASCII = string.ascii_letters + string.digits + "./:-_?=&#%<>\"' "
+
+# encodings that write other characters with ASCII bytes between shifts
+SHIFTED = ('utf_7', 'hz', 'iso2022')
+
+_compatible = {}
+
+
+def codec_name(encoding):
+    """
+    Gets the name of the codec a page is decoded with, UTF-8 if its
+    encoding is not given or not known
+    """
+    try:
+        return codecs.lookup(encoding or 'utf-8').name
+    except LookupError:
+        return 'utf-8'
+
+
+def ascii_compatible(encoding):
+    """
+    Can ASCII text be found in the bytes of an encoding without decoding
+    them: ASCII characters are written as themselves, and the bytes of the
+    characters that delimit a domain or a tag are never part of another
+    character. True for UTF-8, the ISO-8859 and Windows code pages and the
+    CJK multibyte encodings; False for UTF-16, UTF-32, EBCDIC and the
+    encodings that shift in and out of ASCII.
+    """
+    name = codec_name(encoding)
+    if name not in _compatible:
+        try:
+            same = ASCII.decode(name) == ASCII.decode('ascii')
+        except (UnicodeError, LookupError):
+            same = False
+        _compatible[name] = same and not name.replace('-', '_').startswith(SHIFTED)
+    return _compatible[name]
+
+
+def decode(raw, encoding):
+    """
+    Decodes the bytes of a page the way requests does, replacing what can
+    not be decoded
+    """
+    return raw.decode(codec_name(encoding), 'replace')
+
+
+def fingerprint(data):
+    """
+    Gets the MD5 of the content of a page, text is taken as UTF-8
+    """
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return hashlib.md5(data).digest()
+
+
+class Body(object):
+    """
+    The body of a page as it was read, decoded only when its text is needed.
+
+    Attributes:
+        raw        the bytes read
+        encoding   the name of the codec the page is decoded with
+        ascii      can ASCII text be found in raw without decoding it
+        fingerprint  the MD5 of raw, the key of the body on a ContentCache
+    """
+
+    def __init__(self, raw, encoding=None):
+        self.raw = raw
+        self.encoding = codec_name(encoding)
+        self.ascii = ascii_compatible(self.encoding)
+        self._text = None
+        self._fingerprint = None
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def text(self):
+        """
+        The decoded text of the page
+        """
+        if self._text is None:
+            self._text = decode(self.raw, self.encoding)
+        return self._text
+
+    @property
+    def fingerprint(self):
+        """
+        The MD5 of the bytes read
+        """
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.raw)
+        return self._fingerprint
+
+    def markup(self):
+        """
+        Gets what a parser should read and its encoding: the bytes as they
+        are when their ASCII can be read, the text otherwise
+        """
+        if self.ascii:
+            return self.raw, self.encoding
+        return self.text, None
+
+
+class ContentCache(object):
+    """
+    What was found on the bodies already analysed, by their fingerprint, so a
+    body seen again, the same page under another url or on a mirror, is not
+    parsed again. Each entry keeps a value by name, such as the properties
+    matched or the links extracted. The least recently used bodies are
+    dropped. Each process has its own entries.
+
+    Attributes:
+        size       how many bodies are kept, 0 to keep none
+        entries    the values of each body by name, by fingerprint
+        hits       how many values were found, shared among processes
+        misses     how many values were not, shared among processes
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = Value('l', 0)
+        self.misses = Value('l', 0)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _count(self, value):
+        with value.get_lock():
+            value.value += 1
+
+    def get(self, key, name):
+        """
+        Gets a value kept for a body, None if there is none
+        """
+        if not self.size:
+            return None
+        entry = self.entries.pop(key, None)
+        if entry is None or name not in entry:
+            self._count(self.misses)
+        else:
+            self._count(self.hits)
+        if entry is not None:
+            self.entries[key] = entry
+            return entry.get(name)
+
+    def put(self, key, name, value):
+        """
+        Keeps a value for a body, dropping the oldest body if there are too
+        many
+        """
+        if not self.size:
+            return
+        entry = self.entries.pop(key, None) or {}
+        entry[name] = value
+        self.entries[key] = entry
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
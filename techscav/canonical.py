@@ -0,0 +1,55 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: canonical.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import re
+import hashlib
+import urlparse
+
+TRACKING = ["utm_*", "gclid", "dclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl", "igshid"]
+
+_tracking = re.compile("^(?:%s)$" % "|".join(re.escape(x).replace("\\*", ".*") for x in TRACKING), re.I)
+_ports = {'http': 80, 'https': 443}
+
+
+def canonical(url):
+    """
+    Gets the form of a url that tells whether two urls are the same page:
+    without the scheme, the "www." of the host, the default port, the
+    fragment, trailing slashes and tracking parameters, and with the rest of
+    the query sorted. "https://www.Foo.com/a/?utm_source=x&b=1#top" and
+    "http://foo.com/a?b=1" are both "foo.com/a?b=1".
+    """
+    if isinstance(url, unicode):
+        url = url.encode('utf-8')
+    parts = urlparse.urlsplit(url.strip())
+    host = parts.hostname or ''
+    if host.startswith('www.'):
+        host = host[4:]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != _ports.get(parts.scheme.lower()):
+        host = "%s:%d" % (host, port)
+    query = sorted(x for x in parts.query.split('&') if x and not _tracking.match(x.split('=', 1)[0]))
+    url = host + parts.path.rstrip('/')
+    if query:
+        url += '?' + '&'.join(query)
+    return url
+
+
+def url_digest(url):
+    """
+    Gets the digest the dedup filter knows a url by, the MD5 of its
+    canonical form
+    """
+    return hashlib.md5(canonical(url)).digest()
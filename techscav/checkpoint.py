@@ -0,0 +1,154 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: checkpoint.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import struct
+import logging
+import cPickle
+import binascii
+
+
+class Checkpoint(object):
+    """
+    The state of a crawl, saved to a file every few seconds so a crawl that
+    was stopped can resume from its last save. The whole state is saved
+    once, and the saves after it only append what changed to a journal next
+    to it, until the journal grows past the state and the whole of it is
+    saved again. The state is replaced in a single rename, so a crash while
+    saving leaves the previous one intact, and an entry of the journal that
+    was cut short by a crash is ignored.
+
+    Attributes:
+        path        the file where the state is saved
+        journal     the file where the changes since are appended
+        interval    how many seconds between saves
+        last        when was it last saved
+        saved       how many times it was saved
+        generation  a random name of the state saved last, the entries of
+                    the journal carry it so those left from another state
+                    are ignored, None until a state is saved
+        size        how many bytes the state saved last has
+        appended    how many bytes were appended to the journal since
+    """
+
+    VERSION = 3
+
+    _header = struct.Struct('<I')
+
+    def __init__(self, path, interval=60):
+        self.path = path
+        self.journal = path + ".journal"
+        self.interval = interval
+        self.last = time.time()
+        self.saved = 0
+        self.generation = None
+        self.size = 0
+        self.appended = 0
+
+    def due(self):
+        """
+        Is it time for another save
+        """
+        return time.time() - self.last >= self.interval
+
+    def whole(self):
+        """
+        Should the next save be the whole state, since there is none yet or
+        the journal grew past it
+        """
+        return self.generation is None or self.appended > self.size
+
+    def save(self, state):
+        """
+        Saves the whole state, a dict made by Manager.snapshot, and starts a
+        new journal
+        """
+        started = time.time()
+        generation = binascii.hexlify(os.urandom(8))
+        state = dict(state, version=self.VERSION, generation=generation)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+            self.size = f.tell()
+        os.rename(tmp, self.path)
+        if os.path.exists(self.journal):
+            os.remove(self.journal)
+        self.generation = generation
+        self.appended = 0
+        self.last = time.time()
+        self.saved += 1
+        logging.debug("Checkpoint with %d request(s) saved in %.3fs" %
+                      (len(state.get('frontier', [])), self.last - started))
+
+    def append(self, changes):
+        """
+        Appends the changes since the last save, a dict made by
+        Manager.changes, to the journal
+        """
+        started = time.time()
+        data = cPickle.dumps((self.generation, changes), cPickle.HIGHEST_PROTOCOL)
+        with open(self.journal, "ab") as f:
+            f.write(self._header.pack(len(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.appended += self._header.size + len(data)
+        self.last = time.time()
+        self.saved += 1
+        logging.debug("Checkpoint changes of %d byte(s) appended in %.3fs" %
+                      (len(data), self.last - started))
+
+    def read_journal(self, generation):
+        """
+        Gets the changes appended to the journal of a state, up to the first
+        one cut short
+        """
+        changes = []
+        if not os.path.exists(self.journal):
+            return changes
+        with open(self.journal, "rb") as f:
+            while True:
+                header = f.read(self._header.size)
+                if len(header) < self._header.size:
+                    break
+                size, = self._header.unpack(header)
+                data = f.read(size)
+                if len(data) < size:
+                    break
+                saved_on, value = cPickle.loads(data)
+                if saved_on == generation:
+                    changes.append(value)
+        return changes
+
+    def load(self):
+        """
+        Gets the last state saved, None if there is none, with the changes
+        appended since under 'journal'
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            state = cPickle.load(f)
+        if state.get('version') != self.VERSION:
+            raise ValueError("unknown checkpoint version: %s" % state.get('version'))
+        state['journal'] = self.read_journal(state['generation'])
+        return state
+
+    def clear(self):
+        """
+        Removes the saved state, once the crawl is over
+        """
+        for path in (self.path, self.path + ".tmp", self.journal):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,154 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: concurrency.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import logging
+from collections import deque
+
+
+def cpu_seconds(pids):
+    """
+    Gets the CPU time in seconds used so far by a few processes, 0 for the
+    ones that can not be read
+    """
+    ticks = float(os.sysconf('SC_CLK_TCK'))
+    total = 0.0
+    for pid in pids:
+        try:
+            with open('/proc/%d/stat' % pid) as f:
+                stat = f.read()
+        except (IOError, TypeError):
+            continue
+        fields = stat[stat.rindex(')') + 2:].split()
+        total += (int(fields[11]) + int(fields[12])) / ticks
+    return total
+
+
+class AIMDController(object):
+    """
+    Decides how many requests can be in flight, the way TCP decides its
+    window. Every interval it looks at the requests that finished: if the
+    CPU is nearly saturated or requests took much longer than the best
+    latency seen, the limit is cut by a factor; otherwise, if every slot was
+    busy, one more slot is added.
+
+    Latency grows when requests wait for a busy worker or a slow network, so
+    it is the main sign of having gone too far. Only the best latency of the
+    last few intervals counts, so that hosts getting slower over the crawl
+    are not taken for congestion forever.
+
+    Attributes:
+        minimum         the lowest limit
+        maximum         the highest limit
+        limit           how many requests can be in flight now
+        increase        how many slots are added at a time
+        decrease        the factor the limit is multiplied by when cut
+        interval        how many seconds between decisions
+        latency_factor  how many times the best latency is taken as
+                        congestion
+        max_cpu         the CPU use, from 0 to 1, taken as congestion
+        window          how many intervals the best latency is kept for
+        in_flight       how many requests are in flight
+        baseline        the best latency of the last window
+        throughput      the requests per second of the last interval
+        latency         the mean latency of the last interval
+        decisions       how many times the limit changed
+    """
+
+    def __init__(self, minimum=1, maximum=64, start=None, increase=1, decrease=0.5, interval=5, latency_factor=1.5, max_cpu=0.9, window=60):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(maximum, start or minimum))
+        self.increase = increase
+        self.decrease = decrease
+        self.interval = interval
+        self.latency_factor = latency_factor
+        self.max_cpu = max_cpu
+        self.window = window
+        self.in_flight = 0
+        self.baseline = None
+        self.throughput = 0.0
+        self.latency = None
+        self.decisions = 0
+        self._started = {}
+        self._done = 0
+        self._total_latency = 0.0
+        self._peak = 0
+        self._last = None
+        self._latencies = deque(maxlen=window)
+
+    def start(self, key, now=None):
+        """
+        Records a request being sent
+        """
+        self._started[key] = time.time() if now is None else now
+        self.in_flight += 1
+        self._peak = max(self._peak, self.in_flight)
+
+    def done(self, key, now=None):
+        """
+        Records a request being finished
+        """
+        started = self._started.pop(key, None)
+        if started is None:
+            return
+        self.in_flight -= 1
+        self._done += 1
+        self._total_latency += (time.time() if now is None else now) - started
+
+    def due(self, now=None):
+        """
+        Is it time for another decision
+        """
+        now = time.time() if now is None else now
+        if self._last is None:
+            self._last = now
+        return now - self._last >= self.interval
+
+    def update(self, now=None, cpu=None):
+        """
+        Changes the limit according to what happened since the last update,
+        cpu is the CPU use from 0 to 1, None if it is not known. Returns the
+        limit.
+        """
+        now = time.time() if now is None else now
+        if not self.due(now):
+            return self.limit
+        elapsed = now - self._last
+        self.throughput = self._done / elapsed
+        self.latency = self._total_latency / self._done if self._done else None
+        if self.latency is not None:
+            self._latencies.append(self.latency)
+            self.baseline = min(self._latencies)
+
+        limit = self.limit
+        if cpu is not None and cpu > self.max_cpu:
+            limit = int(self.limit * self.decrease)
+            reason = "CPU at %d%%" % (cpu * 100)
+        elif self.latency is not None and self.latency > self.baseline * self.latency_factor:
+            limit = int(self.limit * self.decrease)
+            reason = "latency of %.3fs against %.3fs at best" % (self.latency, self.baseline)
+        elif self._peak >= self.limit:
+            limit = self.limit + self.increase
+            reason = "every slot busy at %.1f requests/s" % self.throughput
+        limit = max(self.minimum, min(self.maximum, limit))
+        if limit != self.limit:
+            logging.info("Concurrency %d -> %d, %s" % (self.limit, limit, reason))
+            self.limit = limit
+            self.decisions += 1
+
+        self._done = 0
+        self._total_latency = 0.0
+        self._peak = self.in_flight
+        self._last = now
+        return self.limit
@@ -0,0 +1,112 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: dedup.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import math
+import ctypes
+import struct
+from multiprocessing import Lock, RawArray
+
+
+class SharedBloomFilter(object):
+    """
+    A Bloom filter of digests living in shared memory, so every process forked
+    after it was created sees what the others have added.
+
+    The bits are split into stripes, each with its own lock. A digest only
+    touches the bits of a single stripe, so checking and adding it is atomic
+    without serializing the processes on one lock.
+
+    Attributes:
+        capacity     how many digests it was sized for
+        error_rate   the false positive rate expected at full capacity
+        stripes      the number of independent stripes
+        hashes       the number of bits set per digest
+        stripe_bits  the number of bits on each stripe
+        memory       the number of bytes used by the bits
+        journal      the digests this process added since it was last
+                     emptied, so a checkpoint can save just those, None to
+                     keep none
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001, stripes=64):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.stripes = stripes
+        bits = -capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.stripe_bits = int(math.ceil(bits / stripes / 8)) * 8
+        self.hashes = max(1, int(round(math.log(2) * self.stripe_bits * stripes / capacity)))
+        self.memory = self.stripe_bits * stripes / 8
+        self._bits = RawArray('B', self.memory)
+        self._counts = RawArray('L', stripes)
+        self._locks = [Lock() for i in xrange(stripes)]
+        self.journal = None
+
+    def _positions(self, digest):
+        """
+        Gets the stripe and the bits of a digest
+        """
+        a, b, c, d = struct.unpack('<IIII', digest[:16])
+        stripe = a % self.stripes
+        base = stripe * self.stripe_bits
+        step = c | 1
+        return stripe, [base + (b + i * step) % self.stripe_bits for i in xrange(self.hashes)]
+
+    def __contains__(self, digest):
+        stripe, positions = self._positions(digest)
+        with self._locks[stripe]:
+            return all(self._bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, digest):
+        """
+        Adds a digest, returns False if it was (probably) already there
+        """
+        stripe, positions = self._positions(digest)
+        new = False
+        with self._locks[stripe]:
+            for p in positions:
+                mask = 1 << (p & 7)
+                byte = self._bits[p >> 3]
+                if not byte & mask:
+                    self._bits[p >> 3] = byte | mask
+                    new = True
+            if new:
+                self._counts[stripe] += 1
+        if new and self.journal is not None:
+            self.journal.append(digest)
+        return new
+
+    def __len__(self):
+        return sum(self._counts)
+
+    def dump(self):
+        """
+        Gets the bits and counts as a string, to be saved on a checkpoint.
+        Only consistent if nothing is being added meanwhile.
+        """
+        return buffer(self._bits)[:] + buffer(self._counts)[:]
+
+    def load(self, data):
+        """
+        Restores the bits and counts saved by dump
+        """
+        size = ctypes.sizeof(self._counts)
+        if len(data) != self.memory + size:
+            raise ValueError("the filter was saved with another capacity")
+        ctypes.memmove(self._bits, data[:self.memory], self.memory)
+        ctypes.memmove(self._counts, data[self.memory:], size)
+
+    def false_positive_rate(self):
+        """
+        Estimates the chance of a new digest being taken as already seen
+        """
+        per_stripe = float(len(self)) / self.stripes
+        return (1 - math.exp(-self.hashes * per_stripe / self.stripe_bits)) ** self.hashes
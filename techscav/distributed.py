@@ -0,0 +1,522 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: distributed.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import socket
+import logging
+import threading
+import itertools
+from Queue import Empty
+from SocketServer import BaseRequestHandler, ThreadingMixIn, TCPServer
+from multiprocessing import AuthenticationError, Process, Value
+from multiprocessing.connection import Client, answer_challenge, deliver_challenge
+from _multiprocessing import Connection
+
+from structures import Manager, unpack_requests
+from robots import RobotsCache
+from canonical import url_digest
+from pagecache import properties_signature
+from metrics import Metrics
+
+
+def parse_address(text):
+    """
+    Gets the host and port of an address given as host:port, the host can be
+    left out for localhost
+    """
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError("not a host:port address: %s" % text)
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+
+def is_loopback(host):
+    """
+    Is a host only reachable from this machine
+    """
+    return host in ('localhost', '::1') or host.startswith('127.')
+
+
+class Lease(object):
+    """
+    A batch of requests handed to a worker, which is taken back if the worker
+    goes away or sends nothing for too long
+
+    Attributes:
+        id           the number the lease is known by
+        worker       the number of the connection that holds it
+        expires      when it is taken back, put off by every page sent
+        digests      the digests of the requests not done yet
+    """
+
+    __slots__ = ('id', 'worker', 'expires', 'digests')
+
+    def __init__(self, id, worker, expires, digests):
+        self.id = id
+        self.worker = worker
+        self.expires = expires
+        self.digests = digests
+
+
+class _ThreadingServer(ThreadingMixIn, TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _WorkerHandler(BaseRequestHandler):
+    """
+    Hands a connection from a worker to its coordinator
+    """
+
+    def handle(self):
+        conn = Connection(os.dup(self.request.fileno()))
+        try:
+            self.server.coordinator.serve(conn, self.client_address)
+        finally:
+            conn.close()
+
+
+class Coordinator(Manager):
+    """
+    A manager whose workers are processes on other machines. It owns the
+    domains file, the scheduler, the filter of visited urls and the results,
+    like a Manager does, and hands the requests out in leases of batch_size
+    requests to the workers that connect to it over TCP.
+
+    Messages are pickled tuples on multiprocessing connections, and reading
+    a pickle can run any code it asks for, so listening anywhere but on
+    localhost needs an authkey the workers prove they have. A worker
+    asks for a lease and gets it, or how long to wait for one, or that the
+    crawl is over. Then it sends each page as it is done, along with what was
+    found on it, the links found and where it was redirected to. Properties
+    go by name, since their keys are different on every process that read
+    them, and a worker searching for other properties is turned away.
+
+    The requests leased and not done are bounded by a window of batch_size
+    requests twice over for every worker process connected, so each machine
+    that joins adds to what is crawled at once, whatever smp is.
+
+    A lease is taken back when its worker disconnects, or sends nothing for
+    lease_ttl seconds, and its requests go back to the scheduler. Pages that
+    come in after their lease was taken back are dropped.
+
+    Attributes:
+        address      the host and port it listens on
+        authkey      the key the workers need to connect, None to let any
+                     worker in, only when listening on localhost
+        lease_ttl    how many seconds a lease lasts without a page coming in
+        linger       how many seconds the workers have to disconnect once
+                     the crawl is over
+        leases       the leases being worked on, by id
+        connections  how many workers are connected
+        processes    how many of them said they are worker processes
+        expired      how many leases were taken back
+        late         how many pages came in after their lease was taken back
+        finished     is the crawl over
+        lock         held by whoever touches the state of the crawl
+    """
+
+    def __init__(self, domainsFile, properties, smp, address, authkey=None, lease_ttl=60, linger=5, **kwargs):
+        if authkey is None and not is_loopback(address[0]):
+            raise ValueError("listening on %s needs a key, anyone reaching the port could run code here" % (address[0] or "every interface"))
+        super(Coordinator, self).__init__(domainsFile, properties, smp, None, **kwargs)
+        self.address = address
+        self.authkey = authkey
+        self.lease_ttl = lease_ttl
+        self.linger = linger
+        self.leases = {}
+        self.connections = 0
+        self.processes = 0
+        self.expired = 0
+        self.late = 0
+        self.finished = False
+        self.lock = threading.RLock()
+        self._lease_ids = itertools.count(1)
+        self._worker_ids = itertools.count(1)
+        self._keys = dict((p.name, key) for key, p in properties.items())
+        self._server = None
+
+    def setup(self):
+        """
+        Gets what a worker needs to know to crawl like the coordinator would
+        """
+        return {
+            'signature': properties_signature(self.properties),
+            'useragent': self.useragent,
+            'use_robots': self.use_robots,
+            'depth': self.depth,
+        }
+
+    def serve(self, conn, client):
+        """
+        Answers the messages of a worker until it disconnects, on a thread of
+        its own
+        """
+        if self.authkey is not None:
+            try:
+                deliver_challenge(conn, self.authkey)
+                answer_challenge(conn, self.authkey)
+            except (AuthenticationError, EOFError, IOError):
+                logging.warning("Turned away %s:%d, it does not have the key" % tuple(client[:2]))
+                return
+        with self.lock:
+            worker = next(self._worker_ids)
+            self.connections += 1
+        logging.debug("Worker %d connected from %s:%d" % ((worker,) + tuple(client[:2])))
+        processes = 0
+        try:
+            while True:
+                kind, value = conn.recv()
+                if kind == 'hello':
+                    with self.lock:
+                        self.processes += value[1] - processes
+                        processes = value[1]
+                    conn.send(('setup', self.setup()))
+                elif kind == 'lease':
+                    conn.send(self.lease(worker))
+                elif kind == 'page':
+                    self.received(value)
+        except (EOFError, IOError):
+            pass
+        finally:
+            with self.lock:
+                self.connections -= 1
+                self.processes -= processes
+                self.release(worker)
+            logging.debug("Worker %d disconnected" % worker)
+
+    def lease(self, worker):
+        """
+        Gets the answer to a worker asking for requests: a lease, how long to
+        wait before asking again, or that the crawl is over
+        """
+        with self.lock:
+            if self.finished:
+                return ('stop', None)
+            now = time.time()
+            batch = []
+            while len(batch) < self.batch_size and self.dispatched + len(batch) < self.window():
+                r = self.scheduler.pop(now)
+                if r is None:
+                    break
+                batch.append(r)
+            if not batch:
+                ready = self.scheduler.next_ready()
+                return ('wait', 0.5 if ready is None else min(0.5, max(0.01, ready - now)))
+            lease = Lease(next(self._lease_ids), worker, now + self.lease_ttl, set())
+            for r in batch:
+                self.active[r.digest] = r
+                lease.digests.add(r.digest)
+            self.leases[lease.id] = lease
+            self.dispatched += len(batch)
+            return ('lease', (lease.id, self.pack_requests(batch)))
+
+    def window(self):
+        """
+        How many requests can be leased and not done, enough for every worker
+        process connected
+        """
+        return self.processes * 2 * self.batch_size
+
+    def received(self, value):
+        """
+        Handles a page sent by a worker, unless its lease was taken back
+        """
+        lease_id, id, digest, names, children, redirects = value
+        with self.lock:
+            lease = self.leases.get(lease_id)
+            if lease is None or digest not in lease.digests:
+                self.late += 1
+                return
+            lease.digests.discard(digest)
+            if lease.digests:
+                lease.expires = time.time() + self.lease_ttl
+            else:
+                del self.leases[lease_id]
+            result = [self._keys[x] for x in names if x in self._keys]
+            self.handle(('page', (id, digest, result, children, redirects)))
+
+    def take_back(self, lease):
+        """
+        Puts the requests of a lease that will not be done back on the
+        scheduler
+        """
+        del self.leases[lease.id]
+        self.expired += 1
+        for digest in lease.digests:
+            r = self.active.pop(digest)
+            self.dispatched -= 1
+            if not self.scheduler.retry(r):
+                self.page_done(r.domain, [])
+
+    def release(self, worker):
+        """
+        Takes back the leases of a worker that disconnected
+        """
+        for lease in [x for x in self.leases.values() if x.worker == worker]:
+            logging.warning("Worker %d went away, %d request(s) of lease %d go back to the frontier" %
+                            (worker, len(lease.digests), lease.id))
+            self.take_back(lease)
+
+    def expire(self, now):
+        """
+        Takes back the leases that got no page for too long
+        """
+        for lease in [x for x in self.leases.values() if x.expires < now]:
+            logging.warning("Lease %d of worker %d expired, %d request(s) go back to the frontier" %
+                            (lease.id, lease.worker, len(lease.digests)))
+            self.take_back(lease)
+
+    def wait(self):
+        """
+        Waits for the resolver, which is the only one sending messages to the
+        main loop, the workers are answered by their own threads
+        """
+        try:
+            event = self.events.get(True, 0.1)
+            with self.lock:
+                self.handle(event)
+                while True:
+                    self.handle(self.events.get_nowait())
+        except Empty:
+            pass
+
+    def step(self):
+        """
+        Reads more domains, takes back the leases that expired and checks
+        whether the crawl is over
+        """
+        with self.lock:
+            self.fetch_domains()
+            self.expire(time.time())
+            self.pending.value = len(self.scheduler) + self.dispatched
+            if self.domainsFile.finished and not self.pending.value and not self.resolving:
+                self.finished = True
+                self.finish_checkpoint()
+            else:
+                self.save_checkpoint()
+            return self.finished
+
+    def start(self):
+        """
+        The main loop. It listens for workers and stops once the domains file
+        is over and nothing is pending, giving the workers connected a moment
+        to be told so.
+        """
+        self._server = _ThreadingServer(self.address, _WorkerHandler)
+        self._server.coordinator = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logging.debug("Waiting for workers on %s:%d" % self.address)
+        self.prefetch_restored()
+
+        try:
+            while not self.step():
+                self.wait()
+        except:
+            with self.lock:
+                self.save_checkpoint(True)
+            self.stop()
+            raise
+
+        logging.debug("Finished, waiting for the workers to disconnect")
+        deadline = time.time() + self.linger
+        while self.connections and time.time() < deadline:
+            time.sleep(0.05)
+        self.stop()
+        if self.robots:
+            self.robots.close()
+
+    def stop(self):
+        """
+        Stops listening and cleans up
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self.scheduler.cleanup()
+        if self.resolver:
+            self.resolver.close()
+
+    def log_stats(self):
+        """
+        Logs how the leases went, along with what a Manager logs
+        """
+        logging.info("%d lease(s) taken back, %d page(s) came in after their lease was" % (self.expired, self.late))
+        super(Coordinator, self).log_stats()
+
+
+def lease_work(process, node):
+    """
+    A worker process of a node. It leases requests from the coordinator and
+    makes them, sending each page back as it is done, until the coordinator
+    tells it the crawl is over
+    """
+    conn = node.connect()
+    try:
+        while True:
+            conn.send(('lease', None))
+            kind, value = conn.recv()
+            if kind == 'stop':
+                logging.debug("Nothing else to do, %s dying" % process)
+                break
+            if kind == 'wait':
+                time.sleep(value)
+                continue
+            lease_id, message = value
+            node.count(node.leases)
+            for req in node.unpack_requests(message):
+                res = []
+                try:
+                    res = node.checker.check(req, node)
+                except:
+                    logging.debug("Some error happened on %s, ignoring" % req.url)
+                    node.metrics.error('check')
+                finally:
+                    node.metrics.count('pages')
+                    node.task_done(conn, lease_id, req, res)
+    except (EOFError, IOError):
+        logging.error("Lost the coordinator, %s dying" % process)
+    finally:
+        node.checker.close()
+        conn.close()
+
+
+class Node(object):
+    """
+    A machine taking part on a crawl run by a Coordinator: smp processes, each
+    one connected to the coordinator, making the requests it leases them.
+    Links and redirects are sent back with each page for the coordinator to
+    filter, since only it knows what was visited. The user agent, depth and
+    whether robots.txt is followed come from the coordinator.
+
+    Attributes:
+        address      the host and port of the coordinator
+        properties   the properties searched for, the same the coordinator has
+        smp          number of processes to be spawn
+        checker      an instance of a type of checking algorithm
+        authkey      the key the coordinator asks for, None if it asks for none
+        robots_cache the sqlite file where robots.txt files are kept, None
+                     for a temporary file
+        robots_ttl   how many seconds a cached robots.txt file is valid for
+        robots       the RobotsCache shared among the processes, None if
+                     robots.txt is not used
+        registry     the domains of the requests leased, by id
+        pages        how many pages were sent back, shared among processes
+        leases       how many leases were worked on, shared among processes
+        metrics      the Metrics the processes add to, the checker should be
+                     given the same
+    """
+
+    def __init__(self, address, properties, smp, checker, authkey=None, robots_cache=None, robots_ttl=86400, metrics=None):
+        self.address = address
+        self.properties = properties
+        self.smp = smp
+        self.checker = checker
+        self.authkey = authkey
+        self.robots_cache = robots_cache
+        self.robots_ttl = robots_ttl
+        self.robots = None
+        self.useragent = "*"
+        self.use_robots = True
+        self.depth = 1
+        self.registry = {}
+        self.pages = Value('l', 0)
+        self.leases = Value('l', 0)
+        self.metrics = metrics or Metrics()
+        self._children = []
+        self._redirects = []
+
+    def connect(self, processes=1):
+        """
+        Connects to the coordinator, which may take up to 20 seconds to start
+        listening, and gets the settings of the crawl. The coordinator leases
+        more requests at once for each worker process connected, and none for
+        a connection that is only a check.
+        """
+        conn = Client(self.address, authkey=self.authkey)
+        conn.send(('hello', (socket.gethostname(), processes)))
+        kind, setup = conn.recv()
+        if setup['signature'] != properties_signature(self.properties):
+            conn.close()
+            raise ValueError("the coordinator searches for other properties")
+        self.useragent = setup['useragent']
+        self.use_robots = setup['use_robots']
+        self.depth = setup['depth']
+        return conn
+
+    def count(self, value):
+        with value.get_lock():
+            value.value += 1
+
+    def add_new_request(self, request):
+        """
+        Keeps a new request found on a page, to be sent along with it
+        """
+        logging.debug("Addding request to queue %s d: %d" % (request.url, request.depth))
+        self._children.append(request.pack())
+
+    def add_redirect(self, request, url):
+        """
+        Keeps the url a request was redirected to, to be sent along with it
+        """
+        digest = url_digest(url)
+        if digest != request.digest:
+            logging.debug("Redirected from %s to %s" % (request.url, url))
+            self._redirects.append(digest)
+
+    def unpack_requests(self, message):
+        """
+        Unpacks the requests of a lease, reusing the domains this process
+        already knows
+        """
+        return unpack_requests(message, self.registry, useragent=self.useragent, use_robots=self.use_robots, depth=self.depth)
+
+    def task_done(self, conn, lease_id, request, result):
+        """
+        Sends a page back to the coordinator, with the names of the properties
+        found on it, the requests found on it and where it was redirected to
+        """
+        children, self._children = self._children, []
+        redirects, self._redirects = self._redirects, []
+        names = [self.properties[x].name for x in result]
+        conn.send(('page', (lease_id, request.domain.id, request.digest, names, children, redirects)))
+        self.count(self.pages)
+
+    def start(self):
+        """
+        Checks the coordinator can be worked for, then spawns the processes
+        and waits for the crawl to be over
+        """
+        self.connect(0).close()
+        if self.use_robots:
+            self.robots = RobotsCache(self.robots_cache, self.robots_ttl)
+        self.workers = [Process(target=lease_work, args=(i, self)) for i in xrange(self.smp)]
+        logging.debug("Spawing %s daemons working for %s:%d" % ((len(self.workers),) + tuple(self.address)))
+        for w in self.workers:
+            w.daemon = True
+            w.start()
+        try:
+            for w in self.workers:
+                w.join()
+        finally:
+            if self.robots:
+                self.robots.close()
+
+    def log_stats(self):
+        """
+        Logs how many pages and leases were worked on
+        """
+        logging.info("Sent %d page(s) back on %d lease(s)" % (self.pages.value, self.leases.value))
+        self.metrics.log_stats()
+        self.checker.log_stats()
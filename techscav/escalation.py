@@ -0,0 +1,76 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: escalation.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import re
+
+from body import Body
+
+MARKERS = [
+    r'\bng-app\b',
+    r'\bdata-reactroot\b',
+    r'<div[^>]+id=["\'](?:app|root)["\'][^>]*>\s*</div>',
+]
+
+_script = re.compile(r'<script\b', re.I)
+_invisible = re.compile(r'<(script|style|noscript|template)\b.*?</\1\s*>|<!--.*?-->', re.I | re.S)
+_tag = re.compile(r'<[^>]*>')
+_space = re.compile(r'\s+')
+
+
+class EscalationPolicy(object):
+    """
+    Decides if a page where the simple check found nothing is worth
+    rendering, because it looks like its content is built by scripts: many
+    <script> tags around little text, or the empty root of a client side
+    application.
+
+    Attributes:
+        min_scripts  how many <script> tags a page needs to be escalated
+        max_text     how many characters of text, outside of scripts and
+                     tags, a page can have and still be escalated
+        markers      regular expressions that get a page escalated no matter
+                     the rest
+        always       escalate every page where nothing was found
+    """
+
+    def __init__(self, min_scripts=3, max_text=500, markers=MARKERS, always=False):
+        self.min_scripts = min_scripts
+        self.max_text = max_text
+        self.markers = [re.compile(x, re.I) for x in markers]
+        self.always = always
+
+    def text_length(self, content):
+        """
+        Gets how many characters of the page would be shown without scripts
+        """
+        text = _tag.sub(' ', _invisible.sub(' ', content))
+        return len(_space.sub(' ', text).strip())
+
+    def escalate(self, content):
+        """
+        Gets why a page should be rendered, None if it should not. The page
+        can be a Body, which is only decoded if its text has to be measured.
+        """
+        if self.always:
+            return "every page is escalated"
+        body = None
+        if isinstance(content, Body):
+            body, content = content, content.markup()[0]
+        for marker in self.markers:
+            if marker.search(content):
+                return "it matches %s" % marker.pattern
+        scripts = len(_script.findall(content))
+        if scripts >= self.min_scripts:
+            length = self.text_length(content if body is None else body.text)
+            if length <= self.max_text:
+                return "it has %d script(s) and %d character(s) of text" % (scripts, length)
+        return None
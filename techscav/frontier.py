@@ -0,0 +1,174 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: frontier.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import heapq
+import shutil
+import struct
+import cPickle
+import itertools
+from collections import deque
+from queuelib import FifoDiskQueue, PriorityQueue
+
+
+class SegmentQueue(FifoDiskQueue):
+    """
+    A queuelib FifoDiskQueue, items appended to segment files of chunksize
+    items each, that can also be read without being popped
+    """
+
+    def __iter__(self):
+        num, count, offset = self.info['tail']
+        head = self.info['head']
+        while [num, count] < head:
+            with self._openchunk(num) as f:
+                f.seek(offset)
+                while [num, count] < head and count < self.chunksize:
+                    size, = struct.unpack(self.szhdr_format, f.read(self.szhdr_size))
+                    yield f.read(size)
+                    count += 1
+            num, count, offset = num + 1, 0, 0
+
+
+class BlockQueue(object):
+    """
+    A FIFO queue written to a SegmentQueue a block of items at a time, so
+    each write and read to disk is worth block_size items. The block being
+    filled and the block being emptied are kept in memory.
+
+    Attributes:
+        segments     the SegmentQueue of the pickled blocks
+        block_size   how many items go to disk at once
+        size         how many items are in the queue
+    """
+
+    def __init__(self, path, chunksize=1000, block_size=100):
+        self.segments = SegmentQueue(path, chunksize)
+        self.block_size = block_size
+        self.size = 0
+        self._head = deque()
+        self._tail = []
+
+    def __len__(self):
+        return self.size
+
+    def push(self, item):
+        self._tail.append(item)
+        self.size += 1
+        if len(self._tail) >= self.block_size:
+            self.segments.push(cPickle.dumps(self._tail, cPickle.HIGHEST_PROTOCOL))
+            self._tail = []
+
+    def pop(self):
+        if not self._head:
+            if len(self.segments):
+                self._head = deque(cPickle.loads(self.segments.pop()))
+            else:
+                self._head, self._tail = deque(self._tail), []
+        if self._head:
+            self.size -= 1
+            return self._head.popleft()
+
+    def __iter__(self):
+        for item in self._head:
+            yield item
+        for data in self.segments:
+            for item in cPickle.loads(data):
+                yield item
+        for item in self._tail:
+            yield item
+
+    def close(self):
+        self.segments.close()
+
+
+class SpillQueue(object):
+    """
+    A priority queue, best first and first in first out among equals, that
+    keeps some of its items in memory and appends the rest to segment files
+    on disk, a BlockQueue for each priority. Once an item of some priority
+    is on disk the next ones with the same priority follow it there, so they
+    still come out in order; the disk is read when it has the best priority.
+
+    Attributes:
+        path         the directory the items are spilled to, which has to be
+                     set before anything is
+        pack         transforms an item into something cPickle can write
+        unpack       transforms what pack made back into an item
+        block_size   how many items are written to disk at once
+        memory       the items in memory, a heap of (-priority, seq, item)
+        disk         the queuelib PriorityQueue of the items on disk, by
+                     -priority, None until something is spilled
+        spilled      how many items are on disk
+    """
+
+    def __init__(self, path, pack=None, unpack=None, block_size=100):
+        self.path = path
+        self.pack = pack or (lambda x: x)
+        self.unpack = unpack or (lambda x: x)
+        self.block_size = block_size
+        self.memory = []
+        self.disk = None
+        self.spilled = 0
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.memory) + self.spilled
+
+    def _blocks(self, priority):
+        return BlockQueue(os.path.join(self.path, str(priority)), block_size=self.block_size)
+
+    def push(self, item, priority=0, spill=False):
+        """
+        Adds an item, to the disk if spill is set or items with the same
+        priority are already there. Returns True if it was spilled.
+        """
+        if spill or (self.disk is not None and -priority in self.disk.queues):
+            if self.disk is None:
+                self.disk = PriorityQueue(self._blocks)
+            self.disk.push(self.pack(item), -priority)
+            self.spilled += 1
+            return True
+        heapq.heappush(self.memory, (-priority, next(self._seq), item))
+        return False
+
+    def pop(self):
+        """
+        Gets the best item, None if there is none
+        """
+        if self.spilled and (not self.memory or self.disk.curprio < self.memory[0][0]):
+            self.spilled -= 1
+            return self.unpack(self.disk.pop())
+        if self.memory:
+            return heapq.heappop(self.memory)[2]
+
+    def __iter__(self):
+        """
+        Iterates over every item, in no particular order
+        """
+        for entry in self.memory:
+            yield entry[2]
+        if self.disk is not None:
+            for queue in self.disk.queues.values():
+                for item in queue:
+                    yield self.unpack(item)
+
+    def clear(self):
+        """
+        Drops every item and removes the segment files
+        """
+        self.memory = []
+        self.spilled = 0
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+            shutil.rmtree(self.path, True)
@@ -0,0 +1,97 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: links.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from body import decode
+
+
+class SoupLinkExtractor(object):
+    """
+    Finds the links of a page by building a BeautifulSoup tree with the
+    html.parser, slow but forgiving
+    """
+
+    def extract(self, content, encoding=None):
+        """
+        Gets the <base href> of a page, None if there is none, and the href of
+        every <a>. The page is decoded first if it comes as bytes in a known
+        encoding.
+        """
+        if encoding is not None and isinstance(content, str):
+            content = decode(content, encoding)
+        soup = BeautifulSoup(content, 'html.parser')
+        base = soup.find('base', href=True)
+        links = filter(lambda x: x, map(lambda x: x.get('href'), soup.find_all('a')))
+        return (base['href'] if base else None), links
+
+
+class LxmlLinkExtractor(object):
+    """
+    Finds the links of a page with the libxml2 HTML parser and a couple of
+    precompiled XPath expressions, so nothing but the hrefs reaches Python.
+    Pages in bytes are parsed as they are, libxml2 decoding them.
+
+    Attributes:
+        parser      the HTML parser, which can be reused but not shared among
+                    threads
+        parsers     the HTML parsers for each encoding pages came in
+    """
+
+    _base = etree.XPath("(//base[@href])[1]/@href", smart_strings=False)
+    _links = etree.XPath("//a/@href", smart_strings=False)
+
+    def __init__(self):
+        self.parser = etree.HTMLParser(remove_comments=True, remove_pis=True)
+        self.parsers = {}
+
+    def _parser(self, encoding):
+        if encoding not in self.parsers:
+            try:
+                self.parsers[encoding] = etree.HTMLParser(remove_comments=True, remove_pis=True, encoding=encoding)
+            except LookupError:
+                # libxml2 does not know it, the page is decoded in Python
+                self.parsers[encoding] = None
+        return self.parsers[encoding]
+
+    def _parse(self, content, encoding=None):
+        if encoding is not None and isinstance(content, str):
+            parser = self._parser(encoding)
+            if parser is None:
+                content = decode(content, encoding)
+            else:
+                return etree.fromstring(content, parser)
+        try:
+            return etree.fromstring(content, self.parser)
+        except ValueError:
+            # unicode with an encoding declaration in it
+            return etree.fromstring(content.encode('utf-8'), etree.HTMLParser(encoding='utf-8'))
+
+    def extract(self, content, encoding=None):
+        """
+        Gets the <base href> of a page, None if there is none, and the href of
+        every <a>. Bytes are read in the encoding given, if any.
+        """
+        if not content:
+            return None, []
+        root = self._parse(content, encoding)
+        if root is None:
+            return None, []
+        base = self._base(root)
+        return (base[0] if base else None), filter(lambda x: x, self._links(root))
+
+
+LINK_EXTRACTORS = {
+    'lxml': LxmlLinkExtractor,
+    'soup': SoupLinkExtractor,
+}
@@ -0,0 +1,225 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: matcher.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import re
+
+
+def _trie_pattern(node):
+    """
+    Transforms a character trie into a regular expression that prefers the
+    longest word it can match
+    """
+    terminal = '' in node
+    children = sorted(k for k in node.keys() if k != '')
+    if not children:
+        return ''
+    branches = [re.escape(c) + _trie_pattern(node[c]) for c in children]
+    if len(branches) == 1 and not terminal:
+        return branches[0]
+    pattern = "(?:%s)" % "|".join(branches)
+    if terminal:
+        pattern += "?"
+    return pattern
+
+
+class PropertyMatcher(object):
+    """
+    Finds every property referenced by a text in a single pass, with the same
+    semantics as running "re.search(p.re, text)" for every property.
+
+    All the property domains are compiled into one trie shaped regular
+    expression. For each "." or "/" in the text the expression captures the
+    longest domain starting right after it. Any other domain starting at the
+    same position has to be a prefix of that one, so each domain already knows
+    the keys of all the properties owning one of its prefixes.
+
+    Attributes:
+        properties   a dict of "Property" by key
+        re           the compiled regular expression
+        keys         the property keys found with each domain
+        longest      the length of the longest domain
+        ascii        are all the domains ASCII, so they can be matched on
+                     the bytes of a page in any ASCII compatible encoding
+    """
+
+    def __init__(self, properties):
+        self.properties = properties
+        owners = {}
+        for p in properties.values():
+            for d in p.domains:
+                owners.setdefault(d, set()).add(p.key)
+
+        self.keys = {}
+        for d in owners:
+            found = set()
+            for i in xrange(1, len(d) + 1):
+                found |= owners.get(d[:i], set())
+            self.keys[d] = frozenset(found)
+
+        self.longest = max(len(d) for d in owners) if owners else 0
+        self.ascii = all(ord(c) < 128 for d in owners for c in d)
+
+        trie = {}
+        for d in owners:
+            node = trie
+            for c in d:
+                node = node.setdefault(c, {})
+            node[''] = True
+
+        if owners:
+            self.re = re.compile("[./](?=(%s))" % _trie_pattern(trie))
+        else:
+            self.re = None
+
+    def match(self, text, stop_when_complete=True):
+        """
+        Returns the set of property keys found in the text. If every property
+        has been found the scan stops right away.
+        """
+        found = set()
+        if self.re is None:
+            return found
+        total = len(self.properties)
+        for m in self.re.finditer(text):
+            found |= self.keys[m.group(1)]
+            if stop_when_complete and len(found) == total:
+                break
+        return found
+
+    def scanner(self):
+        """
+        Gets a StreamScanner to match a text that arrives in chunks
+        """
+        return StreamScanner(self)
+
+
+class StreamScanner(object):
+    """
+    Matches a text fed in chunks, finding the same properties as matching the
+    whole text at once. The end of each chunk is kept and scanned again with
+    the next one, so domains split between two chunks are found. Chunks can
+    be bytes or unicode, but not both.
+
+    Attributes:
+        matcher     the PropertyMatcher used
+        found       the property keys found so far
+        scanned     the number of characters fed
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.found = set()
+        self.scanned = 0
+        self._tail = ''
+
+    @property
+    def complete(self):
+        """
+        Has every property been found
+        """
+        return len(self.found) == len(self.matcher.properties)
+
+    def feed(self, chunk):
+        """
+        Matches the next chunk of the text, returns True once every property
+        has been found
+        """
+        self.scanned += len(chunk)
+        if self.matcher.re is None or self.complete:
+            return self.complete
+        text = self._tail + chunk
+        self.found |= self.matcher.match(text)
+        self._tail = text[-(self.matcher.longest + 1):]
+        return self.complete
+
+
+_host = re.compile(r'\s*(?:[a-zA-Z][a-zA-Z0-9+.-]*:)?//(?:[^@/?#]*@)?([^:/?#\s]+)')
+
+
+def url_host(url):
+    """
+    Gets the lowercase host name of an absolute or scheme relative url, None
+    if it has none. A regular expression is used rather than urlparse,
+    whose cache is too small for the hundreds of urls of a page.
+    """
+    m = _host.match(url)
+    return m.group(1).lower() if m else None
+
+
+class HostMatcher(object):
+    """
+    Finds the properties urls belong to by their host names. The property
+    domains are kept in a trie of their labels, last label first, so a host
+    is matched by walking its labels from the top level domain down:
+    "cdn.shop.foo.com" belongs to the properties of "foo.com", "shop.foo.com"
+    and "cdn.shop.foo.com", but "foo.com.evil.net" and "barfoo.com" do not.
+
+    Unlike matching the text of a url, a domain has to be the host or one of
+    its parents, and each host is looked up once no matter how many urls
+    share it.
+
+    Attributes:
+        properties   a dict of "Property" by key
+        trie         nested dicts by label, with the keys of the properties
+                     whose domain ends on a node under None
+        cache        the keys found for the hosts seen lately
+        cache_size   how many hosts are kept in the cache
+    """
+
+    def __init__(self, properties, cache_size=10000):
+        self.properties = properties
+        self.cache = {}
+        self.cache_size = cache_size
+        self.trie = {}
+        for p in properties.values():
+            for d in p.domains:
+                node = self.trie
+                for label in reversed(d.lower().strip('.').split('.')):
+                    node = node.setdefault(label, {})
+                node.setdefault(None, set()).add(p.key)
+
+    def match_host(self, host):
+        """
+        Returns the set of property keys a host name belongs to
+        """
+        found = self.cache.get(host)
+        if found is None:
+            found = set()
+            node = self.trie
+            for label in reversed(host.lower().rstrip('.').split('.')):
+                node = node.get(label)
+                if node is None:
+                    break
+                found.update(node.get(None, ()))
+            found = frozenset(found)
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[host] = found
+        return found
+
+    def match(self, urls):
+        """
+        Returns the set of property keys any of the urls belongs to, urls
+        without a host are ignored
+        """
+        found = set()
+        seen = set()
+        total = len(self.properties)
+        for url in urls:
+            host = url_host(url)
+            if host is None or host in seen:
+                continue
+            seen.add(host)
+            found |= self.match_host(host)
+            if len(found) == total:
+                break
+        return found
@@ -0,0 +1,331 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: metrics.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+import requests
+from multiprocessing import RawArray, Value
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from session import DeadHostError
+
+# what is timed on each page: the wait of its batch on the queue of the
+# workers, timed once for the batch, opening a connection, the download, decoding the text, finding the links, matching
+# the properties and rendering on PhantomJS
+STAGES = ['queue', 'connect', 'download', 'decode', 'links', 'match', 'render']
+
+COUNTERS = ['pages', 'bytes', 'content_cache_hits', 'page_cache_hits']
+
+ERRORS = ['timeout', 'connection', 'dead_host', 'redirects', 'http', 'render', 'check', 'other']
+
+# the upper bounds, in seconds, of the buckets of the histograms
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+_STAGE = dict((x, i) for i, x in enumerate(STAGES))
+_COUNTER = dict((x, i) for i, x in enumerate(COUNTERS))
+_ERROR = dict((x, i) for i, x in enumerate(ERRORS))
+
+
+def error_type(error):
+    """
+    Gets which of ERRORS a fetch failed with
+    """
+    if isinstance(error, DeadHostError):
+        return 'dead_host'
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.ConnectionError):
+        return 'connection'
+    if isinstance(error, requests.TooManyRedirects):
+        return 'redirects'
+    if isinstance(error, requests.RequestException):
+        return 'http'
+    return 'other'
+
+
+class Metrics(object):
+    """
+    Histograms of how long each stage of a page took, and counters of the
+    pages, bytes, cache hits and errors, in shared memory so every process
+    forked after it was created adds to them.
+
+    Each process adds to a row of its own, so nothing is locked on the way,
+    and reading sums the rows up. A row has, for each stage, the count of
+    each bucket and the sum of the times, then the counters and the errors.
+    Processes past the number of rows share them, and may lose an update
+    now and then.
+
+    Attributes:
+        slots        the number of rows
+        started      when it was created
+    """
+
+    def __init__(self, slots=64):
+        self.slots = slots
+        self.started = time.time()
+        self._stage = len(BUCKETS) + 2
+        self._counters = len(STAGES) * self._stage
+        self._errors = self._counters + len(COUNTERS)
+        self._width = self._errors + len(ERRORS)
+        self._data = RawArray('d', slots * self._width)
+        self._next = Value('l', 0)
+        self._row = None
+        self._pid = None
+
+    def _offset(self):
+        """
+        Gets where the row of this process starts
+        """
+        if self._pid != os.getpid():
+            with self._next.get_lock():
+                self._row = (self._next.value % self.slots) * self._width
+                self._next.value += 1
+            self._pid = os.getpid()
+        return self._row
+
+    def observe(self, stage, seconds):
+        """
+        Adds how long a stage of a page took
+        """
+        start = self._offset() + _STAGE[stage] * self._stage
+        self._data[start + bisect.bisect_left(BUCKETS, seconds)] += 1
+        self._data[start + self._stage - 1] += seconds
+
+    def count(self, name, n=1):
+        """
+        Adds to one of COUNTERS
+        """
+        self._data[self._offset() + self._counters + _COUNTER[name]] += n
+
+    def error(self, kind):
+        """
+        Counts an error, one of ERRORS
+        """
+        self._data[self._offset() + self._errors + _ERROR[kind]] += 1
+
+    def snapshot(self):
+        """
+        Gets the sum of every row: for each stage the count of each bucket,
+        the last one being over every bound, and the sum of the times, and
+        the value of each counter and error
+        """
+        totals = [0.0] * self._width
+        data = self._data[:]
+        for row in xrange(0, len(data), self._width):
+            for i, x in enumerate(data[row:row + self._width]):
+                totals[i] += x
+        stages = {}
+        for stage, i in _STAGE.items():
+            values = totals[i * self._stage:(i + 1) * self._stage]
+            stages[stage] = {'buckets': [int(x) for x in values[:-1]], 'sum': values[-1], 'count': int(sum(values[:-1]))}
+        return {
+            'stages': stages,
+            'counters': dict((x, int(totals[self._counters + i])) for x, i in _COUNTER.items()),
+            'errors': dict((x, int(totals[self._errors + i])) for x, i in _ERROR.items()),
+        }
+
+    def quantile(self, stage, q, snapshot=None):
+        """
+        Gets the bound of the bucket a quantile of a stage falls in, None if
+        the stage was never timed and infinity if it is past the last one
+        """
+        stats = (snapshot or self.snapshot())['stages'][stage]
+        if not stats['count']:
+            return None
+        seen = 0
+        for bound, n in zip(BUCKETS + [float('inf')], stats['buckets']):
+            seen += n
+            if seen >= q * stats['count']:
+                return bound
+
+    def prometheus(self, gauges=None):
+        """
+        Gets the metrics in the Prometheus text format, along with the
+        gauges given by name
+        """
+        snapshot = self.snapshot()
+        lines = ["# HELP techscav_stage_seconds How long each stage of a page took",
+                 "# TYPE techscav_stage_seconds histogram"]
+        for stage in STAGES:
+            stats = snapshot['stages'][stage]
+            seen = 0
+            for bound, n in zip(BUCKETS + ["+Inf"], stats['buckets']):
+                seen += n
+                lines.append('techscav_stage_seconds_bucket{stage="%s",le="%s"} %d' % (stage, bound, seen))
+            lines.append('techscav_stage_seconds_sum{stage="%s"} %r' % (stage, stats['sum']))
+            lines.append('techscav_stage_seconds_count{stage="%s"} %d' % (stage, stats['count']))
+        for name in COUNTERS:
+            lines.append("# TYPE techscav_%s_total counter" % name)
+            lines.append("techscav_%s_total %d" % (name, snapshot['counters'][name]))
+        lines.append("# TYPE techscav_errors_total counter")
+        for kind in ERRORS:
+            lines.append('techscav_errors_total{type="%s"} %d' % (kind, snapshot['errors'][kind]))
+        gauges = dict(gauges or {}, uptime_seconds=time.time() - self.started)
+        for name in sorted(gauges):
+            lines.append("# TYPE techscav_%s gauge" % name)
+            lines.append("techscav_%s %r" % (name, gauges[name]))
+        return "\n".join(lines) + "\n"
+
+    def log_stats(self):
+        """
+        Logs the counters and how long each stage took
+        """
+        snapshot = self.snapshot()
+        logging.info("%(pages)d page(s), %(bytes)d byte(s) read, %(content_cache_hits)d content cache hit(s), "
+                     "%(page_cache_hits)d page cache hit(s)" % snapshot['counters'])
+        errors = ["%d %s" % (n, kind) for kind, n in sorted(snapshot['errors'].items()) if n]
+        if errors:
+            logging.info("Errors: %s" % ", ".join(errors))
+        for stage in STAGES:
+            stats = snapshot['stages'][stage]
+            if stats['count']:
+                logging.info("%s: %d time(s), %.4fs on average, half under %ss, 95%% under %ss" %
+                             (stage, stats['count'], stats['sum'] / stats['count'],
+                              self.quantile(stage, 0.5, snapshot), self.quantile(stage, 0.95, snapshot)))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Answers /metrics with the metrics of the reporter of its server
+    """
+
+    def log_message(self, *args, **kwargs):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.reporter.exposition()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsReporter(object):
+    """
+    Shows how a crawl is going while it runs, from threads of the main
+    process: a progress bar on stderr, a file in the Prometheus text format,
+    rewritten every interval seconds in a single rename so a collector never
+    reads half of it, and an HTTP endpoint on localhost answering /metrics.
+
+    Attributes:
+        metrics      the Metrics shared with the workers
+        manager      the manager whose progress is shown, None for the
+                     workers of a Coordinator
+        interval     how many seconds between updates
+        path         the file the metrics are written to, None for none
+        port         the port the endpoint listens on, None for none
+        progress     is the progress bar shown
+    """
+
+    def __init__(self, metrics, manager=None, interval=5, path=None, port=None, progress=False):
+        self.metrics = metrics
+        self.manager = manager
+        self.interval = interval
+        self.path = path
+        self.port = port
+        self.progress = progress
+        self._bar = None
+        self._server = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def gauges(self):
+        """
+        Gets how far the crawl went
+        """
+        if self.manager is None:
+            return {}
+        return self.manager.progress()
+
+    def exposition(self):
+        """
+        Gets the metrics and gauges in the Prometheus text format
+        """
+        return self.metrics.prometheus(self.gauges())
+
+    def summary(self, bar, data):
+        """
+        A progress bar widget with the pages done and the gauges
+        """
+        counters = self.metrics.snapshot()['counters']
+        elapsed = max(time.time() - self.metrics.started, 1e-6)
+        gauges = self.gauges()
+        text = "%d page(s), %.1f/s" % (counters['pages'], counters['pages'] / elapsed)
+        if gauges:
+            text += ", %(domains_written)d of %(domains_read)d domain(s) done, %(requests_pending)d pending" % gauges
+        return text
+
+    def write(self):
+        """
+        Writes the metrics file
+        """
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.exposition())
+        os.rename(tmp, self.path)
+
+    def report(self):
+        """
+        Updates the progress bar and the metrics file
+        """
+        try:
+            if self.path:
+                self.write()
+            if self._bar is not None:
+                self._bar.update(self.gauges().get('domains_written', 0))
+        except:
+            logging.debug("Some error happened reporting the metrics, ignoring")
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def start(self):
+        """
+        Starts the endpoint, the progress bar and the updates
+        """
+        if self.port:
+            self._server = HTTPServer(('127.0.0.1', self.port), _MetricsHandler)
+            self._server.reporter = self
+            thread = threading.Thread(target=self._server.serve_forever)
+            thread.daemon = True
+            thread.start()
+        if self.progress:
+            import progressbar
+            self._bar = progressbar.ProgressBar(max_value=progressbar.UnknownLength, fd=sys.stderr,
+                                                widgets=[progressbar.AnimatedMarker(), ' ', progressbar.Timer(), ' ', self.summary])
+            self._bar.start()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Makes a last update and stops
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.report()
+        if self._bar is not None:
+            self._bar.finish()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,128 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: output.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import csv
+import json
+import time
+import logging
+from StringIO import StringIO
+
+FORMATS = ["text", "jsonl", "csv"]
+
+
+class ResultWriter(object):
+    """
+    Writes the properties found on each domain as soon as the domain is done.
+    Lines are kept in a small buffer and flushed in batches, so nothing but
+    the domains being crawled stays in memory.
+
+    The text format is the same "domain: Foo, Bar" the crawler always printed
+    and skips domains without matches. The jsonl and csv formats have a line
+    for every domain. A domain that could not be crawled, such as one that
+    does not resolve, is written with its status: "domain: [unresolvable]"
+    on the text format, a "status" key on jsonl and a status column on csv.
+
+    Attributes:
+        file        where the results are written to
+        properties  a dict of "Property" by key
+        format      one of text, jsonl or csv
+        batch_size  how many domains are buffered before writing
+        interval    how many seconds a domain can stay buffered
+        written     how many domains were done, including those the text
+                    format skips
+    """
+
+    def __init__(self, f, properties, format="text", batch_size=100, interval=2):
+        if format not in FORMATS:
+            raise ValueError("unknown format: %s" % format)
+        self.file = f
+        self.properties = properties
+        self.format = format
+        self.batch_size = batch_size
+        self.interval = interval
+        self.written = 0
+        self._buffer = []
+        self._last_flush = time.time()
+        if format == "csv":
+            self._buffer.append(self._csv_line(["domain", "properties", "status"]))
+
+    def _csv_line(self, row):
+        out = StringIO()
+        csv.writer(out).writerow([x.encode('utf-8') if isinstance(x, unicode) else x for x in row])
+        return out.getvalue()
+
+    def format_domain(self, domain, keys, status=None):
+        """
+        Formats the properties found on a domain, None if nothing should be
+        written
+        """
+        names = sorted(set(self.properties[x].name for x in keys))
+        if self.format == "text":
+            if status:
+                return "%s: [%s]\n" % (domain, status)
+            if names:
+                return "%s: %s\n" % (domain, ", ".join(names))
+        elif self.format == "jsonl":
+            result = {"domain": domain, "properties": names}
+            if status:
+                result["status"] = status
+            return json.dumps(result) + "\n"
+        else:
+            return self._csv_line([domain, ";".join(names), status or ""])
+
+    def write(self, domain, keys, status=None):
+        """
+        Adds the results of a domain that is done
+        """
+        line = self.format_domain(domain, keys, status)
+        if line is not None:
+            self._buffer.append(line)
+        self.written += 1
+        if len(self._buffer) >= self.batch_size or time.time() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes whatever is buffered
+        """
+        if self._buffer:
+            self.file.write("".join(x.encode('utf-8') if isinstance(x, unicode) else x for x in self._buffer))
+            self._buffer = []
+        self.file.flush()
+        self._last_flush = time.time()
+
+    def offset(self):
+        """
+        Gets how far the file was written, None if it can not be told
+        """
+        try:
+            return self.file.tell()
+        except (IOError, AttributeError):
+            return None
+
+    def truncate(self, offset):
+        """
+        Drops whatever was written after an offset, so the domains done after
+        a checkpoint are not written twice when the crawl resumes from it
+        """
+        self._buffer = []
+        try:
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        except (IOError, AttributeError):
+            logging.warning("Could not truncate the output, domains may be written twice")
+
+    def close(self):
+        """
+        Writes whatever is left
+        """
+        self.flush()
@@ -0,0 +1,206 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: pagecache.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import hashlib
+import cPickle
+import logging
+import sqlite3
+import threading
+from multiprocessing import Value
+
+
+def properties_signature(properties):
+    """
+    Gets what tells a set of properties apart from another: the MD5 of their
+    names and domains
+    """
+    return hashlib.md5(repr(sorted((p.name, sorted(p.domains)) for p in properties.values()))).hexdigest()
+
+
+class CachedPage(object):
+    """
+    What a page was found to have the last time it was fetched
+
+    Attributes:
+        url          the url the page ended on
+        etag         the ETag header it came with, None if it had none
+        modified     the Last-Modified header it came with, None if it had none
+        found        the names of the properties found on it
+        links        the links to be crawled from it, None if they were not
+                     looked for
+        stored       when it was fetched or revalidated
+    """
+
+    __slots__ = ('url', 'etag', 'modified', 'found', 'links', 'stored')
+
+    def __init__(self, url, etag, modified, found, links, stored):
+        self.url = url
+        self.etag = etag
+        self.modified = modified
+        self.found = found
+        self.links = links
+        self.stored = stored
+
+    def headers(self):
+        """
+        Gets the headers that make a request conditional on the page having
+        changed
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.modified:
+            headers['If-Modified-Since'] = self.modified
+        return headers
+
+
+class PageCache(object):
+    """
+    The pages fetched on earlier runs, by Request.digest, with the validators
+    they came with and what was found on them, stored on a sqlite database
+    shared by every worker process. Only pages that came with an ETag or a
+    Last-Modified header are kept, since no others can be asked if they
+    changed.
+
+    Properties are stored by name, since their keys change from one run to
+    the next. The entries are dropped when the properties searched for are
+    not the same as when they were stored. Once the entries take more than
+    max_size bytes, the least recently used are dropped.
+
+    Attributes:
+        path         the location of the database
+        signature    what tells the properties searched for apart
+        max_size     how many bytes the entries can take, None for no limit
+        since        entries stored before this time are not used
+        served       how many pages were not modified and came from the
+                     cache, shared among processes
+        stored       how many pages were stored, shared among processes
+        evicted      how many entries were dropped to fit max_size, shared
+                     among processes
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(self, path, signature='', max_size=1073741824, since=None):
+        self.path = path
+        self.signature = signature
+        self.max_size = max_size
+        self.since = since
+        self.served = Value('l', 0)
+        self.stored = Value('l', 0)
+        self.evicted = Value('l', 0)
+        self._puts = 0
+        self._local = threading.local()
+        db = self.db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS pages (digest BLOB PRIMARY KEY, url TEXT, etag TEXT, modified TEXT, "
+                   "data BLOB, size INTEGER, stored REAL, used REAL)")
+        db.execute("CREATE INDEX IF NOT EXISTS pages_used ON pages (used)")
+        row = db.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        if row is None or row[0] != signature:
+            if row is not None:
+                logging.info("The properties changed, dropping the page cache")
+            db.execute("DELETE FROM pages")
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+
+    def db(self):
+        """
+        Gets the connection of this thread to the database, connections can
+        not be shared among threads or forked processes
+        """
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            local.pid = os.getpid()
+        return local.db
+
+    def _count(self, value, n=1):
+        with value.get_lock():
+            value.value += n
+
+    def __len__(self):
+        return self.db().execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def size(self):
+        """
+        Gets how many bytes the entries take
+        """
+        return self.db().execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def get(self, digest):
+        """
+        Gets the page stored for a request, None if there is none
+        """
+        row = self.db().execute("SELECT url, etag, modified, data, stored FROM pages WHERE digest = ?",
+                                (sqlite3.Binary(digest),)).fetchone()
+        if row is None:
+            return None
+        url, etag, modified, data, stored = row
+        if self.since is not None and stored < self.since:
+            return None
+        found, links = cPickle.loads(str(data))
+        return CachedPage(url, etag, modified, found, links, stored)
+
+    def put(self, digest, url, etag, modified, found, links):
+        """
+        Stores what was found on a page and the validators it came with
+        """
+        data = cPickle.dumps((list(found), links), cPickle.HIGHEST_PROTOCOL)
+        size = len(data) + len(url) + len(etag or '') + len(modified or '')
+        now = time.time()
+        self.db().execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          (sqlite3.Binary(digest), url, etag, modified, sqlite3.Binary(data), size, now, now))
+        self._count(self.stored)
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def revalidated(self, digest):
+        """
+        Marks a page as not modified, so it is used and kept as if it was
+        just stored
+        """
+        now = time.time()
+        self.db().execute("UPDATE pages SET stored = ?, used = ? WHERE digest = ?", (now, now, sqlite3.Binary(digest)))
+        self._count(self.served)
+
+    def evict(self):
+        """
+        Drops the least recently used entries until they all take no more
+        than max_size bytes
+        """
+        if self.max_size is None:
+            return
+        db = self.db()
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return
+        freed, cutoff = 0, None
+        rows = db.execute("SELECT used, size FROM pages ORDER BY used")
+        for used, size in rows:
+            freed += size
+            cutoff = used
+            if freed >= excess:
+                break
+        rows.close()
+        dropped = db.execute("DELETE FROM pages WHERE used <= ?", (cutoff,)).rowcount
+        self._count(self.evicted, dropped)
+        logging.debug("Dropped %d page(s) from the page cache" % dropped)
+
+    def close(self):
+        """
+        Makes the entries fit max_size
+        """
+        self.evict()
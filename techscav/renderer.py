@@ -0,0 +1,299 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: renderer.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import json
+import errno
+import select
+import logging
+import threading
+from subprocess import Popen, PIPE
+
+
+RESOURCE_TYPES = {
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp'],
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'media': ['mp4', 'webm', 'ogg', 'ogv', 'mp3', 'wav', 'avi', 'mov', 'flv', 'm4a', 'm4v'],
+    'stylesheet': ['css'],
+}
+
+def resource_extensions(names):
+    """
+    Expands a list of resource types and extensions into extensions
+    """
+    extensions = []
+    for name in names:
+        name = name.strip().lower().lstrip('.')
+        for extension in RESOURCE_TYPES.get(name, [name]):
+            if extension and extension not in extensions:
+                extensions.append(extension)
+    return extensions
+
+
+class RenderError(Exception):
+    """
+    A page could not be rendered
+    """
+    pass
+
+
+def _tree_rss(pid):
+    """
+    Gets the resident memory in KB of a process and all of its descendants,
+    the renderer is usually a wrapper that starts PhantomJS as a child
+    """
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % entry) as f:
+                stat = f.read()
+        except IOError:
+            continue
+        fields = stat[stat.rindex(')') + 2:].split()
+        parents.setdefault(int(fields[1]), []).append(int(entry))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        pending.extend(parents.get(p, []))
+        try:
+            with open('/proc/%d/status' % p) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except IOError:
+            pass
+    return total
+
+
+class Renderer(object):
+    """
+    A long lived renderer process. It takes one url per line on its stdin and
+    answers each with a JSON line on its stdout.
+
+    Attributes:
+        command     the command that starts the renderer
+        process     the running process
+        pages       how many pages it has rendered
+        last_used   when was it last used
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.process = Popen(command, stdin=PIPE, stdout=PIPE, stderr=open(os.devnull, 'w'))
+        self.pages = 0
+        self.last_used = time.time()
+        self._buffer = ''
+
+    def alive(self):
+        """
+        Is the process still running
+        """
+        return self.process.poll() is None
+
+    def memory(self):
+        """
+        Gets the resident memory in KB of the renderer
+        """
+        return _tree_rss(self.process.pid)
+
+    def _readline(self, timeout):
+        """
+        Reads a line from the renderer, waiting at most timeout seconds
+        """
+        deadline = time.time() + timeout
+        fd = self.process.stdout.fileno()
+        while '\n' not in self._buffer:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RenderError("timed out")
+            try:
+                ready, _, _ = select.select([fd], [], [], remaining)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if ready:
+                data = os.read(fd, 65536)
+                if not data:
+                    raise RenderError("renderer exited")
+                self._buffer += data
+        line, self._buffer = self._buffer.split('\n', 1)
+        return line
+
+    def _send(self, line, timeout):
+        try:
+            self.process.stdin.write(line + "\n")
+            self.process.stdin.flush()
+        except IOError:
+            raise RenderError("renderer exited")
+        self.last_used = time.time()
+        try:
+            return json.loads(self._readline(timeout))
+        except ValueError:
+            raise RenderError("invalid output")
+
+    def ping(self, timeout=5):
+        """
+        Checks if the renderer still answers
+        """
+        try:
+            return self._send("ping", timeout).get('pong', False)
+        except RenderError:
+            return False
+
+    def render(self, url, timeout):
+        """
+        Renders a page, returns its final url, content and requested urls
+        """
+        data = self._send(url, timeout)
+        self.pages += 1
+        return data
+
+    def close(self, grace=2):
+        """
+        Stops the renderer, killing it if it does not exit by itself
+        """
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        deadline = time.time() + grace
+        while self.alive() and time.time() < deadline:
+            time.sleep(0.05)
+        if self.alive():
+            self.kill()
+
+    def kill(self):
+        """
+        Kills the renderer, used when it can not be trusted anymore
+        """
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+
+
+class RendererPool(object):
+    """
+    A pool of long lived renderers. Renderers are started as needed, checked
+    before being reused after a while idle, and replaced after rendering too
+    many pages, growing past a memory limit, crashing or timing out.
+
+    Attributes:
+        command     the command that starts a renderer
+        size        the maximum number of renderers
+        max_pages   how many pages a renderer renders before being replaced
+        max_memory  the resident memory in KB that gets a renderer replaced,
+                    None for no limit
+        timeout     how many seconds a render can take
+        ping_after  how many idle seconds before a renderer is pinged
+        started     how many renderers were started
+        recycled    how many renderers were replaced
+    """
+
+    def __init__(self, command, size=1, max_pages=100, max_memory=None, timeout=30, ping_after=60):
+        self.command = command
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.started = 0
+        self.recycled = 0
+        self._idle = []
+        self._count = 0
+        self._changed = threading.Condition()
+
+    def acquire(self):
+        """
+        Gets a healthy renderer, blocking while they are all busy
+        """
+        while True:
+            with self._changed:
+                while not self._idle and self._count >= self.size:
+                    self._changed.wait()
+                if self._idle:
+                    renderer = self._idle.pop()
+                else:
+                    self._count += 1
+                    renderer = None
+            if renderer is None:
+                self.started += 1
+                try:
+                    return Renderer(self.command)
+                except:
+                    self._free()
+                    raise
+            if renderer.alive() and (time.time() - renderer.last_used <= self.ping_after or renderer.ping()):
+                return renderer
+            self.discard(renderer)
+
+    def _free(self):
+        with self._changed:
+            self._count -= 1
+            self._changed.notify()
+
+    def discard(self, renderer):
+        """
+        Kills a renderer and frees its slot
+        """
+        renderer.kill()
+        self.recycled += 1
+        self._free()
+
+    def release(self, renderer):
+        """
+        Gives back a renderer, replacing it if it is used up
+        """
+        if not renderer.alive():
+            self.discard(renderer)
+        elif renderer.pages >= self.max_pages:
+            logging.debug("Recycling renderer after %d pages" % renderer.pages)
+            renderer.close()
+            self.recycled += 1
+            self._free()
+        elif self.max_memory and renderer.memory() > self.max_memory:
+            logging.debug("Recycling renderer using more than %d KB" % self.max_memory)
+            self.discard(renderer)
+        else:
+            with self._changed:
+                self._idle.append(renderer)
+                self._changed.notify()
+
+    def render(self, url):
+        """
+        Renders a page on one of the renderers
+        """
+        renderer = self.acquire()
+        try:
+            data = renderer.render(url, self.timeout)
+        except RenderError:
+            self.discard(renderer)
+            raise
+        self.release(renderer)
+        return data
+
+    def close(self):
+        """
+        Stops every idle renderer
+        """
+        with self._changed:
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+        for renderer in idle:
+            renderer.close()
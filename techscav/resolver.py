@@ -0,0 +1,222 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: resolver.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import socket
+import logging
+import sqlite3
+import tempfile
+import threading
+from multiprocessing import Value
+from multiprocessing.pool import ThreadPool
+
+# getaddrinfo errors that say the name does not exist, rather than that the
+# answer did not come
+MISSING = set(getattr(socket, x) for x in ('EAI_NONAME', 'EAI_NODATA', 'EAI_ADDRFAMILY') if hasattr(socket, x))
+
+
+def host_of(netloc):
+    """
+    Gets the host of a netloc, without the port
+    """
+    if netloc.startswith('['):
+        return netloc[1:].split(']', 1)[0]
+    return netloc.rsplit(':', 1)[0] if netloc.count(':') == 1 else netloc
+
+
+class SystemResolver(object):
+    """
+    Resolves hosts with getaddrinfo, the way the fetches would
+    """
+
+    def resolve(self, host):
+        """
+        Gets the addresses of a host, an empty list if it has none, None if
+        that could not be told
+        """
+        try:
+            infos = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            return [] if e.args[0] in MISSING else None
+        except (socket.error, UnicodeError):
+            return None
+        addresses = []
+        for info in infos:
+            if info[4][0] not in addresses:
+                addresses.append(info[4][0])
+        return addresses
+
+
+class DNSCache(object):
+    """
+    The addresses of the hosts resolved lately, stored on a sqlite database
+    so every worker process, and the following runs, connect to what was
+    resolved once. A host that has no addresses is kept with an empty list.
+
+    Attributes:
+        path        the location of the database
+        ttl         how many seconds an answer is valid for
+        hits        how many lookups found an answer, shared among processes
+        misses      how many did not, shared among processes
+        answers     the answers already read by this process
+    """
+
+    def __init__(self, path=None, ttl=300, memory=10000):
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.db', prefix='dns')
+            os.close(fd)
+            self._temporary = True
+        else:
+            self._temporary = False
+        self.path = path
+        self.ttl = ttl
+        self.hits = Value('l', 0)
+        self.misses = Value('l', 0)
+        self.answers = {}
+        self._memory = memory
+        self._local = threading.local()
+        db = self.db()
+        db.execute("CREATE TABLE IF NOT EXISTS dns (host TEXT PRIMARY KEY, addresses TEXT, resolved REAL)")
+        db.execute("DELETE FROM dns WHERE resolved < ?", (time.time() - ttl,))
+
+    def db(self):
+        """
+        Gets the connection of this thread to the database, connections can
+        not be shared among threads or forked processes
+        """
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            local.pid = os.getpid()
+        return local.db
+
+    def _remember(self, host, addresses, resolved):
+        if len(self.answers) >= self._memory:
+            self.answers.clear()
+        self.answers[host] = (addresses, resolved + self.ttl)
+        return addresses
+
+    def _count(self, value):
+        with value.get_lock():
+            value.value += 1
+
+    def get(self, host, now=None):
+        """
+        Gets the addresses of a host, None if it was not resolved lately
+        """
+        now = now or time.time()
+        host = host.lower()
+        cached = self.answers.get(host)
+        if cached and cached[1] > now:
+            self._count(self.hits)
+            return cached[0]
+        row = self.db().execute("SELECT addresses, resolved FROM dns WHERE host = ? AND resolved >= ?",
+                                (host, now - self.ttl)).fetchone()
+        if row:
+            self._count(self.hits)
+            addresses, resolved = row
+            return self._remember(host, [str(x) for x in addresses.split(',') if x], resolved)
+        self._count(self.misses)
+        return None
+
+    def put(self, host, addresses, now=None):
+        """
+        Keeps the addresses of a host
+        """
+        resolved = now or time.time()
+        host = host.lower()
+        self.db().execute("INSERT OR REPLACE INTO dns VALUES (?, ?, ?)", (host, ",".join(addresses), resolved))
+        self._remember(host, list(addresses), resolved)
+
+    def close(self):
+        """
+        Removes a temporary database
+        """
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class DomainResolver(object):
+    """
+    Resolves the domains to be crawled ahead of the crawl, on a pool of
+    threads, so the workers are never held by a name that takes long to
+    resolve or does not exist. The answers go to a DNSCache, which the
+    fetches connect with.
+
+    Attributes:
+        backend      resolves a single host: anything with a resolve(host)
+                     method giving its addresses, an empty list if it has
+                     none or None if that could not be told
+        cache        the DNSCache the answers go to
+        threads      how many hosts are resolved at once
+        ahead        how many domains can be waiting for their answer
+        resolved     how many domains had addresses
+        unresolvable how many domains had none
+    """
+
+    def __init__(self, backend=None, cache=None, threads=32, ahead=None):
+        self.backend = backend or SystemResolver()
+        self.cache = cache or DNSCache()
+        self.threads = threads
+        self.ahead = ahead or threads * 2
+        self.resolved = 0
+        self.unresolvable = 0
+        self._pool = None
+
+    def resolve(self, netloc):
+        """
+        Gets the addresses of the host of a netloc, from the cache if it was
+        resolved lately
+        """
+        host = host_of(netloc)
+        addresses = self.cache.get(host)
+        if addresses is None:
+            addresses = self.backend.resolve(host)
+            if addresses is not None:
+                self.cache.put(host, addresses)
+        return addresses
+
+    def submit(self, netloc, callback):
+        """
+        Resolves a netloc on the background, callback gets its addresses on
+        one of the threads of the pool
+        """
+        def run():
+            try:
+                addresses = self.resolve(netloc)
+            except:
+                logging.debug("Some error happened resolving %s, ignoring" % netloc)
+                addresses = None
+            callback(addresses)
+
+        if self._pool is None:
+            self._pool = ThreadPool(self.threads)
+        self._pool.apply_async(run)
+
+    def count(self, addresses):
+        """
+        Counts an answer handed to the crawl
+        """
+        if addresses == []:
+            self.unresolvable += 1
+        else:
+            self.resolved += 1
+
+    def close(self):
+        """
+        Stops the resolving and removes a temporary cache
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        self.cache.close()
@@ -0,0 +1,220 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: robots.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import logging
+import sqlite3
+import tempfile
+import threading
+import robotparser
+import requests
+from multiprocessing import Value
+from multiprocessing.pool import ThreadPool
+
+
+class RobotRules(robotparser.RobotFileParser):
+    """
+    A robots.txt parser that also understands the Crawl-delay directive
+
+    Attributes:
+        delays      the crawl delay asked for each user agent
+    """
+
+    def __init__(self, url=''):
+        robotparser.RobotFileParser.__init__(self, url)
+        self.delays = {}
+
+    def parse(self, lines):
+        """
+        Parses the lines of a robots.txt file
+        """
+        agents = []
+        rules = False
+        for line in lines:
+            line = line.split('#', 1)[0].strip()
+            if ':' not in line:
+                continue
+            key, value = [x.strip() for x in line.split(':', 1)]
+            key = key.lower()
+            if key == 'user-agent':
+                if rules:
+                    agents = []
+                    rules = False
+                agents.append(value.lower())
+            else:
+                rules = True
+                if key == 'crawl-delay':
+                    try:
+                        delay = float(value)
+                    except ValueError:
+                        continue
+                    for agent in agents:
+                        self.delays[agent] = delay
+        robotparser.RobotFileParser.parse(self, lines)
+
+    def crawl_delay(self, useragent):
+        """
+        Gets the delay asked for a user agent, None if there is none
+        """
+        useragent = useragent.lower()
+        for agent, delay in self.delays.items():
+            if agent != '*' and agent in useragent:
+                return delay
+        return self.delays.get('*')
+
+    @classmethod
+    def from_response(cls, status, body):
+        """
+        Builds the rules out of a robots.txt response, following what
+        RobotFileParser.read does with the status codes
+        """
+        rules = cls()
+        if status in (401, 403):
+            rules.disallow_all = True
+        elif status >= 400 or status == 0:
+            rules.allow_all = True
+        else:
+            rules.parse(body.splitlines())
+        rules.modified()
+        return rules
+
+
+class RobotsCache(object):
+    """
+    A cache of robots.txt files, stored on a sqlite database so every worker
+    process and the following runs can use it. The files are fetched with a
+    timeout, and the manager can prefetch them on a pool of threads as it
+    reads the domains.
+
+    Attributes:
+        path        the location of the database
+        ttl         how many seconds a robots.txt file is valid for
+        timeout     how many seconds to wait for a robots.txt file
+        hits        how many lookups did not need a fetch
+        misses      how many lookups had to fetch the file
+        rules       the rules already parsed by this process
+    """
+
+    def __init__(self, path=None, ttl=86400, timeout=5, threads=16, memory=10000):
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.db', prefix='robots')
+            os.close(fd)
+            self._temporary = True
+        else:
+            self._temporary = False
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.hits = Value('l', 0)
+        self.misses = Value('l', 0)
+        self.rules = {}
+        self._threads = threads
+        self._memory = memory
+        self._pool = None
+        self._local = threading.local()
+        db = self.db()
+        db.execute("CREATE TABLE IF NOT EXISTS robots (netloc TEXT PRIMARY KEY, status INTEGER, body BLOB, fetched REAL)")
+        db.execute("DELETE FROM robots WHERE fetched < ?", (time.time() - ttl,))
+
+    def db(self):
+        """
+        Gets the connection of this thread to the database, connections can
+        not be shared among threads or forked processes
+        """
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            local.pid = os.getpid()
+        return local.db
+
+    def _remember(self, netloc, rules, fetched):
+        if len(self.rules) >= self._memory:
+            self.rules.clear()
+        self.rules[netloc] = (rules, fetched + self.ttl)
+        return rules
+
+    def peek(self, netloc):
+        """
+        Gets the rules of a domain if they are cached, without fetching them
+        """
+        now = time.time()
+        cached = self.rules.get(netloc)
+        if cached and cached[1] > now:
+            return cached[0]
+        row = self.db().execute("SELECT status, body, fetched FROM robots WHERE netloc = ? AND fetched >= ?",
+                                (netloc, now - self.ttl)).fetchone()
+        if row:
+            status, body, fetched = row
+            return self._remember(netloc, RobotRules.from_response(status, str(body)), fetched)
+
+    def fetch(self, netloc):
+        """
+        Fetches the robots.txt of a domain and stores it
+        """
+        url = "http://%s/robots.txt" % netloc
+        try:
+            r = requests.get(url, timeout=self.timeout)
+            status, body = r.status_code, r.content
+        except:
+            logging.debug("Could not fetch %s, allowing everything" % url)
+            status, body = 0, ''
+        fetched = time.time()
+        self.db().execute("INSERT OR REPLACE INTO robots VALUES (?, ?, ?, ?)",
+                          (netloc, status, sqlite3.Binary(body), fetched))
+        return self._remember(netloc, RobotRules.from_response(status, body), fetched)
+
+    def get(self, netloc):
+        """
+        Gets the rules of a domain, fetching them if they are not cached
+        """
+        rules = self.peek(netloc)
+        if rules:
+            with self.hits.get_lock():
+                self.hits.value += 1
+            return rules
+        with self.misses.get_lock():
+            self.misses.value += 1
+        return self.fetch(netloc)
+
+    def can_fetch(self, netloc, useragent, url):
+        """
+        Checks if a url can be visited
+        """
+        return self.get(netloc).can_fetch(useragent, url)
+
+    def crawl_delay(self, netloc, useragent):
+        """
+        Gets the crawl delay of a domain if its rules are already cached
+        """
+        rules = self.peek(netloc)
+        if rules:
+            return rules.crawl_delay(useragent) or 0
+        return 0
+
+    def prefetch(self, netloc):
+        """
+        Fetches the rules of a domain on the background
+        """
+        if self._pool is None:
+            self._pool = ThreadPool(self._threads)
+        self._pool.apply_async(self.get, (netloc,))
+
+    def close(self):
+        """
+        Stops the prefetching and removes a temporary database
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,279 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: scheduler.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import re
+import heapq
+import shutil
+import tempfile
+import urlparse
+import itertools
+
+from frontier import SpillQueue
+
+KEYWORDS = ["checkout", "cart", "basket", "pay", "support", "help", "contact", "faq", "account", "login"]
+
+
+class KeywordPriority(object):
+    """
+    Ranks urls by how many keywords their path has, pages like the checkout
+    or the help center are where shops and helpdesks load their widgets
+
+    Attributes:
+        keywords    the words looked for, in lower case
+        re          the compiled regular expression that finds them
+    """
+
+    def __init__(self, keywords=KEYWORDS):
+        self.keywords = [x.lower() for x in keywords]
+        self.re = re.compile("|".join(re.escape(x) for x in self.keywords)) if self.keywords else None
+
+    def __call__(self, url):
+        if self.re is None:
+            return 0
+        parts = urlparse.urlsplit(url)
+        return len(self.re.findall((parts.path + "?" + parts.query).lower()))
+
+
+class Host(object):
+    """
+    The requests waiting for a host and how it has been used
+
+    Attributes:
+        queue        a SpillQueue of the requests waiting to be made, best
+                     first
+        in_flight    the number of requests being made
+        last_access  when was the last request started
+        delay        the minimum number of seconds between requests
+        scheduled    is the host waiting on the ready heap
+        pages        how many requests were accepted for the host
+        closed       is the host done, taking no more requests
+    """
+
+    def __init__(self, delay, queue):
+        self.queue = queue
+        self.in_flight = 0
+        self.last_access = None
+        self.delay = delay
+        self.scheduled = False
+        self.pages = 0
+        self.closed = False
+
+    def ready_at(self):
+        """
+        When can the next request be started
+        """
+        if self.last_access is None:
+            return 0
+        return self.last_access + self.delay
+
+
+class HostScheduler(object):
+    """
+    Orders requests so that no host gets more than a few of them at once, or
+    two of them closer than its delay. Hosts that are ready take turns, so
+    while one waits the requests of the others go ahead.
+
+    Each host is crawled best first and up to a budget of pages, and can be
+    closed once there is nothing else to find on it. When more than memory
+    requests are waiting, the next ones are spilled to disk.
+
+    Attributes:
+        max_per_host  how many requests can be in flight for the same host
+        delay         the minimum delay between requests to the same host,
+                      robots.txt may ask for a longer one
+        hosts         the state of each host with requests waiting or in
+                      flight
+        robots        the RobotsCache to get the crawl delays from
+        max_pages     how many requests are accepted for each host, None for
+                      no limit
+        priority      a function that ranks a url, higher goes first
+        over_budget   how many requests were refused by the budget
+        pruned        how many requests were dropped by closing their host
+        memory        how many waiting requests are kept in memory, None to
+                      keep them all
+        spill_dir     where the directory for the spilled requests is made,
+                      None for the system's temporary directory
+        path          the directory where the requests are spilled, None
+                      until something is
+        pack          transforms a request into a tuple to be spilled
+        unpack        transforms such a tuple back into a request
+        in_memory     how many waiting requests are in memory
+        spilled       how many requests went to disk
+        journal       what changed on the requests waiting since it was last
+                      emptied, so a checkpoint can save just that, None to
+                      keep nothing. It has ('+', (url, netloc, depth)) for
+                      each request added, ('-', (netloc, digest)) for each
+                      request started and ('x', netloc) for each host closed.
+    """
+
+    def __init__(self, max_per_host=2, delay=0, robots=None, max_pages=None, priority=None, memory=None, spill_dir=None, pack=None, unpack=None):
+        self.max_per_host = max_per_host
+        self.delay = delay
+        self.robots = robots
+        self.max_pages = max_pages
+        self.priority = priority or KeywordPriority()
+        self.over_budget = 0
+        self.pruned = 0
+        self.memory = memory
+        self.spill_dir = spill_dir
+        self.path = None
+        self.pack = pack
+        self.unpack = unpack
+        self.in_memory = 0
+        self.spilled = 0
+        self.journal = None
+        self.hosts = {}
+        self._ready = []
+        self._seq = itertools.count()
+        self._queued = 0
+
+    def __len__(self):
+        return self._queued
+
+    def _spill_path(self):
+        """
+        Gets a new directory for a host to spill its requests to
+        """
+        if self.path is None:
+            self.path = tempfile.mkdtemp(prefix="techscav-frontier-", dir=self.spill_dir)
+        return os.path.join(self.path, str(next(self._seq)))
+
+    def _schedule(self, netloc, host):
+        """
+        Puts a host on the ready heap if it has something that can be started
+        """
+        if not host.scheduled and host.queue and host.in_flight < self.max_per_host:
+            host.scheduled = True
+            heapq.heappush(self._ready, (host.ready_at(), next(self._seq), netloc, host))
+
+    def push(self, request):
+        """
+        Adds a request to be made, returns False if it was refused because
+        its host is over budget or closed
+        """
+        netloc = request.domain.netloc
+        host = self.hosts.get(netloc)
+        if host is None:
+            host = self.hosts[netloc] = Host(self.delay, SpillQueue(None, self.pack, self.unpack))
+        elif host.closed:
+            self.pruned += 1
+            return False
+        if self.max_pages is not None and host.pages >= self.max_pages:
+            self.over_budget += 1
+            return False
+        host.pages += 1
+        host.delay = max(self.delay, request.domain.crawl_delay(self.robots))
+        spill = self.memory is not None and self.in_memory >= self.memory
+        if spill and host.queue.path is None:
+            host.queue.path = self._spill_path()
+        if host.queue.push(request, self.priority(request.url), spill):
+            self.spilled += 1
+        else:
+            self.in_memory += 1
+        self._queued += 1
+        if self.journal is not None:
+            self.journal.append(('+', (request.url, netloc, request.depth)))
+        self._schedule(netloc, host)
+        return True
+
+    def close(self, netloc):
+        """
+        Drops the requests waiting for a host and refuses new ones, the
+        requests in flight still have to be marked as done
+        """
+        host = self.hosts.get(netloc)
+        if host is not None and not host.closed:
+            host.closed = True
+            if self.journal is not None:
+                self.journal.append(('x', netloc))
+            self.pruned += len(host.queue)
+            self._queued -= len(host.queue)
+            self.in_memory -= len(host.queue.memory)
+            host.queue.clear()
+
+    def pop(self, now):
+        """
+        Gets a request that can be started now, or None if there is none
+        """
+        while self._ready and not self._ready[0][3].queue:
+            # left behind by a host that was closed
+            heapq.heappop(self._ready)[3].scheduled = False
+        if not self._ready or self._ready[0][0] > now:
+            return None
+        ready_at, seq, netloc, host = heapq.heappop(self._ready)
+        host.scheduled = False
+        in_memory = len(host.queue.memory)
+        request = host.queue.pop()
+        self.in_memory -= in_memory - len(host.queue.memory)
+        self._queued -= 1
+        host.in_flight += 1
+        host.last_access = now
+        if self.journal is not None:
+            self.journal.append(('-', (netloc, request.digest)))
+        self._schedule(netloc, host)
+        return request
+
+    def done(self, netloc):
+        """
+        Marks a request to a host as finished. Idle hosts are forgotten, the
+        links found on a page are always pushed before it is marked as done,
+        so it returns True when the host has nothing else to be crawled.
+        """
+        host = self.hosts[netloc]
+        host.in_flight -= 1
+        if not host.queue and not host.in_flight:
+            host.queue.clear()
+            del self.hosts[netloc]
+            return True
+        self._schedule(netloc, host)
+        return False
+
+    def retry(self, request):
+        """
+        Puts back a request that was started and will not finish, as if it
+        was never started. Returns False if its host was closed meanwhile,
+        then the request still has to be marked as done.
+        """
+        netloc = request.domain.netloc
+        host = self.hosts[netloc]
+        if host.closed:
+            return False
+        host.in_flight -= 1
+        host.pages -= 1
+        return self.push(request)
+
+    def requests(self):
+        """
+        Iterates over every request waiting
+        """
+        for host in self.hosts.itervalues():
+            for request in host.queue:
+                yield request
+
+    def next_ready(self):
+        """
+        When will the next request be ready to start, None if no request is
+        waiting for a free slot
+        """
+        if self._ready:
+            return self._ready[0][0]
+
+    def cleanup(self):
+        """
+        Removes the requests spilled to disk, once the crawl is over
+        """
+        for host in self.hosts.itervalues():
+            host.queue.clear()
+        if self.path is not None:
+            shutil.rmtree(self.path, True)
+            self.path = None
@@ -0,0 +1,285 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: session.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import struct
+import hashlib
+import logging
+import urlparse
+import functools
+import requests
+from multiprocessing import Lock, RawArray, Value
+from requests.adapters import DEFAULT_POOLBLOCK, HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection, VerifiedHTTPSConnection
+from requests.packages.urllib3.exceptions import ConnectTimeoutError
+from requests.packages.urllib3.poolmanager import PoolManager
+
+
+class DeadHostError(requests.ConnectionError):
+    """
+    A request that was not made since its host could not be connected to a
+    moment ago
+    """
+    pass
+
+
+def connect_failed(error):
+    """
+    Checks if a requests error means the host could not be resolved or
+    connected to, rather than it failing once connected
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+
+class DeadHosts(object):
+    """
+    The hosts that could not be resolved or connected to lately, living in
+    shared memory so every process forked after it was created sees them.
+
+    Each host has a single slot on the table, picked by its hash, holding the
+    hash and when the host comes back to life. A host that lands on a taken
+    slot takes it over, so a host may be forgotten early but is never taken
+    for another.
+
+    Attributes:
+        ttl          how many seconds a host is taken as dead
+        size         the number of slots on the table
+        marked       how many times a host was marked as dead
+    """
+
+    def __init__(self, ttl=300, size=65536):
+        self.ttl = ttl
+        self.size = size
+        self.marked = Value('l', 0)
+        self._keys = RawArray('l', size)
+        self._until = RawArray('d', size)
+        self._lock = Lock()
+
+    def _slot(self, host):
+        if isinstance(host, unicode):
+            host = host.encode('utf-8')
+        key, = struct.unpack('<q', hashlib.md5(host).digest()[:8])
+        return key, key % self.size
+
+    def add(self, host, now=None):
+        """
+        Marks a host as dead for the next ttl seconds
+        """
+        key, slot = self._slot(host)
+        with self._lock:
+            self._keys[slot] = key
+            self._until[slot] = (now or time.time()) + self.ttl
+        with self.marked.get_lock():
+            self.marked.value += 1
+
+    def dead(self, host, now=None):
+        """
+        Checks if a host was marked as dead less than ttl seconds ago
+        """
+        key, slot = self._slot(host)
+        with self._lock:
+            return self._keys[slot] == key and self._until[slot] > (now or time.time())
+
+    def __contains__(self, host):
+        return self.dead(host)
+
+
+class ResolvedConnection(object):
+    """
+    A connection that connects to the address a DNSCache has for its host,
+    resolving it only if there is none. The host is still the one sent on
+    the request and checked against the certificate. How long resolving and
+    connecting took goes to a Metrics.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.dns = kwargs.pop('dns', None)
+        self.metrics = kwargs.pop('metrics', None)
+        super(ResolvedConnection, self).__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        started = time.time()
+        try:
+            return self._connect_to()
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe('connect', time.time() - started)
+
+    def _connect_to(self):
+        addresses = self.dns.get(self.host) if self.dns is not None else None
+        if not addresses:
+            return super(ResolvedConnection, self)._new_conn()
+        host, self.host = self.host, addresses[0]
+        try:
+            return super(ResolvedConnection, self)._new_conn()
+        finally:
+            self.host = host
+
+
+class ResolvedHTTPConnection(ResolvedConnection, HTTPConnection):
+    pass
+
+
+class ResolvedHTTPSConnection(ResolvedConnection, VerifiedHTTPSConnection):
+    pass
+
+
+RESOLVED_CONNECTIONS = {'http': ResolvedHTTPConnection, 'https': ResolvedHTTPSConnection}
+
+
+class ResolvedPoolManager(PoolManager):
+    """
+    A PoolManager whose connections connect to the addresses on a DNSCache,
+    and are timed on a Metrics
+    """
+
+    def __init__(self, dns, metrics=None, **kwargs):
+        self.dns = dns
+        self.metrics = metrics
+        super(ResolvedPoolManager, self).__init__(**kwargs)
+
+    def _new_pool(self, scheme, host, port):
+        pool = super(ResolvedPoolManager, self)._new_pool(scheme, host, port)
+        if (self.dns is not None or self.metrics is not None) and scheme in RESOLVED_CONNECTIONS:
+            pool.ConnectionCls = functools.partial(RESOLVED_CONNECTIONS[scheme], dns=self.dns, metrics=self.metrics)
+        return pool
+
+
+class PoolAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that counts, on the SessionPool it belongs to, every
+    request sent and those sent on a connection that was already open. A
+    connection is reused when it still has the socket it had on its last
+    request, one closed already is not.
+    """
+
+    def __init__(self, counters, **kwargs):
+        self.counters = counters
+        super(PoolAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=DEFAULT_POOLBLOCK, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = ResolvedPoolManager(self.counters.dns, self.counters.metrics, num_pools=connections,
+                                               maxsize=maxsize, block=block, strict=True, **pool_kwargs)
+
+    def send(self, request, **kwargs):
+        response = super(PoolAdapter, self).send(request, **kwargs)
+        conn = getattr(response.raw, '_connection', None)
+        sock = getattr(conn, 'sock', None)
+        self.counters.sent(sock is not None and getattr(conn, '_last_sock', None) is sock)
+        if sock is not None:
+            conn._last_sock = sock
+        return response
+
+
+class SessionPool(object):
+    """
+    The keep-alive connections of a worker process: a requests Session whose
+    adapter keeps a few connections open to each of many hosts, so the pages
+    of a domain are fetched on the connection of the one before. The session
+    is made on the first request of each process, since connections can not
+    be shared with the processes forked after they were opened.
+
+    Hosts that could not be resolved or connected to are marked on a
+    DeadHosts shared among processes, and the requests to them fail right
+    away, with a DeadHostError, until it forgets them. Hosts already
+    resolved on a DNSCache are connected to without resolving them again.
+
+    Attributes:
+        hosts        how many hosts keep their connections open
+        per_host     how many connections are kept open to each host
+        timeout      how many seconds to wait to connect and for each read
+        dead         the DeadHosts shared among processes, None to always
+                     try every host
+        dns          the DNSCache of the hosts resolved ahead, None to
+                     resolve every host when connecting
+        metrics      the Metrics connecting is timed on, None to not time it
+        requests     how many requests were sent, shared among processes
+        reused       how many of them went on a connection already open
+        fast_failed  how many requests failed because their host was dead
+    """
+
+    def __init__(self, hosts=1000, per_host=2, timeout=10, dead_ttl=300, dead_size=65536, dns=None, metrics=None):
+        self.hosts = hosts
+        self.per_host = per_host
+        self.timeout = timeout
+        self.dead = DeadHosts(dead_ttl, dead_size) if dead_ttl else None
+        self.dns = dns
+        self.metrics = metrics
+        self.requests = Value('l', 0)
+        self.reused = Value('l', 0)
+        self.fast_failed = Value('l', 0)
+        self._session = None
+        self._pid = None
+
+    def session(self):
+        """
+        Gets the session of this process
+        """
+        if self._pid != os.getpid():
+            self._session = requests.Session()
+            adapter = PoolAdapter(self, pool_connections=self.hosts, pool_maxsize=self.per_host)
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+            self._pid = os.getpid()
+        return self._session
+
+    def sent(self, reused):
+        """
+        Counts a request sent, and whether it reused a connection
+        """
+        with self.requests.get_lock():
+            self.requests.value += 1
+        if reused:
+            with self.reused.get_lock():
+                self.reused.value += 1
+
+    def get(self, url, **kwargs):
+        """
+        Makes a GET request, the arguments are the ones of requests.get
+        """
+        host = urlparse.urlsplit(url).netloc.lower()
+        if self.dead is not None and self.dead.dead(host):
+            with self.fast_failed.get_lock():
+                self.fast_failed.value += 1
+            raise DeadHostError("%s is not reachable" % host)
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            return self.session().get(url, **kwargs)
+        except requests.ConnectionError as e:
+            if self.dead is not None and connect_failed(e):
+                failed = e.request.url if e.request is not None else url
+                logging.debug("Could not connect to %s, failing its requests for %ds" % (failed, self.dead.ttl))
+                self.dead.add(urlparse.urlsplit(failed).netloc.lower())
+            raise
+
+    def close(self):
+        """
+        Closes the connections of this process
+        """
+        if self._pid == os.getpid():
+            self._session.close()
+            self._session = None
+            self._pid = None
+
+    def log_stats(self):
+        """
+        Logs how many connections were reused and requests failed fast
+        """
+        logging.info("Sent %d request(s), %d on a connection already open, %d failed fast on a dead host" %
+                     (self.requests.value, self.reused.value, self.fast_failed.value))
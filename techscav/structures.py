@@ -10,21 +10,38 @@
 # Author: Artur Ventura
 #
 
+import os
 import time
 import random
 import re
-import requests
 import threading
 import json
 import logging
 import robotparser
 import urlparse
 from subprocess import Popen, PIPE
-from multiprocessing import Process, JoinableQueue, cpu_count, Manager as mgmt
-from bs4 import BeautifulSoup
+from multiprocessing import Process, Queue, JoinableQueue, Value, cpu_count
+from multiprocessing.queues import SimpleQueue
+from Queue import Empty
 from functools import reduce
 
-import hashlib
+import codecs
+import itertools
+import functools
+from collections import OrderedDict
+
+from matcher import HostMatcher, PropertyMatcher
+from dedup import SharedBloomFilter
+from scheduler import HostScheduler
+from robots import RobotRules, RobotsCache
+from renderer import RendererPool, resource_extensions
+from links import LINK_EXTRACTORS
+from concurrency import cpu_seconds
+from escalation import EscalationPolicy
+from body import Body, ContentCache, fingerprint
+from canonical import url_digest
+from session import SessionPool
+from metrics import Metrics, error_type
 
 def _gen_random_sha():
     """
@@ -41,24 +58,32 @@ class Domain(object):
         netloc      the domain name
         useragent   the useragent to use
         re          a regular expression that matches with this domain
+        scope       the compiled "re", to filter the links to follow
         depth       how deep should we search this location
         use_robots  should we use robots.txt
+        id          the number the manager knows this domain by, requests
+                    refer to it by this number when sent to another process
     """
-    def __init__(self, netloc, useragent="*", use_robots=True, depth=1):
+    def __init__(self, netloc, useragent="*", use_robots=True, depth=1, id=None):
+        self.id = id
         self.netloc = netloc
         self.useragent = useragent
         self.use_robots = use_robots
         self.re = "[.\\/]" + re.escape(netloc)
+        self.scope = re.compile(self.re)
         self.depth = depth
         if self.use_robots:
-            self._robots = robotparser.RobotFileParser()
+            self._robots = RobotRules()
             self._robots.set_url("http://%s/robots.txt" % self.netloc)
 
-    def can_i_visit(self, url):
+    def can_i_visit(self, url, robots=None):
         """
-        Checks if this url can be visisted?
+        Checks if this url can be visisted? The rules come from a RobotsCache
+        if one is given.
         """
-        if self.use_robots:
+        if self.use_robots and robots is not None:
+            return robots.can_fetch(self.netloc, self.useragent, url)
+        elif self.use_robots:
             if self._robots and self._robots.mtime() == 0:
                 try:
                     self._robots.read()
@@ -71,6 +96,16 @@ class Domain(object):
         else:
             return True
 
+    def crawl_delay(self, robots=None):
+        """
+        Gets the crawl delay robots.txt asks for, if it was already read
+        """
+        if self.use_robots and robots is not None:
+            return robots.crawl_delay(self.netloc, self.useragent)
+        elif self.use_robots and self._robots and self._robots.mtime():
+            return self._robots.crawl_delay(self.useragent) or 0
+        return 0
+
 
 class Property(object):
     """
@@ -106,146 +141,569 @@ class Property(object):
         return properties
 
 
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+
+
 class SimpleChecker(object):
     """
     Makes a request to a URL and checks the RAW source HTML source code for the
     presence of links to domains in any of the web properties we are searching
 
+    The body is read in chunks and matched as it arrives. Reading stops once
+    every property was found, unless the links of the page are still needed,
+    or after max_bytes. Responses that are not HTML are not read at all.
+
+    Pages in an ASCII compatible encoding, which is almost all of them, are
+    matched and parsed as bytes, and only decoded if their text is needed.
+    When links are followed, their hosts are matched too. A body already
+    analysed, by its fingerprint, reuses the links extracted from it.
+    Pages are fetched on the keep-alive connections of a SessionPool. With a
+    PageCache, pages fetched on an earlier run are asked for only if they
+    changed, and the ones that did not reuse what was found on them then.
+
     Attributes:
         properties   a dict of "Property" by key
+        matcher      a "PropertyMatcher" for all the properties
+        hosts        a "HostMatcher" for all the properties
+        max_bytes    how many bytes of a page are read, None for no limit
+        chunk_size   how many bytes are read at a time
+        content_types  the content types that are read, None for every type
+        skipped      how many pages were not read because of their type
+        truncated    how many pages were cut at max_bytes
+        stopped      how many pages stopped being read once every property
+                     was found
+        extractor    how links are found on a page, one of LINK_EXTRACTORS
+        cache        the ContentCache of what was found on the bodies already
+                     analysed
+        http         the SessionPool pages are fetched with
+        pages        the PageCache of the pages fetched on earlier runs, None
+                     to always fetch them whole
+        metrics      the Metrics the time of each stage of a page goes to
 
     """
 
-    def __init__(self, properties):
+    def __init__(self, properties, max_bytes=2097152, chunk_size=16384, content_types=HTML_TYPES, links='lxml', cache_size=1000, http=None, pages=None, metrics=None):
         self.properties = properties
+        self.matcher = PropertyMatcher(properties)
+        self.hosts = HostMatcher(properties)
+        self.extractor = LINK_EXTRACTORS[links]()
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.content_types = tuple(content_types) if content_types is not None else None
+        self.skipped = Value('l', 0)
+        self.truncated = Value('l', 0)
+        self.stopped = Value('l', 0)
+        self.cache = ContentCache(cache_size)
+        self.metrics = metrics or Metrics()
+        self.http = http or SessionPool(metrics=self.metrics)
+        self.pages = pages
+        self._keys = dict((p.name, key) for key, p in properties.items())
 
     def get_all_links(self, content):
         """
         Gets all the links from a webpage
         """
-        soup = BeautifulSoup(content, 'html.parser')
-        return filter(lambda x: x, map(lambda x: x.get('href'), soup.find_all('a')))
+        return self.extractor.extract(content)[1]
 
-    def check(self, request, manager):
+    def extract(self, text, encoding=None, fingerprint=None):
         """
-        Makes a request to a URL and checks for links with domains of the web
-        properties we are searching
+        Gets the <base href> and the links of a page, from the cache if a
+        body with the same fingerprint was parsed before
+        """
+        if fingerprint is None:
+            return self.extractor.extract(text, encoding)
+        hrefs = self.cache.get(fingerprint, 'links')
+        if hrefs is None:
+            hrefs = self.extractor.extract(text, encoding)
+            self.cache.put(fingerprint, 'links', hrefs)
+        else:
+            self.metrics.count('content_cache_hits')
+        return hrefs
+
+    def resolve_links(self, url, text, encoding=None, fingerprint=None):
+        """
+        Gets every http(s) link of a page as an absolute url. Relative links
+        are resolved against the <base href> of the page if it has one. The
+        page can be bytes in the encoding given.
+        """
+        links = []
+        base, hrefs = self.extract(text, encoding, fingerprint)
+        if base:
+            url = urlparse.urljoin(url, base.strip())
+        for link in hrefs:
+            link = link.strip()
+            if link.startswith("//"):
+                link = "http:" + link
+
+            if not link.startswith("http:"):
+                link = urlparse.urljoin(url, link)
+                if not link.startswith(("http:", "https:")):
+                    # javascript:, mailto: and the like
+                    continue
+
+            links.append(link)
+        return links
+
+    def in_scope(self, request, links):
+        """
+        Keeps only the links to the domain being searched
+        """
+        scope = request.domain.scope
+        return [link for link in links if scope.search(link)]
+
+    def follow_links(self, request, url, text, encoding=None):
+        """
+        Gets the links of a page that should be crawled next
+        """
+        if request.depth > 1:
+            return self.in_scope(request, self.resolve_links(url, text, encoding))
+        return []
+
+    def page_links(self, request, url, text, encoding=None, fingerprint=None):
+        """
+        Gets the properties whose hosts a page links to and the links that
+        should be crawled next, nothing if links are not followed
+        """
+        if request.depth > 1:
+            started = time.time()
+            links = self.resolve_links(url, text, encoding, fingerprint)
+            linked, links = self.hosts.match(links), self.in_scope(request, links)
+            self.metrics.observe('links', time.time() - started)
+            return linked, links
+        return set(), []
+
+    def find_properties(self, request, text):
+        """
+        Gets the keys of the properties referenced by a text
+        """
+        return self.report_properties(request, self.matcher.match(text))
+
+    def report_properties(self, request, keys):
+        """
+        Logs the properties found on a page
         """
         result = []
+        for key in keys:
+            logging.debug("Found %s property on %s " % (self.properties[key].name, request.url))
+            result.append(key)
+        return result
+
+    def parse(self, request, url, text):
+        """
+        Checks a page already fetched, returns the properties found and the
+        links to be crawled next. A page whose content was already checked
+        is not matched or parsed again.
+        """
+        key = fingerprint(text)
+        found = self.cache.get(key, 'found')
+        if found is None:
+            started = time.time()
+            found = self.matcher.match(text)
+            self.metrics.observe('match', time.time() - started)
+            self.cache.put(key, 'found', found)
+        else:
+            self.metrics.count('content_cache_hits')
+        linked, links = self.page_links(request, url, text, fingerprint=key)
+        return self.report_properties(request, found | linked), links
+
+    def queue_links(self, request, links, manager):
+        """
+        Adds the links found on a page to the manager's queue
+        """
+        for link in links:
+            if request.domain.can_i_visit(link, manager.robots):
+                manager.add_new_request(Request(link, request.domain, request.depth - 1))
+
+    def redirected(self, request, url, manager):
+        """
+        Tells the manager the url a request ended on, so a redirect target is
+        not crawled again
+        """
+        if manager is not None and url and url != request.url:
+            manager.add_redirect(request, url)
+
+    def close(self):
+        """
+        Frees whatever the checker holds, called when a worker stops
+        """
+        self.http.close()
+
+    def log_stats(self):
+        """
+        Logs what the checker counted
+        """
+        logging.info("%d page(s) skipped by content type, %d cut at %s bytes, %d stopped once everything was found" %
+                     (self.skipped.value, self.truncated.value, self.max_bytes, self.stopped.value))
+        logging.info("Content cache: %d hit(s), %d miss(es)" % (self.cache.hits.value, self.cache.misses.value))
+        self.http.log_stats()
+        if self.pages is not None:
+            logging.info("Page cache: %d page(s) not modified and served from the cache, %d stored, %d evicted" %
+                         (self.pages.served.value, self.pages.stored.value, self.pages.evicted.value))
+
+    def _count(self, value):
+        with value.get_lock():
+            value.value += 1
+
+    def wanted(self, response):
+        """
+        Checks if a response should be read, by its content type
+        """
+        kind = response.headers.get('content-type')
+        if self.content_types is None or not kind:
+            return True
+        return kind.split(';', 1)[0].strip().lower() in self.content_types
+
+    def scan(self, request, response, keep=False, started=None):
+        """
+        Reads a response in chunks, matching them as they arrive. Returns the
+        properties found and the Body read, which is only kept if its links
+        are needed or keep is set. The chunks are matched as bytes when the
+        encoding of the page allows it, decoded otherwise. The time spent
+        decoding and matching is taken from the download, which started when
+        the request was sent.
+        """
+        started = started or time.time()
+        decoding = matching = 0
+        follow = request.depth > 1
+        keep = keep or follow
+        scanner = self.matcher.scanner()
+        body = Body('', response.encoding)
+        decoder = None
+        if not (body.ascii and self.matcher.ascii):
+            decoder = codecs.getincrementaldecoder(body.encoding)(errors='replace')
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(self.chunk_size):
+            if self.max_bytes is not None:
+                chunk = chunk[:self.max_bytes - size]
+            size += len(chunk)
+            text = chunk
+            now = time.time()
+            if decoder is not None:
+                text = decoder.decode(chunk)
+                decoding += time.time() - now
+                now = time.time()
+            scanner.feed(text)
+            matching += time.time() - now
+            if keep:
+                chunks.append(chunk)
+            if scanner.complete and not follow:
+                self._count(self.stopped)
+                break
+            if self.max_bytes is not None and size >= self.max_bytes:
+                logging.debug("Stopped reading %s after %d bytes" % (request.url, size))
+                self._count(self.truncated)
+                break
+        if decoder is not None:
+            scanner.feed(decoder.decode('', True))
+            self.metrics.observe('decode', decoding)
+        self.metrics.observe('match', matching)
+        self.metrics.observe('download', time.time() - started - decoding - matching)
+        self.metrics.count('bytes', size)
+        body.raw = "".join(chunks)
+        return scanner.found, body
+
+    def fetch(self, request, keep=False, cached=None):
+        """
+        Makes a request to a URL and scans it, returns its final url, the
+        properties found, the Body kept and the headers, or None if there is
+        nothing to check. The request is conditional if the page was cached,
+        and if it was not modified there is no properties or Body.
+        """
+        started = time.time()
         try:
             logging.debug("Making request into %s" % request.url)
-            r = requests.get(request.url, timeout=10)
-        except:
+            r = self.http.get(request.url, stream=True, headers=cached.headers() if cached else None)
+        except Exception as e:
             logging.debug("Some error happened, ignoring")
-            return result
-        text = r.text
-        if request.depth > 1:
-            
-            a = self.get_all_links(text)
-            for link in a:
-                if link.startswith("//"):
-                    link = "http:" + link
+            self.metrics.error(error_type(e))
+            return None
+        try:
+            if cached and r.status_code == 304:
+                logging.debug("%s was not modified" % request.url)
+                self.metrics.observe('download', time.time() - started)
+                return r.url, None, None, r.headers
+            if not self.wanted(r):
+                logging.debug("Skipping %s, it is %s" % (request.url, r.headers.get('content-type')))
+                self._count(self.skipped)
+                self.metrics.observe('download', time.time() - started)
+                return None
+            found, body = self.scan(request, r, keep, started)
+        finally:
+            r.close()
+        return r.url, found, body, r.headers
 
-                if link.startswith("javascript:"):
-                    continue
+    def cached(self, request):
+        """
+        Gets the page cached for a request if it can stand for it: it has
+        its links if they are needed
+        """
+        if self.pages is None:
+            return None
+        page = self.pages.get(request.digest)
+        if page is not None and (page.links is not None or request.depth <= 1):
+            return page
 
-                if not link.startswith("http:"):
-                    link = urlparse.urljoin(r.url, link)
-                elif not re.search(request.domain.re, link):
-                    continue
-                
-                r = Request(link, request.domain, request.depth - 1)
-                
-                if request.domain.can_i_visit(link):
-                    manager.add_new_request(r)
+    def from_cache(self, request, page):
+        """
+        Gets the properties and links of a page that was not modified
+        """
+        self.pages.revalidated(request.digest)
+        self.metrics.count('page_cache_hits')
+        found = [self._keys[name] for name in page.found if name in self._keys]
+        return self.report_properties(request, found), page.links or []
 
-        for p in self.properties.values():
-            if re.search(p.re, text):
-                logging.debug("Found %s property on %s " % (p.name, r.url))
-                result.append(p.key)
+    def store(self, request, url, headers, result, links):
+        """
+        Caches what was found on a page, if it can be asked later whether it
+        changed
+        """
+        etag, modified = headers.get('etag'), headers.get('last-modified')
+        if self.pages is not None and (etag or modified):
+            self.pages.put(request.digest, url, etag, modified, [self.properties[k].name for k in result],
+                           links if request.depth > 1 else None)
 
+    def check(self, request, manager):
+        """
+        Makes a request to a URL and checks for links with domains of the web
+        properties we are searching
+        """
+        cached = self.cached(request)
+        page = self.fetch(request, cached=cached)
+        if page is None:
+            return []
+        url, found, body, headers = page
+        self.redirected(request, url, manager)
+        if body is None:
+            result, links = self.from_cache(request, cached)
+        else:
+            linked, links = self.page_links(request, url, *body.markup(), fingerprint=body.fingerprint)
+            result = self.report_properties(request, found | linked)
+            self.store(request, url, headers, result, links)
+        self.queue_links(request, links, manager)
         return result
 
 
 class PhantomJSChecker(SimpleChecker):
     """
-    Forks into PhantomJS with a URL to visit, gets the output of that execution,
-    that contains not only the content but also the network monitoring for that 
-    page.
+    Sends the URL to visit to a long lived PhantomJS renderer, and gets back
+    not only the content but also the network monitoring for that page.
 
     Attributes:
         properties   a dict of "Property" by key
-        properties   a dict of "Property" by key
+        binary       the location of the PhantomJS binary
+        command      the command that starts a renderer
+        pool_size    how many renderers each process can have
+        max_pages    how many pages a renderer renders before being replaced
+        max_memory   the resident memory in KB that gets a renderer replaced
+        render_timeout  how many seconds a renderer can take before being
+                     killed
+        block        the resource types (image, font, media, stylesheet) or
+                     extensions whose url is recorded but never downloaded
+        render_budget  how many seconds a page has before whatever was
+                     loaded is used, None for no budget
+        rendered     how many pages were rendered, shared among processes
+        blocked      how many resources were not downloaded
+        partial      how many pages ran out of budget
     """
 
-    def __init__(self, properties, binary):
-        super(PhantomJSChecker, self).__init__(properties)
+    def __init__(self, properties, binary, command=None, pool_size=1, max_pages=100, max_memory=None, render_timeout=30, block=None, render_budget=None, metrics=None):
+        super(PhantomJSChecker, self).__init__(properties, metrics=metrics)
         self.binary = binary
+        self.block = resource_extensions(block or [])
+        self.render_budget = render_budget
+        self.command = list(command or ['/usr/bin/env', 'node', binary, 'pjs.js'])
+        if self.block:
+            self.command.append("--block=%s" % ",".join(self.block))
+        if render_budget:
+            self.command.append("--budget=%d" % (render_budget * 1000))
+            render_timeout = max(render_timeout, render_budget + 5)
+        self.pool_size = pool_size
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        self.render_timeout = render_timeout
+        self.rendered = Value('l', 0)
+        self.blocked = Value('l', 0)
+        self.partial = Value('l', 0)
+        self._pool = None
+        self._pid = None
+
+    def pool(self):
+        """
+        Gets the renderers of this process, they are not shared with the
+        processes forked after they started
+        """
+        if self._pid != os.getpid():
+            self._pool = RendererPool(self.command, self.pool_size, self.max_pages,
+                                      self.max_memory, self.render_timeout)
+            self._pid = os.getpid()
+        return self._pool
+
+    def close(self):
+        """
+        Stops the renderers of this process
+        """
+        if self._pid == os.getpid():
+            self._pool.close()
+
+    def log_stats(self):
+        """
+        Logs how many resources were blocked and pages ran out of budget
+        """
+        logging.info("Rendered %d page(s), blocked %d resource(s), %d page(s) ran out of budget" %
+                     (self.rendered.value, self.blocked.value, self.partial.value))
 
     def check(self, request, manager):
         """
-        Forks into PhantomJS, makes a request to a URL and checks for links 
-        with domains of the web properties we are searching
+        Renders a page on PhantomJS and checks for links with domains of the
+        web properties we are searching
         """
-        logging.debug("Forking into Phantom for request into %s" % request.url)
+        logging.debug("Rendering %s on Phantom" % request.url)
+        started = time.time()
         try:
-            process = Popen(['/usr/bin/env', 'node', self.binary, 'pjs.js', request.url], stdout=PIPE, stderr=PIPE)
-            stdout, stderr = process.communicate()
-            result = []
-            data = json.loads(stdout)
+            data = self.pool().render(request.url)
         except:
             logging.debug("Some error happened, ignoring")
+            self.metrics.error('render')
             return []
-        text = data['content']
-        if request.depth > 1:
-            
-            a = self.get_all_links(text)
-            for link in a:
-                if link.startswith("//"):
-                    link = "http:" + link
+        self.metrics.observe('render', time.time() - started)
+        with self.rendered.get_lock():
+            self.rendered.value += 1
+        if data.get('blocked'):
+            logging.debug("Blocked %d resource(s) on %s" % (data['blocked'], request.url))
+            with self.blocked.get_lock():
+                self.blocked.value += data['blocked']
+        if data.get('partial'):
+            logging.debug("Render budget ran out on %s" % request.url)
+            with self.partial.get_lock():
+                self.partial.value += 1
+        self.redirected(request, data['url'], manager)
+        result, links = self.parse(request, data['url'], data['content'])
+        self.queue_links(request, links, manager)
+        for key in self.hosts.match(data['urls']).difference(result):
+            logging.debug("Found some %s property on %s " % (self.properties[key].name, request.url))
+            result.append(key)
+        return result
 
-                if link.startswith("javascript:"):
-                    continue
 
-                if not link.startswith("http:"):
-                    link = urlparse.urljoin(data['url'], link)
-                elif not re.search(request.domain.re, link):
-                    continue
-                
-                r = Request(link, request.domain, request.depth - 1)
-                
-                if request.domain.can_i_visit(link):
-                    manager.add_new_request(r)
-        for key, p in self.properties.items():
-            if re.search(p.re, text):
-                logging.debug("Found some %s property on %s " % (p.name, request.url))
-                result.append(p.key)
-        for url in data['urls']:
-            for key, p in self.properties.items():
-                if re.search(p.re, url):
-                    logging.debug("Found some %s property on %s " % (p.name, request.url))
-                    result.append(p.key)
+class TieredChecker(SimpleChecker):
+    """
+    Checks every page like the SimpleChecker, and renders on PhantomJS only
+    the pages where nothing was found and that look like their content is
+    built by scripts, so most pages cost a plain request.
+
+    Attributes:
+        renderer     the PhantomJSChecker escalated pages are rendered on
+        policy       the EscalationPolicy that decides which pages go to it
+        checked      how many pages were checked, shared among processes
+        escalated    how many pages were rendered
+    """
+
+    def __init__(self, properties, renderer, policy=None, **kwargs):
+        super(TieredChecker, self).__init__(properties, **kwargs)
+        self.renderer = renderer
+        self.policy = policy or EscalationPolicy()
+        self.checked = Value('l', 0)
+        self.escalated = Value('l', 0)
+
+    def close(self):
+        """
+        Closes the connections and stops the renderers of this process
+        """
+        super(TieredChecker, self).close()
+        self.renderer.close()
+
+    def log_stats(self):
+        """
+        Logs how many pages were escalated, and what each checker counted
+        """
+        logging.info("Escalated %d of %d page(s) to PhantomJS" % (self.escalated.value, self.checked.value))
+        super(TieredChecker, self).log_stats()
+        self.renderer.log_stats()
+
+    def check(self, request, manager):
+        """
+        Checks a page with a plain request, and renders it if nothing was
+        found and the policy says so
+        """
+        cached = self.cached(request)
+        page = self.fetch(request, keep=True, cached=cached)
+        if page is None:
+            return []
+        self._count(self.checked)
+        url, found, body, headers = page
+        self.redirected(request, url, manager)
+        if body is None:
+            result, links = self.from_cache(request, cached)
+            self.queue_links(request, links, manager)
+            return result
+        linked, links = self.page_links(request, url, *body.markup(), fingerprint=body.fingerprint)
+        found = found | linked
+        if not found:
+            reason = self.policy.escalate(body)
+            if reason:
+                logging.debug("Rendering %s, %s" % (request.url, reason))
+                self._count(self.escalated)
+                return self.renderer.check(request, manager)
+        result = self.report_properties(request, found)
+        self.store(request, url, headers, result, links)
+        self.queue_links(request, links, manager)
         return result
 
 
 class Request(object):
     """
-    A request to a url.
+    A request to a url. Requests are sent to other processes packed as a
+    tuple, with the id of their domain in place of the domain itself.
 
     Attributes:
         url          the url that needs to be searched
         domain       the domain where this request comes from
         depth        the domain where this is being searched
-        digest       an hash of the url for easier cashing
+        digest       the MD5 of the canonical form of the url, which is how
+                     the filter of visited urls knows it
     """
 
-    def __init__(self, url, domain, depth):
+    __slots__ = ('url', 'domain', 'depth', 'digest')
+
+    def __init__(self, url, domain, depth, digest=None):
         self.url = url
         self.domain = domain
         self.depth = depth
-        m = hashlib.md5()
-        m.update(url)
-        self.digest = m.digest()
+        if digest is None:
+            digest = url_digest(url)
+        self.digest = digest
+
+    def pack(self):
+        """
+        Gets the request as a tuple of the domain id, url, depth and digest
+        """
+        return (self.domain.id, self.url, self.depth, self.digest)
+
+
+def pack_requests(requests):
+    """
+    Packs requests to be sent to another process, each domain goes once
+    """
+    domains = {}
+    for r in requests:
+        domains[r.domain.id] = r.domain.netloc
+    return domains, [r.pack() for r in requests]
+
+
+def unpack_requests(message, registry, **kwargs):
+    """
+    Unpacks requests packed by pack_requests, reusing the domains already on
+    registry, so their state is kept from one request to the next. The
+    domains missing are made with kwargs and kept there.
+    """
+    domains, rows = message
+    if len(registry) + len(domains) > 10000:
+        registry.clear()
+    for id, netloc in domains.iteritems():
+        if id not in registry:
+            registry[id] = Domain(netloc, id=id, **kwargs)
+    return [Request(url, registry[id], depth, digest) for id, url, depth, digest in rows]
 
 
 class DomainsFile(object):
@@ -275,29 +733,38 @@ class DomainsFile(object):
         self.nr += 1
         return domain
 
+    def skip(self, n):
+        """
+        Skips the first n domains, already read by an earlier run
+        """
+        while self.nr < n and self.fetch_new_domain():
+            pass
+
 
 def work(process, manager):
     """
-    A multiprocess worker. It just fetches requests to be made and executes them
+    A multiprocess worker. It just fetches requests to be made and executes
+    them, until the manager tells it to stop
     """
-    tries = 3
-    while True:        
-        req = manager.fetch_new_request()
-
-        if not req:
-            if tries:
-                logging.debug("Did not found anything to do, %s waiting a little" % process)
-                tries -= 1
-                time.sleep(5)
-                continue
-            else:
-                logging.debug("Nothing else to do, %s dying" % process)
-                break
-        else:
-            tries = 3
-        res = manager.checker.check(req, manager)
-        if res:
-            manager.domains[req.domain.netloc] = res
+    while True:
+        batch = manager.fetch_new_requests()
+        if batch is None:
+            logging.debug("Nothing else to do, %s dying" % process)
+            manager.checker.close()
+            manager.queue.task_done()
+            break
+        manager.hold(batch)
+        for req in batch:
+            res = []
+            manager.making(req)
+            try:
+                res = manager.checker.check(req, manager)
+            except:
+                logging.debug("Some error happened on %s, ignoring" % req.url)
+                manager.metrics.error('check')
+            finally:
+                manager.metrics.count('pages')
+                manager.task_done(req, res)
         manager.queue.task_done()
 
 
@@ -308,48 +775,219 @@ class Manager(object):
 
     Attributes:
         queue       The shared data structure among processes, where we push 
-                    requests to be made and each process pops one and does it.
+                    batches of requests to be made and each process pops one
+                    and does them.
         smp         number of processes to be spawn
         checker     an instance of a type of checking algorithm
-        domains     the results for the domains where we found other services
+        domains     the results for the domains where we found other services,
+                    only kept when there is no writer
+        statuses    why the domains that could not be crawled were not, only
+                    kept when there is no writer
+        writer      a ResultWriter that gets each domain once it is done
+        results     the properties found so far on the domains being crawled
         properties  the properties to searched
         useragent   the useragent to use
         use_robots  should the crawler be restricted to the rules of robots.txt
         depth       how deep should we go while searching a domain
-        hits        a cache of previously visited urls
+        hits        a filter of previously visited urls, shared among processes,
+                    by the digest of their canonical form. The urls pages were
+                    redirected to are added too. Workers only look at it, the
+                    main process adds to it, so it always agrees with the
+                    scheduler when checkpointed.
+        pending     the number of requests waiting or being made
+        events      the queue where workers send each request they finished,
+                    along with the requests they found on it
+        scheduler   the per host scheduler of the requests waiting
+        dispatched  the number of requests sent to the workers and not done
+        active      the requests sent to the workers and not done, by digest
+        taken       the queue where workers send the digests of each batch
+                    they take, and of each request they start. It is
+                    written right away, unlike events, so it is not lost
+                    when a worker dies.
+        held        the digests of the requests each worker took and are
+                    not done, by the pid of the worker, so the requests of
+                    a worker that died can be taken back
+        holders     the pid of the worker each of those requests went to,
+                    by digest
+        current     the digest of the request each worker started last, by
+                    the pid of the worker
+        batch_size  how many requests can go to a worker at once
+        registry    the domains by id. The manager registers every domain it
+                    reads, workers add the ones they get requests for.
+        max_pages   how many pages of a domain are crawled, None for no limit.
+                    The pages are picked best first, and a domain is not
+                    crawled any further once every property was found on it.
+        controller  an AIMDController that adapts how many requests are sent
+                    to the workers, None to always send as many as they can
+                    take
+        frontier_size  how many hosts we try to keep on the scheduler, so
+                    there is always some host ready to be visited
+        frontier_memory  how many waiting requests the scheduler keeps in
+                    memory before spilling the next ones to spill_dir, None
+                    to keep them all
+        robots      the RobotsCache shared among processes, None if robots.txt
+                    is not used
+        checkpoint  the Checkpoint where the state is saved every so often,
+                    None to never save it. Between whole saves only what
+                    changed is saved, which the filter of visited urls and
+                    the scheduler keep journals of.
+        restored    the domains restored from a checkpoint whose robots.txt
+                    is fetched once the workers are started, since that
+                    starts the threads of the RobotsCache
+        resolver    the DomainResolver that resolves the domains before they
+                    are crawled, None to let the fetches resolve them. The
+                    domains that do not resolve are written as unresolvable.
+        resolving   the domains waiting for their addresses, by id
+        homepages   the domains started last, by the digest of their first
+                    page, so a domain listed twice is written once and one
+                    whose first page is the one of another, such as
+                    www.foo.com and foo.com, is written as a duplicate of it
+        metrics     the Metrics the workers add to, how long each request
+                    waited on the queue and how many pages were done, the
+                    checker should be given the same
     """
 
-    def __init__(self, domainsFile, properties, smp, checker, useragent="*", use_robots=True, depth=1):
+    HOMEPAGES = 100000
+
+    def __init__(self, domainsFile, properties, smp, checker, useragent="*", use_robots=True, depth=1, dedup_capacity=1000000, frontier_size=None, max_per_host=2, host_delay=0, robots_cache=None, robots_ttl=86400, writer=None, checkpoint=None, batch_size=4, controller=None, max_pages=None, priority=None, frontier_memory=None, spill_dir=None, resolver=None, metrics=None):
         self.queue = JoinableQueue()
+        self.events = Queue()
+        self.pending = Value('l', 0, lock=False)
+        self.robots = RobotsCache(robots_cache, robots_ttl) if use_robots else None
+        self.scheduler = HostScheduler(max_per_host, host_delay, self.robots, max_pages, priority,
+                                       frontier_memory, spill_dir, Request.pack, self.unpack_request)
+        self.dispatched = 0
+        self.active = {}
+        self.taken = SimpleQueue()
+        self.held = {}
+        self.holders = {}
+        self.current = {}
+        self.batch_size = batch_size
+        self.registry = {}
+        self._ids = itertools.count(1)
+        self._children = []
+        self._redirects = []
+        self.controller = controller
+        self._cpu = None
+        self.frontier_size = frontier_size or smp * 4
         self.domainsFile = domainsFile
         self.smp = smp
         self.checker = checker
-        self.domains = mgmt().dict()
+        self.domains = {}
+        self.statuses = {}
+        self.writer = writer
+        self.results = {}
         self.properties = properties
         self.useragent = useragent
         self.use_robots = use_robots
         self.depth = depth
-        self.hits = set()
+        self.hits = SharedBloomFilter(dedup_capacity)
+        self.checkpoint = checkpoint
+        self.resolver = resolver
+        self.resolving = {}
+        self.homepages = OrderedDict()
+        self.metrics = metrics or Metrics()
+        self.restored = []
+        self._written = None
+        if checkpoint:
+            self.hits.journal = []
+            self.scheduler.journal = []
+            self._written = []
 
     def add_new_request(self, request):
         """
-        Adds a new request to the queue of requests
+        Keeps a new request found by a worker, unless it was already seen. It
+        is sent to the scheduler along with the request it was found on.
         """
         if request.digest not in self.hits:
             logging.debug("Addding request to queue %s d: %d" % (request.url, request.depth))
-            self.queue.put(request)
-            self.hits.add(request.digest)
+            self._children.append(request.pack())
         else:
             logging.debug("Cache hit %s d: %d" % (request.url, request.depth))
 
-    def fetch_new_request(self):
+    def add_redirect(self, request, url):
         """
-        Gets a request from the queue
+        Keeps the url a request was redirected to, so it is not crawled again.
+        It is sent to the main process along with the request.
         """
-        try:
-            return self.queue.get(True, 1)
-        except:
-            return None
+        digest = url_digest(url)
+        if digest != request.digest and digest not in self.hits:
+            logging.debug("Redirected from %s to %s" % (request.url, url))
+            self._redirects.append(digest)
+
+    def fetch_new_requests(self):
+        """
+        Gets a batch of requests from the queue, blocking until there is one.
+        None means that there is nothing else to do.
+        """
+        message = self.queue.get()
+        if message is not None:
+            sent, message = message
+            self.metrics.observe('queue', time.time() - sent)
+            return self.unpack_requests(message)
+
+    def hold(self, batch):
+        """
+        Tells the main process which requests this worker took, before it
+        starts making them
+        """
+        self.taken.put(('taken', os.getpid(), [r.digest for r in batch]))
+
+    def making(self, request):
+        """
+        Tells the main process which request this worker starts
+        """
+        self.taken.put(('making', os.getpid(), request.digest))
+
+    def take(self):
+        """
+        Reads which requests the workers took and started
+        """
+        while not self.taken.empty():
+            kind, pid, value = self.taken.get()
+            if kind == 'making':
+                self.current[pid] = value
+                continue
+            self.held.setdefault(pid, set()).update(value)
+            for digest in value:
+                self.holders[digest] = pid
+
+    def task_done(self, request, result):
+        """
+        Marks a request as done, sending the properties, the new requests
+        found on it and where it was redirected to in a single message
+        """
+        children, self._children = self._children, []
+        redirects, self._redirects = self._redirects, []
+        self.events.put(('page', (request.domain.id, request.digest, result, children, redirects)))
+
+    def register(self, netloc):
+        """
+        Creates a domain and gives it an id
+        """
+        domain = Domain(netloc, useragent=self.useragent, use_robots=self.use_robots, depth=self.depth, id=next(self._ids))
+        self.registry[domain.id] = domain
+        return domain
+
+    def pack_requests(self, requests):
+        """
+        Packs requests to be sent to a worker, each domain goes once
+        """
+        return pack_requests(requests)
+
+    def unpack_requests(self, message):
+        """
+        Unpacks requests sent by the manager, reusing the domains this
+        process already knows
+        """
+        return unpack_requests(message, self.registry, useragent=self.useragent, use_robots=self.use_robots, depth=self.depth)
+
+    def unpack_request(self, row):
+        """
+        Rebuilds a request packed by Request.pack for a domain being crawled
+        """
+        id, url, depth, digest = row
+        return Request(url, self.registry[id], depth, digest)
 
     def read_domain(self):
         """
@@ -357,26 +995,388 @@ class Manager(object):
         """
         domain = self.domainsFile.fetch_new_domain()
         if domain:
-            return Domain(domain, useragent=self.useragent, use_robots=self.use_robots, depth=self.depth)
+            return self.register(domain)
 
 
     def fetch_domains(self):
         """
-        Adds a bunch of domains to the queue
+        Reads domains into the scheduler until it has enough hosts to choose
+        from. With a resolver they are resolved first, a few of them ahead.
         """
-        for i in xrange(self.smp * 2):
+        while len(self.scheduler.hosts) < self.frontier_size:
+            if self.resolver is not None and len(self.resolving) >= self.resolver.ahead:
+                break
             domain = self.read_domain()
-            if domain:
-                r = Request("http://%s" % domain.netloc, domain, domain.depth)
-                self.add_new_request(r)
+            if not domain:
+                break
+            if self.resolver is None:
+                self.start_domain(domain)
+            else:
+                self.resolving[domain.id] = domain
+                self.resolver.submit(domain.netloc, functools.partial(self.send_addresses, domain.id))
 
+    def send_addresses(self, id, addresses):
+        """
+        Hands the addresses of a domain to the main loop, called by the
+        resolver threads
+        """
+        self.events.put(('resolved', (id, addresses)))
 
-    def start(self):
+    def start_domain(self, domain):
+        """
+        Schedules the first page of a domain. A domain listed again is
+        dropped, and one whose first page was visited already is written
+        with a status saying so, naming the domain it is the same as if that
+        one was started lately.
+        """
+        r = Request("http://%s" % domain.netloc, domain, domain.depth)
+        if not self.hits.add(r.digest):
+            self.registry.pop(domain.id, None)
+            twin = self.homepages.get(r.digest)
+            if twin == domain.netloc:
+                logging.debug("%s was listed again, ignoring it" % domain.netloc)
+            else:
+                logging.debug("The first page of %s was visited already, not crawling it" % domain.netloc)
+                self.write_domain(domain.netloc, set(), "duplicate of %s" % twin if twin else "already visited")
+            return
+        self.homepages[r.digest] = domain.netloc
+        if len(self.homepages) > self.HOMEPAGES:
+            self.homepages.popitem(last=False)
+        if self.robots:
+            self.robots.prefetch(domain.netloc)
+        self.scheduler.push(r)
+
+    def resolved(self, id, addresses):
+        """
+        Schedules a domain that was resolved, or writes it out if it has no
+        addresses. A domain whose addresses could not be told is crawled,
+        and its fetch tries again.
+        """
+        domain = self.resolving.pop(id)
+        self.resolver.count(addresses)
+        if addresses == []:
+            logging.debug("%s does not resolve, not crawling it" % domain.netloc)
+            self.registry.pop(domain.id, None)
+            self.write_domain(domain.netloc, set(), 'unresolvable')
+        else:
+            self.start_domain(domain)
+
+    def dispatch(self):
+        """
+        Sends the requests that are ready to the workers, keeping just a few
+        queued so the scheduler decides what goes next
+        """
+        now = time.time()
+        ready = []
+        while self.dispatched + len(ready) < self.window():
+            r = self.scheduler.pop(now)
+            if r is None:
+                break
+            ready.append(r)
+        size = max(1, min(self.batch_size, len(ready) // self.smp))
+        for i in xrange(0, len(ready), size):
+            batch = ready[i:i + size]
+            for r in batch:
+                self.active[r.digest] = r
+                if self.controller:
+                    self.controller.start(r.digest, now)
+            self.dispatched += len(batch)
+            self.queue.put((now, self.pack_requests(batch)))
+
+    def window(self):
+        """
+        How many requests can be sent to the workers and not done
+        """
+        if self.controller:
+            return self.controller.limit
+        return self.smp * 2 * self.batch_size
+
+    def cpu_use(self, now):
+        """
+        Gets the share of the CPUs the workers used since the last call, None
+        the first time
+        """
+        total = cpu_seconds([w.pid for w in self.workers])
+        last, self._cpu = self._cpu, (now, total)
+        if last and now > last[0]:
+            return (total - last[1]) / ((now - last[0]) * cpu_count())
+
+    def adapt(self):
         """
-        The main loop
+        Lets the controller change how many requests are sent to the workers
         """
-        self.fetch_domains()
+        now = time.time()
+        if self.controller and self.controller.due(now):
+            self.controller.update(now, self.cpu_use(now))
 
+    def handle(self, event):
+        """
+        Handles a message from a worker
+        """
+        kind, value = event
+        if kind == 'resolved':
+            self.resolved(*value)
+            return
+        id, digest, result, children, redirects = value
+        if digest not in self.active:
+            logging.debug("A request that was taken back was done, ignoring it")
+            return
+        self.take()
+        pid = self.holders.pop(digest, None)
+        if pid is not None:
+            self.held[pid].discard(digest)
+        for redirect in redirects:
+            self.hits.add(redirect)
+        for child, url, depth, child_digest in children:
+            if self.hits.add(child_digest):
+                self.scheduler.push(Request(url, self.registry[child], depth, child_digest))
+            else:
+                logging.debug("Cache hit %s d: %d" % (url, depth))
+        self.dispatched -= 1
+        self.active.pop(digest, None)
+        if self.controller:
+            self.controller.done(digest)
+        self.page_done(self.registry[id], result)
+
+    def reap(self):
+        """
+        Drops the workers that died, shrinking the pool. The request a dead
+        worker started last is marked as done with nothing found, since it
+        may be what killed it, and the rest of what it took goes back to the
+        scheduler. Its pages still on their way are lost with it, so some
+        of those requests are made again.
+        """
+        dead = [w for w in self.workers if not w.is_alive()]
+        if not dead:
+            return
+        self.take()
+        for w in dead:
+            logging.warning("Worker %d died with exit code %s" % (w.pid, w.exitcode))
+            current = self.current.pop(w.pid, None)
+            for digest in self.held.pop(w.pid, set()):
+                self.holders.pop(digest, None)
+                r = self.active.pop(digest, None)
+                if r is None:
+                    continue
+                self.dispatched -= 1
+                if self.controller:
+                    self.controller.done(digest)
+                if digest == current or not self.scheduler.retry(r):
+                    self.page_done(r.domain, [])
+        self.workers[:] = [w for w in self.workers if w not in dead]
+        self.smp = max(1, len(self.workers))
+
+    def page_done(self, domain, result):
+        """
+        Merges the properties found on a page with the rest of its domain, and
+        writes the domain out once it has nothing else to be crawled
+        """
+        netloc = domain.netloc
+        if result:
+            found = self.results.setdefault(netloc, set())
+            found.update(result)
+            if len(found) == len(self.properties):
+                logging.debug("Every property was found on %s, not crawling it any further" % netloc)
+                self.scheduler.close(netloc)
+        if self.scheduler.done(netloc):
+            self.registry.pop(domain.id, None)
+            self.write_domain(netloc, self.results.pop(netloc, set()))
+
+    def write_domain(self, netloc, found, status=None):
+        """
+        Writes out a domain that is done, or keeps it if there is no writer
+        """
+        if self._written is not None:
+            self._written.append(netloc)
+        if self.writer:
+            self.writer.write(netloc, found, status)
+        elif status:
+            self.statuses[netloc] = status
+        elif found:
+            self.domains[netloc] = list(found)
+
+    def wait(self):
+        """
+        Waits for messages from the workers, or until the next host is ready
+        """
+        timeout = 1
+        ready = self.scheduler.next_ready()
+        if ready is not None and self.dispatched < self.window():
+            timeout = min(timeout, max(0, ready - time.time()))
+        try:
+            self.handle(self.events.get(True, timeout))
+            while True:
+                self.handle(self.events.get_nowait())
+        except Empty:
+            pass
+
+    def property_names(self, domains):
+        """
+        Gets the names of the properties found on some domains, by netloc
+        """
+        return dict((netloc, sorted(set(self.properties[x].name for x in keys)))
+                    for netloc, keys in domains.items())
+
+    def flush_output(self):
+        """
+        Flushes the results, and gets the length of the output and how many
+        domains are on it, None and 0 without a writer
+        """
+        if self.writer:
+            self.writer.flush()
+            return self.writer.offset(), self.writer.written
+        return None, 0
+
+    def started_requests(self):
+        """
+        Gets the requests being made and the first pages of the domains
+        being resolved, which are not on the scheduler
+        """
+        started = self.active.values()
+        started += [Request("http://%s" % d.netloc, d, d.depth) for d in self.resolving.values()]
+        return [(r.url, r.domain.netloc, r.depth) for r in started]
+
+    def snapshot(self):
+        """
+        Gets the state needed to resume the crawl: how far the domains file
+        was read, the requests waiting and the ones started, the filter of
+        visited urls and the properties found on the domains not done yet.
+        Results are flushed first, and only their length in the output is
+        kept. The journals are emptied, since all of it is in there.
+        """
+        if self._written is not None:
+            self.hits.journal, self.scheduler.journal, self._written = [], [], []
+        output, written = self.flush_output()
+        return {
+            'read': self.domainsFile.nr,
+            'frontier': [(r.url, r.domain.netloc, r.depth) for r in self.scheduler.requests()],
+            'started': self.started_requests(),
+            'results': self.property_names(self.results),
+            'domains': self.property_names(self.domains),
+            'statuses': self.statuses,
+            'hits': self.hits.dump(),
+            'output': output,
+            'written': written,
+        }
+
+    def changes(self):
+        """
+        Gets what changed since the last snapshot or changes: the urls
+        visited and the requests added to and taken from the scheduler since,
+        along with the parts of the state that are small enough to be taken
+        whole. The journals are emptied.
+        """
+        hits, self.hits.journal = self.hits.journal, []
+        frontier, self.scheduler.journal = self.scheduler.journal, []
+        written, self._written = self._written, []
+        output, count = self.flush_output()
+        return {
+            'read': self.domainsFile.nr,
+            'frontier': frontier,
+            'started': self.started_requests(),
+            'results': self.property_names(self.results),
+            'domains': self.property_names(dict((x, self.domains[x]) for x in written if x in self.domains)),
+            'statuses': dict((x, self.statuses[x]) for x in written if x in self.statuses),
+            'hits': hits,
+            'output': output,
+            'written': count,
+        }
+
+    def restore(self, state):
+        """
+        Resumes from a state made by snapshot and the changes made since.
+        Requests that were started go back to the scheduler, and whatever
+        was written after the last save is dropped, since those domains
+        will be crawled again.
+        """
+        keys = dict((p.name, key) for key, p in self.properties.items())
+
+        def found(domains):
+            return dict((netloc, set(keys[x] for x in names if x in keys))
+                        for netloc, names in domains.items())
+
+        self.hits.load(state['hits'])
+        waiting = OrderedDict()
+        for url, netloc, depth in state['frontier']:
+            waiting.setdefault(netloc, OrderedDict())[url_digest(url)] = (url, netloc, depth)
+        statuses = dict(state.get('statuses', {}))
+        domains = dict(state['domains'])
+        last = state
+        for changes in state.get('journal', []):
+            for digest in changes['hits']:
+                self.hits.add(digest)
+            for kind, value in changes['frontier']:
+                if kind == '+':
+                    waiting.setdefault(value[1], OrderedDict())[url_digest(value[0])] = value
+                elif kind == '-':
+                    waiting.get(value[0], {}).pop(value[1], None)
+                else:
+                    waiting.pop(value, None)
+            domains.update(changes['domains'])
+            statuses.update(changes['statuses'])
+            last = changes
+
+        self.domainsFile.skip(last['read'])
+        self.results = found(last['results'])
+        self.domains = dict((netloc, list(x)) for netloc, x in found(domains).items())
+        self.statuses = statuses
+        frontier = [row for rows in waiting.values() for row in rows.values()] + last['started']
+        registered = {}
+        for url, netloc, depth in frontier:
+            domain = registered.get(netloc)
+            if domain is None:
+                domain = registered[netloc] = self.register(netloc)
+                self.restored.append(netloc)
+            self.scheduler.push(Request(url, domain, depth))
+        if self.writer and last['output'] is not None:
+            self.writer.truncate(last['output'])
+            self.writer.written = last['written']
+        logging.info("Resuming after %d domain(s) with %d request(s) pending" %
+                     (last['read'], len(frontier)))
+
+    def prefetch_restored(self):
+        """
+        Fetches the robots.txt of the domains restored on the background
+        """
+        if self.robots:
+            for netloc in self.restored:
+                self.robots.prefetch(netloc)
+        self.restored = []
+
+    def progress(self):
+        """
+        Gets how far the crawl went: the domains read and written, and the
+        requests waiting or being made
+        """
+        written = self.writer.written if self.writer else len(self.domains) + len(self.statuses)
+        return {'domains_read': self.domainsFile.nr, 'domains_written': written,
+                'requests_pending': self.pending.value}
+
+    def save_checkpoint(self, force=False):
+        """
+        Saves a checkpoint if one is due
+        """
+        if self.checkpoint and (force or self.checkpoint.due()):
+            if self.checkpoint.whole():
+                self.checkpoint.save(self.snapshot())
+            else:
+                self.checkpoint.append(self.changes())
+
+    def finish_checkpoint(self):
+        """
+        Removes the checkpoint of a crawl that is over
+        """
+        if self.checkpoint:
+            if self.writer:
+                self.writer.flush()
+            self.checkpoint.clear()
+
+    def start(self):
+        """
+        The main loop. It schedules the requests every time a worker sends
+        something, and stops the workers once the domains file is over and
+        nothing is pending
+        """
         self.workers = [Process(target=work, args=(i, self))
                         for i in xrange(self.smp)]
         
@@ -385,23 +1385,79 @@ class Manager(object):
         for w in self.workers:
             w.daemon = True
             w.start()
+        self.prefetch_restored()
+        if self.controller:
+            self.cpu_use(time.time())
 
-        while True:
-            time.sleep(0.1)
-            if self.domainsFile.finished:
-                logging.debug("Looks finished, joining")
-                for w in self.workers:
-                    w.join()
-                break
+        try:
+            while True:
+                self.fetch_domains()
+                self.dispatch()
+                self.pending.value = len(self.scheduler) + self.dispatched
+                if self.domainsFile.finished and not self.pending.value and not self.resolving:
+                    self.finish_checkpoint()
+                    break
+                self.reap()
+                if not self.workers:
+                    logging.error("Every worker died with %d request(s) pending" % self.pending.value)
+                    self.save_checkpoint(True)
+                    break
+                self.wait()
+                self.adapt()
+                self.save_checkpoint()
+        except:
+            self.save_checkpoint(True)
+            self.scheduler.cleanup()
+            if self.resolver:
+                self.resolver.close()
+            raise
 
-            else:
-                if self.queue.empty():
-                    self.fetch_domains()
+        logging.debug("Finished, joining")
+        for w in self.workers:
+            self.queue.put(None)
+        for w in self.workers:
+            w.join()
+        self.scheduler.cleanup()
+        if self.resolver:
+            self.resolver.close()
+        if self.robots:
+            self.robots.close()
+
+    def log_stats(self):
+        """
+        Logs how full the filter of visited urls is and how the robots.txt
+        cache did
+        """
+        logging.info("Visited %d url(s), dedup filter uses %d bytes with a %.6f false positive rate" %
+                     (len(self.hits), self.hits.memory, self.hits.false_positive_rate()))
+        if self.robots:
+            logging.info("robots.txt cache: %d hit(s), %d miss(es)" %
+                         (self.robots.hits.value, self.robots.misses.value))
+        logging.info("%d request(s) over the page budget, %d dropped once every property was found" %
+                     (self.scheduler.over_budget, self.scheduler.pruned))
+        if self.scheduler.memory is not None:
+            logging.info("%d request(s) spilled to disk" % self.scheduler.spilled)
+        if self.resolver:
+            logging.info("Resolved %d domain(s) ahead, %d unresolvable, DNS cache: %d hit(s), %d miss(es)" %
+                         (self.resolver.resolved, self.resolver.unresolvable,
+                          self.resolver.cache.hits.value, self.resolver.cache.misses.value))
+        if self.controller:
+            logging.info("Concurrency ended at %d after %d change(s)" %
+                         (self.controller.limit, self.controller.decisions))
+        self.metrics.log_stats()
+        if self.checker:
+            self.checker.log_stats()
 
     def dump(self):
         """
-        Formats the results and prints them
+        Formats the results and prints them, or just flushes the writer that
+        has been writing them all along
         """
+        if self.writer:
+            self.writer.close()
+            return
         for domain, matches in self.domains.items():
             names = map(lambda x: self.properties[x].name, set(matches))
             print "%s: %s" % (domain, reduce(lambda x, y: "%s, %s" % (x, y), names))
+        for domain, status in self.statuses.items():
+            print "%s: [%s]" % (domain, status)
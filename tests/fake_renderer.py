@@ -0,0 +1,65 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: fake_renderer.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+"""
+Stands in for PhantomJS running pjs.js: reads one url per line and answers
+with a JSON line. Some urls misbehave on purpose.
+"""
+
+import os
+import sys
+import json
+import time
+
+blocked = set()
+budget = 0
+for arg in sys.argv[1:]:
+  if arg.startswith("--block="):
+    blocked = set(arg[8:].split(","))
+  elif arg.startswith("--budget="):
+    budget = int(arg[9:]) / 1000.0
+
+def extension(url):
+  path = url.split("#")[0].split("?")[0]
+  name = path.rsplit("/", 1)[-1]
+  return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+while True:
+  url = sys.stdin.readline().strip()
+  if not url:
+    break
+  if url == "ping":
+    out = {"pong": True}
+  elif url.endswith("/hang"):
+    time.sleep(60)
+    continue
+  elif url.endswith("/crash"):
+    sys.exit(1)
+  else:
+    partial = False
+    if url.endswith("/slow"):
+      if not budget:
+        time.sleep(60)
+        continue
+      time.sleep(budget)
+      partial = True
+    urls = [url, "http://cdn.foo.com/widget.js", "http://bar.com/logo.png",
+            "http://bar.com/font.woff2?v=1"]
+    out = {
+      "url": url,
+      "content": '<html><a href="/next">next</a><p>pid %d</p></html>' % os.getpid(),
+      "urls": urls,
+      "blocked": len([u for u in urls if extension(u) in blocked]),
+      "partial": partial
+    }
+  sys.stdout.write(json.dumps(out) + "\n")
+  sys.stdout.flush()
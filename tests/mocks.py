@@ -10,6 +10,14 @@
 # Author: Artur Ventura
 #
 
+import os
+import time
+import threading
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import BaseHTTPRequestHandler,HTTPServer
+
+from techscav import Request
+
 class MockFile(object):
   def __init__(self, text):
     self.i = 0
@@ -21,4 +29,116 @@ class MockFile(object):
     else:
       t = self.text[self.i]
       self.i += 1
-      return t
\ No newline at end of file
+      return t
+
+class StubResolver(object):
+  """
+  Resolves hosts from a dict, the ones it does not have do not exist. Each
+  lookup takes delay seconds.
+  """
+  def __init__(self, addresses, delay=0):
+    self.addresses = addresses
+    self.delay = delay
+    self.lookups = []
+
+  def resolve(self, host):
+    time.sleep(self.delay)
+    self.lookups.append(host)
+    return self.addresses.get(host, [])
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+  def handle_error(self, request, client_address):
+    # the client hung up before the page was over
+    pass
+
+
+class MockServer(threading.Thread):
+  """
+  Serves a handler on a port, a thread for each connection, until closed.
+  The keyword arguments are set on the server, for the handler to count on.
+  """
+  def __init__(self, port, handler, **state):
+    super(MockServer, self).__init__()
+    self.daemon = True
+    self.server = ThreadingServer(('', port), handler)
+    for name, value in state.items():
+      setattr(self.server, name, value)
+
+  def run(self):
+    self.server.serve_forever()
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+  """
+  A handler that logs nothing
+  """
+  def log_message(self, *args, **kwargs):
+    pass
+
+
+class PagesHandler(MockHandler):
+  """
+  Serves the html pages of a dict by path, and 404 for the rest
+  """
+  pages = {}
+
+  def do_GET(self):
+    if self.path not in self.pages:
+      self.send_response(404)
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header('Content-type','text/html')
+    self.end_headers()
+    self.wfile.write(self.pages[self.path])
+
+
+class LinkingChecker(object):
+  """
+  Finds a property on every page, links each page to two others and puts
+  every url it visits on visited, if given. The first checker, of those
+  sharing once, to get to the url in die_on has its process die, and the
+  first to get to the one in hang_on hangs for a while. Each page takes
+  delay seconds.
+  """
+  def __init__(self, key, visited=None, once=None, die_on=None, hang_on=None, delay=0):
+    self.key = key
+    self.delay = delay
+    self.visited = visited
+    self.once = once
+    self.die_on = die_on
+    self.hang_on = hang_on
+
+  def first(self):
+    with self.once.get_lock():
+      first, self.once.value = not self.once.value, 1
+    return first
+
+  def check(self, request, manager):
+    if request.url == self.die_on and self.first():
+      # what was put on visited goes out before dying
+      self.visited.close()
+      self.visited.join_thread()
+      os._exit(1)
+    if request.url == self.hang_on and self.first():
+      time.sleep(1.5)
+    time.sleep(self.delay)
+    if self.visited is not None:
+      self.visited.put(request.url)
+    if request.depth > 1:
+      for i in xrange(2):
+        manager.add_new_request(Request("%s/%d" % (request.url, i), request.domain, request.depth - 1))
+    return [self.key]
+
+  def close(self):
+    pass
+
+  def log_stats(self):
+    pass
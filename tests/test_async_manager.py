@@ -0,0 +1,170 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_async_manager.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Process
+
+from mock import Mock
+from twisted.internet import defer
+from twisted.python.failure import Failure
+from twisted.web.client import ResponseDone
+
+from techscav.asyncmanager import _BoundedBody
+from techscav import AsyncManager, DomainsFile, Metrics, Property, Request, ResultWriter, SimpleChecker, url_digest
+from mocks import MockFile, MockServer, PagesHandler
+
+PORT_NUMBER = 9596
+BIG_PORT_NUMBER = 9610
+
+PAGES = {
+  "/": """<html><body>
+<script src="http://cdn.foo.com/foo.js"></script>
+<a href="/about">About</a>
+<a href="http://elsewhere.com/">Elsewhere</a>
+</body></html>""",
+  "/about": """<html><body>
+<script src="http://cdn.foo.com/foo.js"></script>
+<a href="/">Home</a>
+</body></html>""",
+}
+
+class MockServerHandler(PagesHandler):
+  pages = PAGES
+
+class BigHandler(PagesHandler):
+  """
+  Serves a homepage of 1 MB with the reference to foo.com at the end
+  """
+  pages = {"/": "<p>lorem ipsum dolor sit amet</p>\n" * 30000 + '<script src="http://cdn.foo.com/foo.js"></script>'}
+
+class DyingChecker(SimpleChecker):
+  """
+  Kills the parsing process on the pages of 127.0.0.1
+  """
+  def parse(self, request, url, text):
+    if request.domain.netloc.startswith("127.0.0.1"):
+      os._exit(1)
+    return super(DyingChecker, self).parse(request, url, text)
+
+
+def run(manager):
+  manager.start()
+  manager.dump()
+
+class TestAsyncManager(unittest.TestCase):
+
+    def setUp(self):
+      self.server = MockServer(PORT_NUMBER, MockServerHandler)
+      self.server.start()
+      self.properties = Property.from_config({
+        "properties":[
+          {
+            "name": "Foo",
+            "domains": [
+              "foo.com"
+            ]
+          }
+        ]
+      })
+
+      self.dir = tempfile.mkdtemp()
+
+    def run_manager(self, domains, depth, max_bytes=2097152, checker=SimpleChecker, **kwargs):
+      # the reactor can only run once per process, the results come back
+      # through the writer
+      path = os.path.join(self.dir, "results.jsonl")
+      with open(path, "w") as f:
+        writer = ResultWriter(f, self.properties, "jsonl")
+        manager = AsyncManager(DomainsFile(MockFile(domains)), self.properties, 2,
+                               checker(self.properties, max_bytes=max_bytes), use_robots=False,
+                               depth=depth, concurrency=10, timeout=5, writer=writer, **kwargs)
+        p = Process(target=run, args=(manager,))
+        p.start()
+        p.join(30)
+        if p.is_alive():
+          p.terminate()
+          self.fail("the manager did not finish")
+      with open(path) as f:
+        lines = map(json.loads, f)
+      self.lines = len(lines)
+      self.statuses = dict((x["domain"], x["status"]) for x in lines if "status" in x)
+      return dict((x["domain"], x["properties"]) for x in lines)
+
+    def test_fetch(self):
+      results = self.run_manager("localhost:%d\n127.0.0.1:%d\n127.0.0.1:1\n" % (PORT_NUMBER, PORT_NUMBER), 2)
+      self.assertEqual(results, {
+        "localhost:%d" % PORT_NUMBER: ["Foo"],
+        "127.0.0.1:%d" % PORT_NUMBER: ["Foo"],
+        "127.0.0.1:1": []
+      })
+
+    def test_max_bytes(self):
+      server = MockServer(BIG_PORT_NUMBER, BigHandler)
+      server.start()
+      try:
+        domains = "localhost:%d\n" % BIG_PORT_NUMBER
+        self.assertEqual(self.run_manager(domains, 1, max_bytes=100000), {"localhost:%d" % BIG_PORT_NUMBER: []})
+        self.assertEqual(self.run_manager(domains, 1, max_bytes=None), {"localhost:%d" % BIG_PORT_NUMBER: ["Foo"]})
+      finally:
+        server.close()
+
+    def test_duplicate_domain(self):
+      results = self.run_manager("localhost:%d\nwww.localhost:%d\nlocalhost:%d\n" % ((PORT_NUMBER,) * 3), 1)
+      self.assertEqual(results, {"localhost:%d" % PORT_NUMBER: ["Foo"], "www.localhost:%d" % PORT_NUMBER: []})
+      self.assertEqual(self.lines, 2)
+      self.assertEqual(self.statuses, {"www.localhost:%d" % PORT_NUMBER: "duplicate of localhost:%d" % PORT_NUMBER})
+
+    def test_dead_parser(self):
+      # the page whose parsing process died is given up on, and the numbers
+      # of pages, bytes and errors come from every process
+      metrics = Metrics()
+      domains = "localhost:%d\n127.0.0.1:%d\n127.0.0.1:1\n" % (PORT_NUMBER, PORT_NUMBER)
+      results = self.run_manager(domains, 1, checker=DyingChecker, parse_timeout=1, metrics=metrics)
+      self.assertEqual(results, {"localhost:%d" % PORT_NUMBER: ["Foo"], "127.0.0.1:%d" % PORT_NUMBER: [], "127.0.0.1:1": []})
+      snapshot = metrics.snapshot()
+      self.assertEqual(snapshot['counters']['pages'], 3)
+      self.assertEqual(snapshot['counters']['bytes'], 2 * len(PAGES["/"]))
+      self.assertEqual((snapshot['errors']['check'], snapshot['errors']['connection']), (1, 1))
+
+    def test_bounded_body(self):
+      for size, truncated in ((10, False), (11, True)):
+        d = defer.Deferred()
+        body = _BoundedBody(d, 10)
+        body.makeConnection(Mock())
+        body.dataReceived("x" * (size - 1))
+        body.dataReceived("x")
+        body.connectionLost(Failure(ResponseDone()))
+        self.assertEqual(body.truncated, truncated)
+        self.assertEqual(body.transport.stopProducing.called, truncated)
+        self.assertEqual(d.result, "x" * 10)
+
+    def test_empty(self):
+      self.assertEqual(self.run_manager("", 1), {})
+
+    def test_redirect(self):
+      manager = AsyncManager(DomainsFile(MockFile("")), self.properties, 1, None, use_robots=False)
+      domain = manager.register("a.com")
+      manager.add_redirect(Request("http://a.com", domain, 1), "http://www.a.com/")
+      manager.add_redirect(Request("http://a.com", domain, 1), "https://a.com/home")
+      self.assertEqual(len(manager.hits), 1)
+      self.assertIn(url_digest("http://a.com/home"), manager.hits)
+
+    def tearDown(self):
+      self.server.close()
+      shutil.rmtree(self.dir)
+
+if __name__ == '__main__':
+    unittest.main()
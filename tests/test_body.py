@@ -0,0 +1,169 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_body.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import codecs
+import unittest
+
+from mock import Mock
+from techscav import (Body, ContentCache, Domain, LxmlLinkExtractor, Property, Request, SimpleChecker,
+                      SoupLinkExtractor, ascii_compatible, codec_name, fingerprint)
+
+PAGE = u"""<html><head><title>%(title)s</title>
+<script src="http://cdn.foo.com/foo.js"></script>
+</head><body>
+<p>%(text)s</p>
+<a href="/%(path)s">%(text)s</a>
+<a href="http://bar.com/x">%(text)s</a>
+<a href="/about">About</a>
+<img src="//static.baz.net/%(path)s.png">
+</body></html>
+"""
+
+TEXTS = [
+  ("utf-8", u"A\u00e7\u00e3o e caf\u00e9, \u4e2d\u6587 \u0438 \u0440\u0443\u0441\u0441\u043a\u0438\u0439"),
+  ("iso-8859-1", u"A\u00e7\u00e3o e caf\u00e9 \u00e0 noite"),
+  ("windows-1252", u"Smart \u201cquotes\u201d \u2013 and \u20ac signs"),
+  ("shift_jis", u"\u65e5\u672c\u8a9e\u306e\u30da\u30fc\u30b8\u3001\u30bd\u30d5\u30c8\u30a6\u30a7\u30a2"),
+  ("gbk", u"\u7b80\u4f53\u4e2d\u6587\u7f51\u9875\uff0c\u8f6f\u4ef6\u4e0b\u8f7d"),
+  ("big5", u"\u7e41\u9ad4\u4e2d\u6587\u7db2\u9801"),
+  ("euc-kr", u"\ud55c\uad6d\uc5b4 \uc6f9 \ud398\uc774\uc9c0"),
+  ("koi8-r", u"\u0420\u0443\u0441\u0441\u043a\u0430\u044f \u0441\u0442\u0440\u0430\u043d\u0438\u0446\u0430"),
+  ("utf-16", u"A\u00e7\u00e3o, \u4e2d\u6587 \u0438 \u0440\u0443\u0441\u0441\u043a\u0438\u0439"),
+  ("iso-2022-jp", u"\u65e5\u672c\u8a9e\u306e\u30da\u30fc\u30b8"),
+]
+
+def corpus():
+  """
+  Gets the pages of the corpus as (encoding declared, bytes)
+  """
+  pages = []
+  for encoding, text in TEXTS:
+    page = PAGE % {"title": text[:5], "text": text * 20, "path": text[:3]}
+    pages.append((encoding, page.encode(encoding)))
+  utf8 = (PAGE % {"title": u"Caf\u00e9", "text": u"Caf\u00e9" * 20, "path": "page"}).encode("utf-8")
+  # no charset given, an unknown one, and UTF-8 with broken bytes
+  pages.append((None, utf8))
+  pages.append(("x-unknown", utf8))
+  pages.append(("utf-8", utf8.replace("Caf", "Caf\xff\xfe", 7)))
+  return pages
+
+
+class FakeResponse(object):
+
+  def __init__(self, encoding, body):
+    self.encoding = encoding
+    self.body = body
+    self.headers = {}
+
+  def iter_content(self, chunk_size):
+    for i in xrange(0, len(self.body), chunk_size):
+      yield self.body[i:i + chunk_size]
+
+
+class TestBody(unittest.TestCase):
+
+  def setUp(self):
+    self.properties = Property.from_config({
+      "properties":[
+        {"name": "Foo", "domains": ["foo.com"]},
+        {"name": "Bar", "domains": ["bar.com"]},
+        {"name": "Baz", "domains": ["baz.net"]},
+        {"name": "Qux", "domains": ["qux.org"]}
+      ]
+    })
+    self.domain = Domain("bar.com", use_robots=False)
+
+  def decoded(self, checker, encoding, raw, request):
+    """
+    Checks a page the way it was done before pages were read as bytes,
+    decoding all of it first
+    """
+    try:
+      decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    except LookupError:
+      decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = decoder.decode(raw, True)
+    return checker.matcher.match(text), checker.follow_links(request, request.url, text)
+
+  def test_corpus(self):
+    for links in ("lxml", "soup"):
+      checker = SimpleChecker(self.properties, chunk_size=7, links=links)
+      request = Request("http://bar.com/", self.domain, 2)
+      for encoding, raw in corpus():
+        found, body = checker.scan(request, FakeResponse(encoding, raw))
+        self.assertEqual(body.raw, raw)
+        expected = self.decoded(checker, encoding, raw, request)
+        self.assertEqual(found, expected[0], (links, encoding))
+        self.assertEqual(len(found), 3, (links, encoding))
+        self.assertEqual(checker.follow_links(request, request.url, *body.markup()), expected[1], (links, encoding))
+        self.assertEqual(body.text, raw.decode(codec_name(encoding), "replace"))
+
+  def test_lazy(self):
+    body = Body("caf\xc3\xa9", "utf-8")
+    self.assertTrue(body.ascii)
+    self.assertEqual(body.markup(), ("caf\xc3\xa9", "utf-8"))
+    self.assertIsNone(body._text)
+    self.assertEqual(body.text, u"caf\u00e9")
+    body = Body(u"caf\u00e9".encode("utf-16"), "utf-16")
+    self.assertEqual(body.markup(), (u"caf\u00e9", None))
+
+  def test_ascii_compatible(self):
+    for encoding in ("utf-8", "ISO-8859-1", "windows-1252", "shift_jis", "gbk", "koi8-r", None):
+      self.assertTrue(ascii_compatible(encoding), encoding)
+    for encoding in ("utf-16", "UTF-16LE", "utf-32", "utf-7", "iso-2022-jp", "hz", "cp037"):
+      self.assertFalse(ascii_compatible(encoding), encoding)
+    self.assertEqual(codec_name("x-unknown"), "utf-8")
+
+  def test_unicode_domains(self):
+    properties = Property.from_config({"properties":[{"name": "Foo", "domains": [u"f\u00f3o.com"]}]})
+    checker = SimpleChecker(properties, chunk_size=5)
+    self.assertFalse(checker.matcher.ascii)
+    raw = u"<script src='http://f\u00f3o.com/a.js'></script>".encode("utf-8")
+    found, body = checker.scan(Request("http://bar.com/", self.domain, 1), FakeResponse("utf-8", raw))
+    self.assertEqual(found, set(properties.keys()))
+
+  def test_extractors(self):
+    raw = (PAGE % {"title": u"x", "text": u"\u4e2d\u6587", "path": "page"}).encode("gbk")
+    for extractor in (LxmlLinkExtractor(), SoupLinkExtractor()):
+      self.assertEqual(extractor.extract(raw, "gbk"), extractor.extract(raw.decode("gbk")))
+
+  def test_content_cache(self):
+    cache = ContentCache(2)
+    self.assertIsNone(cache.get("a", "links"))
+    cache.put("a", "links", 1)
+    cache.put("a", "found", 2)
+    cache.put("b", "links", 3)
+    self.assertEqual(cache.get("a", "links"), 1)
+    cache.put("c", "links", 4)
+    # b was the least recently used
+    self.assertEqual((cache.get("a", "found"), cache.get("b", "links"), cache.get("c", "links")), (2, None, 4))
+    self.assertEqual((cache.hits.value, cache.misses.value), (3, 2))
+    cache = ContentCache(0)
+    cache.put("a", "links", 1)
+    self.assertIsNone(cache.get("a", "links"))
+    self.assertEqual((len(cache), cache.misses.value), (0, 0))
+
+  def test_parse_once(self):
+    checker = SimpleChecker(self.properties)
+    checker.extractor = Mock(wraps=checker.extractor)
+    checker.matcher = Mock(wraps=checker.matcher)
+    page = PAGE % {"title": u"x", "text": u"caf\u00e9", "path": "page"}
+    first = checker.parse(Request("http://bar.com/", self.domain, 2), "http://bar.com/", page)
+    second = checker.parse(Request("http://bar.com/a/", self.domain, 2), "http://bar.com/a/", page)
+    self.assertEqual(sorted(first[0]), sorted(second[0]))
+    self.assertEqual(first[1], ["http://bar.com/page", "http://bar.com/x", "http://bar.com/about"])
+    self.assertEqual(second[1], first[1])
+    self.assertEqual((checker.extractor.extract.call_count, checker.matcher.match.call_count), (1, 1))
+    self.assertEqual(Body(page.encode("utf-8")).fingerprint, fingerprint(page))
+
+if __name__ == '__main__':
+    unittest.main()
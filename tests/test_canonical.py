@@ -0,0 +1,58 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_canonical.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import unittest
+
+from techscav import Domain, Request, canonical, url_digest
+
+class TestCanonical(unittest.TestCase):
+
+  def test_same_page(self):
+    urls = [
+      "http://foo.com/a?b=1",
+      "https://www.Foo.com/a/?utm_source=x&b=1#top",
+      "http://FOO.com:80/a?gclid=123&b=1",
+      "https://foo.com:443/a/?b=1&fbclid=x&utm_campaign=y",
+      "//foo.com/a?b=1",
+    ]
+    for url in urls:
+      self.assertEqual(canonical(url), "foo.com/a?b=1", url)
+
+  def test_different_pages(self):
+    urls = [
+      "http://foo.com/a",
+      "http://foo.com/a?b=1",
+      "http://foo.com/a?b=2",
+      "http://foo.com:8080/a",
+      "http://bar.foo.com/a",
+      "http://foo.com/A",
+    ]
+    self.assertEqual(len(set(map(canonical, urls))), len(urls))
+
+  def test_query(self):
+    self.assertEqual(canonical("http://foo.com/?b=2&a=1&a=0"), "foo.com?a=0&a=1&b=2")
+    self.assertEqual(canonical("http://foo.com/?UTM_Medium=1&_ga=2"), "foo.com")
+    self.assertEqual(canonical("http://foo.com/?utm=1"), "foo.com?utm=1")
+
+  def test_bad_urls(self):
+    self.assertEqual(canonical("http://foo.com:port/x"), "foo.com/x")
+    self.assertEqual(canonical(u"http://foo.com/caf\u00e9"), "foo.com/caf\xc3\xa9")
+    self.assertEqual(canonical(""), "")
+
+  def test_request_digest(self):
+    d = Domain("foo.com", use_robots=False)
+    self.assertEqual(Request("http://foo.com/", d, 1).digest, Request("https://www.foo.com", d, 1).digest)
+    self.assertEqual(Request(u"http://foo.com/caf\u00e9", d, 1).digest, url_digest("http://foo.com/caf\xc3\xa9"))
+    self.assertNotEqual(Request("http://foo.com/a", d, 1).digest, Request("http://foo.com/b", d, 1).digest)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_checkpoint.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import unittest
+from Queue import Empty
+from multiprocessing import Queue
+from mocks import MockFile
+from StringIO import StringIO
+from techscav import Checkpoint, DomainsFile, Manager, Property, Request, ResultWriter, SharedBloomFilter
+
+class RecordingChecker(object):
+  """
+  Finds a property on every page, links each page to two others and records
+  every url it visits
+  """
+  def __init__(self, key):
+    self.key = key
+    self.visited = Queue()
+
+  def check(self, request, manager):
+    self.visited.put(request.url)
+    if request.depth > 1:
+      for i in xrange(2):
+        manager.add_new_request(Request("%s/%d" % (request.url, i), request.domain, request.depth - 1))
+    return [self.key]
+
+  def close(self):
+    pass
+
+class TestCheckpoint(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, "crawl.checkpoint")
+    self.properties = Property.from_config({
+      "properties":[
+        {"name": "Foo", "domains": ["foo.com"]},
+        {"name": "Bar", "domains": ["bar.com"]}
+      ]
+    })
+    self.key = [key for key, p in self.properties.items() if p.name == "Foo"][0]
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_save_load(self):
+    c = Checkpoint(self.path, interval=60)
+    self.assertIsNone(c.load())
+    self.assertFalse(c.due())
+    c.save({'read': 3})
+    c.save({'read': 4})
+    self.assertEqual(c.load()['read'], 4)
+    self.assertEqual(os.listdir(self.dir), ["crawl.checkpoint"])
+    c.clear()
+    self.assertIsNone(c.load())
+
+  def test_journal(self):
+    c = Checkpoint(self.path, interval=60)
+    self.assertTrue(c.whole())
+    c.save({'read': 3})
+    self.assertFalse(c.whole())
+    c.append({'read': 4})
+    c.append({'read': 5})
+    with open(c.journal, "ab") as f:
+      f.write("\x10\x00\x00\x00cut")
+    self.assertEqual([x['read'] for x in c.load()['journal']], [4, 5])
+    # the journal goes once the whole state is saved again
+    c.save({'read': 6})
+    self.assertEqual(c.load()['journal'], [])
+    self.assertEqual(os.listdir(self.dir), ["crawl.checkpoint"])
+    # entries of another state are ignored
+    other = Checkpoint(self.path)
+    other.save({'read': 7})
+    c.append({'read': 8})
+    self.assertEqual(c.load()['journal'], [])
+    self.assertEqual(c.size, os.path.getsize(self.path))
+    c.clear()
+    self.assertEqual(os.listdir(self.dir), [])
+
+  def test_filter(self):
+    f = SharedBloomFilter(1000, 0.01)
+    for i in xrange(100):
+      f.add(hashlib.md5(str(i)).digest())
+    g = SharedBloomFilter(1000, 0.01)
+    g.load(f.dump())
+    self.assertEqual(len(g), 100)
+    self.assertIn(hashlib.md5("42").digest(), g)
+    self.assertRaises(ValueError, SharedBloomFilter(2000, 0.01).load, f.dump())
+
+  def manager(self, out, checker=None, use_robots=False):
+    domains = DomainsFile(MockFile("\n".join("%s.com" % x for x in "abcdef")))
+    return Manager(domains, self.properties, 2, checker, use_robots=use_robots, depth=2, frontier_size=2,
+                   writer=ResultWriter(out, self.properties, "jsonl"), checkpoint=Checkpoint(self.path))
+
+  def crawl_first(self, out, save):
+    # a.com and b.com are started, a.com links to a.com/0 and b.com is done
+    m = self.manager(out)
+    m.fetch_domains()
+    m.dispatch()
+    a, b = sorted(m.active.values(), key=lambda r: r.url)
+    save(m)
+    m.handle(('page', (a.domain.id, a.digest, [self.key], [Request("http://a.com/0", a.domain, 1).pack()], [])))
+    m.handle(('page', (b.domain.id, b.digest, [], [], [])))
+    m.save_checkpoint(True)
+    m.writer.write("z.com", [])
+    m.writer.flush()
+
+  def test_resume(self):
+    out = StringIO()
+    self.crawl_first(out, lambda m: None)
+    self.check_resume(out)
+
+  def test_resume_journal(self):
+    out = StringIO()
+    sizes = []
+    def save(m):
+      m.save_checkpoint(True)
+      sizes.append(os.path.getsize(self.path))
+    self.crawl_first(out, save)
+    # the second save only appended what changed
+    self.assertEqual(os.path.getsize(self.path), sizes[0])
+    self.assertEqual(len(Checkpoint(self.path).load()['journal']), 1)
+    self.check_resume(out)
+
+  def test_restore_robots(self):
+    out = StringIO()
+    self.crawl_first(out, lambda m: None)
+    m = self.manager(out, use_robots=True)
+    m.restore(Checkpoint(self.path).load())
+    # robots.txt is only fetched once the workers are started
+    self.assertIsNone(m.robots._pool)
+    self.assertEqual(m.restored, ["a.com"])
+    m.robots.close()
+
+  def check_resume(self, out):
+    checker = RecordingChecker(self.key)
+    m = self.manager(out, checker)
+    m.restore(Checkpoint(self.path).load())
+    m.start()
+    m.dump()
+
+    visited = set()
+    try:
+      while True:
+        visited.add(checker.visited.get(True, 1))
+    except Empty:
+      pass
+    self.assertNotIn("http://b.com", visited)
+    self.assertNotIn("http://a.com", visited)
+    self.assertIn("http://a.com/0", visited)
+    self.assertIn("http://f.com/1", visited)
+
+    lines = out.getvalue().splitlines()
+    self.assertEqual(lines[0], '{"domain": "b.com", "properties": []}')
+    self.assertEqual(sorted(lines[1:]), ['{"domain": "%s.com", "properties": ["Foo"]}' % x for x in "acdef"])
+    self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_concurrency.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import heapq
+import itertools
+import unittest
+
+from techscav import AIMDController, cpu_seconds
+
+def simulate(controller, capacity, latency, duration, cpu=None):
+  """
+  Runs an endless crawl against a system that serves up to capacity
+  requests at once in the given latency, and slows down evenly past that.
+  cpu, if given, maps the requests in flight to the CPU use. Returns the
+  limit and the throughput of every interval.
+  """
+  now = 0.0
+  keys = itertools.count()
+  running = []
+  history = []
+  next_update = controller.interval
+  controller.due(now)
+  while now < duration:
+    while len(running) < controller.limit:
+      key = next(keys)
+      controller.start(key, now)
+      heapq.heappush(running, (now + latency * max(1.0, (len(running) + 1.0) / capacity), key))
+    finished, key = running[0]
+    if finished >= next_update:
+      now = next_update
+      controller.update(now, cpu(len(running)) if cpu else None)
+      history.append((controller.limit, controller.throughput))
+      next_update += controller.interval
+      continue
+    heapq.heappop(running)
+    now = finished
+    controller.done(key, now)
+  return history
+
+class TestAIMDController(unittest.TestCase):
+
+  def test_converges_on_latency(self):
+    for capacity in (4, 16, 50):
+      c = AIMDController(minimum=1, maximum=200, interval=1)
+      history = simulate(c, capacity, 0.1, 400)
+      limits = [x[0] for x in history[200:]]
+      self.assertTrue(min(limits) >= capacity / 2, (capacity, min(limits)))
+      self.assertTrue(max(limits) <= capacity * 2, (capacity, max(limits)))
+      throughput = sum(x[1] for x in history[200:]) / len(limits)
+      self.assertTrue(throughput > 0.7 * capacity / 0.1, (capacity, throughput))
+
+  def test_converges_on_cpu(self):
+    c = AIMDController(minimum=1, maximum=200, interval=1)
+    history = simulate(c, 1000, 0.1, 200, cpu=lambda n: n / 20.0)
+    limits = [x[0] for x in history[100:]]
+    self.assertTrue(min(limits) >= 8)
+    self.assertTrue(max(limits) <= 19)
+
+  def test_bounds(self):
+    c = AIMDController(minimum=3, maximum=5, interval=1)
+    self.assertEqual(c.limit, 3)
+    history = simulate(c, 100, 0.1, 50)
+    self.assertEqual(history[-1][0], 5)
+    history = simulate(c, 100, 0.1, 100, cpu=lambda n: 1.0)
+    self.assertEqual(history[-1][0], 3)
+
+  def test_idle(self):
+    c = AIMDController(minimum=1, maximum=10, start=4, interval=1)
+    c.due(0)
+    c.start("a", 0)
+    c.done("a", 0.1)
+    self.assertEqual(c.update(1), 4)
+    self.assertEqual(c.throughput, 1)
+
+  def test_cpu_seconds(self):
+    sum(xrange(1000000))
+    self.assertTrue(cpu_seconds([os.getpid()]) > 0)
+    self.assertEqual(cpu_seconds([None]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_dedup.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import unittest
+import hashlib
+from multiprocessing import Process, Queue
+
+from techscav import SharedBloomFilter
+
+def digest(i):
+  return hashlib.md5("http://domain%d.com/" % i).digest()
+
+def add_range(f, start, end, out):
+  out.put(sum(1 for i in xrange(start, end) if f.add(digest(i))))
+
+class TestSharedBloomFilter(unittest.TestCase):
+
+  def test_add(self):
+    f = SharedBloomFilter(1000, 0.01)
+    self.assertNotIn(digest(1), f)
+    self.assertTrue(f.add(digest(1)))
+    self.assertIn(digest(1), f)
+    self.assertFalse(f.add(digest(1)))
+    self.assertEqual(len(f), 1)
+
+  def test_journal(self):
+    f = SharedBloomFilter(1000, 0.01)
+    f.add(digest(1))
+    f.journal = []
+    for i in (1, 2, 3, 2):
+      f.add(digest(i))
+    self.assertEqual(f.journal, [digest(2), digest(3)])
+    g = SharedBloomFilter(1000, 0.01)
+    g.add(digest(1))
+    for x in f.journal:
+      g.add(x)
+    self.assertEqual(g.dump(), f.dump())
+
+  def test_bounded(self):
+    f = SharedBloomFilter(10000, 0.01, stripes=16)
+    memory = f.memory
+    self.assertTrue(memory < 10000 * 2)
+    for i in xrange(50000):
+      f.add(digest(i))
+    self.assertEqual(f.memory, memory)
+
+  def test_false_positive_rate(self):
+    f = SharedBloomFilter(10000, 0.01)
+    for i in xrange(10000):
+      f.add(digest(i))
+    self.assertAlmostEqual(f.false_positive_rate(), 0.01, delta=0.005)
+    false_positives = sum(1 for i in xrange(10000, 30000) if digest(i) in f)
+    self.assertTrue(false_positives < 20000 * 0.02)
+
+  def test_shared(self):
+    f = SharedBloomFilter(10000, 0.001)
+    out = Queue()
+    workers = [Process(target=add_range, args=(f, 0, 1000, out)) for i in xrange(4)]
+    for w in workers:
+      w.start()
+    for w in workers:
+      w.join()
+    added = sum(out.get() for w in workers)
+    self.assertEqual(added, len(f))
+    self.assertTrue(998 <= added <= 1000)
+    self.assertFalse(f.add(digest(10)))
+
+if __name__ == '__main__':
+    unittest.main()
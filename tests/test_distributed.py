@@ -0,0 +1,153 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_distributed.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import json
+import unittest
+import threading
+from Queue import Empty
+from multiprocessing import AuthenticationError, Process, Queue, Value
+from StringIO import StringIO
+
+from mocks import LinkingChecker, MockFile
+from techscav import Coordinator, DomainsFile, Node, Property, ResultWriter, is_loopback, parse_address
+
+PORT_NUMBER = 9603
+
+CONFIG = {"properties":[{"name": "Foo", "domains": ["foo.com"]}, {"name": "Bar", "domains": ["bar.com"]}]}
+
+class PeakCoordinator(Coordinator):
+  """
+  Records the most requests leased at once
+  """
+  peak = 0
+
+  def lease(self, worker):
+    answer = super(PeakCoordinator, self).lease(worker)
+    self.peak = max(self.peak, self.dispatched)
+    return answer
+
+
+def drain(queue):
+  items = []
+  while True:
+    try:
+      items.append(queue.get(True, 0.5))
+    except Empty:
+      return items
+
+
+class TestDistributed(unittest.TestCase):
+
+  def setUp(self):
+    self.properties = Property.from_config(CONFIG)
+    self.visited = Queue()
+    self.once = Value('i', 0)
+    self.domains = ["d%d.com" % i for i in xrange(10)]
+    self.expected = []
+    for d in self.domains:
+      self.expected += ["http://%s" % d] + ["http://%s/%s" % (d, x) for x in ("0", "1", "0/0", "0/1", "1/0", "1/1")]
+
+  def node(self, port, smp=2, config=CONFIG, authkey=None, **kwargs):
+    """
+    Makes a node the way another machine would, with its own property keys
+    """
+    properties = Property.from_config(config)
+    key = [key for key, p in properties.items() if p.name == "Foo"][0]
+    checker = LinkingChecker(key, self.visited, self.once, **kwargs)
+    return Node(("localhost", port), properties, smp, checker, authkey)
+
+  def coordinator(self, port, domains, host="localhost", smp=4, cls=Coordinator, **kwargs):
+    out = StringIO()
+    c = cls(DomainsFile(MockFile("\n".join(domains))), self.properties, smp, (host, port),
+                    use_robots=False, depth=3, writer=ResultWriter(out, self.properties, "jsonl"), **kwargs)
+    return c, out
+
+  def crawl(self, port, nodes, **kwargs):
+    c, out = self.coordinator(port, self.domains, **kwargs)
+    processes = [Process(target=n.start) for n in nodes]
+    for p in processes:
+      p.start()
+    c.start()
+    for p in processes:
+      p.join(10)
+    c.dump()
+    results = map(json.loads, out.getvalue().splitlines())
+    self.assertEqual(sorted(x["domain"] for x in results), sorted(self.domains))
+    for x in results:
+      self.assertEqual(x["properties"], ["Foo"])
+    self.assertEqual((c.leases, c.active, c.dispatched, c.connections, c.processes), ({}, {}, 0, 0, 0))
+    return c, drain(self.visited)
+
+  def test_crawl(self):
+    c, visited = self.crawl(PORT_NUMBER, [self.node(PORT_NUMBER) for i in xrange(3)])
+    self.assertEqual(sorted(visited), sorted(self.expected))
+    self.assertEqual((c.expired, c.late), (0, 0))
+
+  def test_window(self):
+    # two nodes have more processes than the coordinator has threads, and
+    # all of them get work at once
+    port = PORT_NUMBER + 4
+    nodes = [self.node(port, smp=3, delay=0.05) for i in xrange(2)]
+    c, visited = self.crawl(port, nodes, smp=1, batch_size=1, cls=PeakCoordinator)
+    self.assertEqual(sorted(visited), sorted(self.expected))
+    self.assertTrue(c.peak > 1 * 2 * 1, c.peak)
+
+  def test_dead_worker(self):
+    url = "http://d3.com/0"
+    nodes = [self.node(PORT_NUMBER + 1, die_on=url) for i in xrange(2)]
+    c, visited = self.crawl(PORT_NUMBER + 1, nodes)
+    self.assertEqual(sorted(visited), sorted(self.expected))
+    self.assertTrue(c.expired >= 1)
+
+  def test_expired_lease(self):
+    url = "http://d3.com/0"
+    nodes = [self.node(PORT_NUMBER + 2, hang_on=url) for i in xrange(2)]
+    c, visited = self.crawl(PORT_NUMBER + 2, nodes, lease_ttl=0.5)
+    # the page it hung on was made again, and the one that hung came too late
+    self.assertEqual(set(visited), set(self.expected))
+    self.assertEqual(visited.count(url), 2)
+    self.assertTrue(c.expired >= 1)
+    self.assertTrue(c.late >= 1)
+
+  def test_turned_away(self):
+    port = PORT_NUMBER + 3
+    c, out = self.coordinator(port, self.domains[:1], authkey="secret")
+    thread = threading.Thread(target=c.start)
+    thread.start()
+    try:
+      self.assertRaises(AuthenticationError, self.node(port, authkey="wrong").connect)
+      other = {"properties":[{"name": "Foo", "domains": ["foo.com", "bar.com"]}, {"name": "Bar", "domains": ["bar.com"]}]}
+      self.assertRaises(ValueError, self.node(port, config=other, authkey="secret").connect)
+    finally:
+      node = Process(target=self.node(port, authkey="secret").start)
+      node.start()
+      node.join(10)
+      thread.join(10)
+    c.dump()
+    self.assertEqual(json.loads(out.getvalue()), {"domain": "d0.com", "properties": ["Foo"]})
+
+  def test_parse_address(self):
+    self.assertEqual(parse_address("10.0.0.1:9000"), ("10.0.0.1", 9000))
+    self.assertEqual(parse_address(":9000"), ("127.0.0.1", 9000))
+    self.assertEqual(parse_address("[::1]:9000"), ("::1", 9000))
+    self.assertRaises(ValueError, parse_address, "10.0.0.1")
+
+  def test_needs_key(self):
+    # reading what a worker sends can run code, so only localhost goes without a key
+    self.assertRaises(ValueError, self.coordinator, PORT_NUMBER, self.domains, host="0.0.0.0")
+    self.assertRaises(ValueError, self.coordinator, PORT_NUMBER, self.domains, host="")
+    c, out = self.coordinator(PORT_NUMBER, self.domains, host="0.0.0.0", authkey="secret")
+    self.assertEqual(c.address, ("0.0.0.0", PORT_NUMBER))
+    self.assertTrue(is_loopback("127.0.0.1") and is_loopback("localhost") and not is_loopback("10.0.0.1"))
+
+if __name__ == '__main__':
+    unittest.main()
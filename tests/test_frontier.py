@@ -0,0 +1,112 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_frontier.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import heapq
+import random
+import shutil
+import tempfile
+import unittest
+
+from techscav import BlockQueue, SpillQueue
+
+def rss():
+  """
+  Gets the resident memory of this process in bytes
+  """
+  with open("/proc/self/statm") as f:
+    return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+class TestSpillQueue(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, "queue")
+
+  def tearDown(self):
+    shutil.rmtree(self.dir, True)
+
+  def test_block_queue(self):
+    q = BlockQueue(self.path, chunksize=3, block_size=4)
+    for i in xrange(30):
+      q.push(i)
+    self.assertEqual(len(q), 30)
+    self.assertEqual([q.pop() for i in xrange(6)], range(6))
+    self.assertEqual(list(q), range(6, 30))
+    q.push(30)
+    self.assertEqual([q.pop() for i in xrange(25)], range(6, 31))
+    self.assertEqual(q.pop(), None)
+    q.close()
+
+  def test_order(self):
+    rnd = random.Random(7)
+    q = SpillQueue(self.path, block_size=3)
+    expected = []
+    for i in xrange(5000):
+      if rnd.random() < 0.6:
+        priority = rnd.randint(0, 3)
+        q.push((priority, i), priority, spill=rnd.random() < 0.5)
+        heapq.heappush(expected, (-priority, i))
+      else:
+        item = q.pop()
+        if expected:
+          priority, j = heapq.heappop(expected)
+          self.assertEqual(item, (-priority, j))
+        else:
+          self.assertEqual(item, None)
+      self.assertEqual(len(q), len(expected))
+      if i % 500 == 0:
+        self.assertEqual(sorted(q), sorted((-p, j) for p, j in expected))
+
+  def test_pack(self):
+    q = SpillQueue(self.path, pack=lambda x: x * 2, unpack=lambda x: x / 2)
+    q.push(1, spill=True)
+    q.push(2)
+    q.push(3, 1)
+    # 2 follows 1 to disk to keep its place
+    self.assertEqual((len(q.memory), q.spilled), (1, 2))
+    self.assertEqual(sorted(q), [1, 2, 3])
+    self.assertEqual([q.pop(), q.pop(), q.pop()], [3, 1, 2])
+    self.assertEqual(q.spilled, 0)
+
+  def test_clear(self):
+    q = SpillQueue(self.path)
+    for i in xrange(1000):
+      q.push(i, spill=True)
+    self.assertTrue(os.path.isdir(self.path))
+    q.clear()
+    self.assertFalse(os.path.exists(self.path))
+    self.assertEqual(len(q), 0)
+    self.assertEqual(q.pop(), None)
+
+  def test_memory_ceiling(self):
+    ceiling = 1000
+    items = [(1, "http://domain%d.com/page/%d" % (i % 50, i), 2, "%040x" % i) for i in xrange(ceiling)]
+    q = SpillQueue(self.path)
+    before = rss()
+    popped = 0
+    for i in xrange(1000000):
+      q.push(items[i % ceiling], i % 3, spill=len(q.memory) >= ceiling)
+      if i % 4 == 0:
+        q.pop()
+        popped += 1
+      self.assertTrue(len(q.memory) <= ceiling)
+    # a million entries kept in memory would take over 80MB
+    self.assertTrue(rss() - before < 20 * 1024 * 1024)
+    self.assertEqual(len(q), 1000000 - popped)
+    while q.pop() is not None:
+      popped += 1
+    self.assertEqual(popped, 1000000)
+    q.clear()
+
+if __name__ == '__main__':
+    unittest.main()
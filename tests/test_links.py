@@ -0,0 +1,83 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_links.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import unittest
+
+from techscav import Domain, LINK_EXTRACTORS, Property, Request, SimpleChecker
+
+PAGE = u"""<?xml version="1.0" encoding="utf-8"?>
+<html><head><base href="/docs/"><title>Caf\xe9</title></head>
+<body>
+  <!-- <a href="/commented">not a link</a> -->
+  <a href="intro.html">Intro</a>
+  <a href="/about">About</a>
+  <a href="//www.foo.com/x">Protocol relative</a>
+  <a href="https://foo.com/secure">Secure</a>
+  <a href="http://elsewhere.com/">Elsewhere</a>
+  <a href="https://elsewhere.com/">Elsewhere</a>
+  <a href="javascript:void(0)">Nothing</a>
+  <a href="mailto:me@foo.com">Mail</a>
+  <a name="anchor">No href</a>
+  <p><a href="  spaced.html ">Spaced
+</body></html>"""
+
+class TestLinks(unittest.TestCase):
+
+  def test_extractors_agree(self):
+    results = [LINK_EXTRACTORS[name]().extract(PAGE) for name in sorted(LINK_EXTRACTORS)]
+    base, links = results[0]
+    self.assertEqual(base, "/docs/")
+    self.assertEqual(len(links), 9)
+    for other in results[1:]:
+      self.assertEqual(other, results[0])
+
+  def test_empty(self):
+    for extractor in LINK_EXTRACTORS.values():
+      self.assertEqual(extractor().extract(u""), (None, []))
+      self.assertEqual(extractor().extract(u"<html></html>"), (None, []))
+
+  def test_follow_links(self):
+    p = Property("Foo", ["foo.com"])
+    request = Request("http://foo.com/", Domain("foo.com", use_robots=False), 2)
+    for name in LINK_EXTRACTORS:
+      checker = SimpleChecker({p.key: p}, links=name)
+      self.assertEqual(checker.follow_links(request, "http://foo.com/", PAGE), [
+        "http://foo.com/docs/intro.html",
+        "http://foo.com/about",
+        "http://www.foo.com/x",
+        "https://foo.com/secure",
+        "http://foo.com/docs/spaced.html",
+      ])
+
+  def test_no_base(self):
+    p = Property("Foo", ["foo.com"])
+    request = Request("http://foo.com/a/b", Domain("foo.com", use_robots=False), 2)
+    checker = SimpleChecker({p.key: p})
+    self.assertEqual(checker.follow_links(request, "http://foo.com/a/b", u'<a href="c">c</a>'),
+                     ["http://foo.com/a/c"])
+    request.depth = 1
+    self.assertEqual(checker.follow_links(request, "http://foo.com/a/b", u'<a href="c">c</a>'), [])
+
+  def test_page_links(self):
+    foo = Property("Foo", ["foo.com"])
+    bar = Property("Bar", ["bar.com"])
+    checker = SimpleChecker({foo.key: foo, bar.key: bar})
+    request = Request("http://foo.com/", Domain("foo.com", use_robots=False), 2)
+    page = u'<a href="http://cdn&#46;bar&#46;com/x">Bar</a><a href="/about">About</a>'
+    self.assertEqual(checker.matcher.match(page), set())
+    self.assertEqual(checker.page_links(request, "http://foo.com/", page),
+                     (set([foo.key, bar.key]), ["http://foo.com/about"]))
+    request.depth = 1
+    self.assertEqual(checker.page_links(request, "http://foo.com/", page), (set(), []))
+
+if __name__ == '__main__':
+    unittest.main()
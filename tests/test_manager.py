@@ -10,10 +10,66 @@
 # Author: Artur Ventura
 #
 
+import os
+import json
 import unittest
+import time
+import tempfile
+import threading
+from multiprocessing import Queue, Value
 from mock import Mock
-from mocks import MockFile
-from techscav import Manager, Property
+from mocks import MockFile, LinkingChecker
+from StringIO import StringIO
+from techscav import AIMDController, DomainsFile, Manager, Property, Request, ResultWriter, url_digest
+
+class FakeChecker(object):
+  """
+  Finds a property on every page, which one depending on the depth, and
+  links each page to two others
+  """
+  def __init__(self, *keys):
+    self.keys = keys
+
+  def check(self, request, manager):
+    if request.depth > 1:
+      for i in xrange(2):
+        manager.add_new_request(Request("%s/%d" % (request.url, i), request.domain, request.depth - 1))
+    time.sleep(0.01)
+    return [self.keys[request.depth % len(self.keys)]]
+
+  def close(self):
+    pass
+
+class RedirectChecker(object):
+  """
+  Redirects the first page of a domain to /home, which it also links to,
+  along with a link to the same page with tracking parameters. Finds a
+  property only on the pages it should not get to.
+  """
+  def __init__(self, key):
+    self.key = key
+
+  def check(self, request, manager):
+    if request.url.endswith((".com", "/home")):
+      manager.add_redirect(request, request.url + "/home")
+      for url in ("/home", "?utm_source=x"):
+        manager.add_new_request(Request(request.url + url, request.domain, request.depth - 1))
+      return []
+    return [self.key]
+
+  def close(self):
+    pass
+
+class PeakController(AIMDController):
+  """
+  Records the highest limit it got to
+  """
+  peak = 0
+
+  def update(self, *args, **kwargs):
+    result = super(PeakController, self).update(*args, **kwargs)
+    self.peak = max(self.peak, self.limit)
+    return result
 
 class TestManager(unittest.TestCase):
 
@@ -32,6 +88,199 @@ class TestManager(unittest.TestCase):
     })
     m = Manager(f, p, 1, None)
 
+  def test_start(self):
+    p = Property.from_config({
+      "properties":[
+        {
+          "name": "Foo",
+          "domains": [
+            "foo.com"
+          ]
+        },
+        {
+          "name": "Bar",
+          "domains": [
+            "bar.com"
+          ]
+        }
+      ]
+    })
+    foo = [key for key, x in p.items() if x.name == "Foo"][0]
+    domains = ["domain%d.com" % i for i in xrange(20)]
+    f = DomainsFile(MockFile("\n".join(domains)))
+    m = Manager(f, p, 4, FakeChecker(foo), use_robots=False, depth=3)
+    started = time.time()
+    m.start()
+    self.assertTrue(time.time() - started < 5)
+    self.assertEqual(sorted(m.domains.keys()), sorted(domains))
+    self.assertEqual(len(m.hits), 20 * 7)
+    self.assertEqual(m.pending.value, 0)
+
+  def test_spill(self):
+    p = Property.from_config({"properties":[
+      {"name": "Foo", "domains": ["foo.com"]}, {"name": "Bar", "domains": ["bar.com"]}
+    ]})
+    foo = [key for key, x in p.items() if x.name == "Foo"][0]
+    domains = ["domain%d.com" % i for i in xrange(5)]
+    spill_dir = tempfile.mkdtemp()
+    m = Manager(DomainsFile(MockFile("\n".join(domains))), p, 2, FakeChecker(foo), use_robots=False, depth=4,
+                frontier_memory=3, spill_dir=spill_dir)
+    m.start()
+    self.assertEqual(sorted(m.domains.keys()), sorted(domains))
+    self.assertEqual(len(m.hits), 5 * 15)
+    self.assertTrue(m.scheduler.spilled > 0)
+    self.assertEqual(os.listdir(spill_dir), [])
+    os.rmdir(spill_dir)
+
+  def test_merge_pages(self):
+    p = Property.from_config({
+      "properties":[
+        {"name": "Foo", "domains": ["foo.com"]},
+        {"name": "Bar", "domains": ["bar.com"]}
+      ]
+    })
+    out = StringIO()
+    f = DomainsFile(MockFile("a.com\nb.com"))
+    m = Manager(f, p, 2, FakeChecker(*p.keys()), use_robots=False, depth=2,
+                writer=ResultWriter(out, p, "jsonl"))
+    m.start()
+    m.dump()
+    lines = sorted(out.getvalue().splitlines())
+    self.assertEqual(lines, [
+      '{"domain": "a.com", "properties": ["Bar", "Foo"]}',
+      '{"domain": "b.com", "properties": ["Bar", "Foo"]}'
+    ])
+    self.assertEqual(m.domains, {})
+    self.assertEqual(m.results, {})
+
+  def test_duplicate_domain(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    out = StringIO()
+    f = DomainsFile(MockFile("a.com\nb.com\nwww.a.com\na.com"))
+    m = Manager(f, p, 2, FakeChecker(*p.keys()), use_robots=False, depth=2,
+                writer=ResultWriter(out, p, "jsonl"))
+    m.start()
+    m.dump()
+    # a.com is written once, and the homepage of www.a.com was crawled as
+    # the one of a.com
+    lines = sorted(map(json.loads, out.getvalue().splitlines()))
+    self.assertEqual(lines, [
+      {"domain": "a.com", "properties": ["Foo"]},
+      {"domain": "b.com", "properties": ["Foo"]},
+      {"domain": "www.a.com", "properties": [], "status": "duplicate of a.com"}
+    ])
+    self.assertEqual(m.registry, {})
+    self.assertEqual(m.progress()['domains_written'], 3)
+
+  def test_already_visited(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    m = Manager(DomainsFile(MockFile("")), p, 1, None, use_robots=False)
+    m.HOMEPAGES = 1
+    for netloc in ("a.com", "b.com"):
+      m.start_domain(m.register(netloc))
+    self.assertEqual(list(m.homepages.values()), ["b.com"])
+    # a.com was forgotten, so it can not be told from another domain
+    m.start_domain(m.register("a.com"))
+    m.start_domain(m.register("www.b.com"))
+    m.start_domain(m.register("b.com"))
+    self.assertEqual(m.statuses, {"a.com": "already visited", "www.b.com": "duplicate of b.com"})
+    self.assertEqual(len(m.registry), 2)
+
+  def test_pack(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    m = Manager(DomainsFile(MockFile("")), p, 1, None, use_robots=False, depth=2)
+    a, b = m.register("a.com"), m.register("b.com")
+    requests = [Request("http://a.com/%d" % i, a, 1) for i in xrange(3)] + [Request("http://b.com/", b, 2)]
+    message = m.pack_requests(requests)
+    self.assertEqual(message[0], {a.id: "a.com", b.id: "b.com"})
+
+    worker = Manager(DomainsFile(MockFile("")), p, 1, None, use_robots=False, depth=2)
+    unpacked = worker.unpack_requests(message)
+    self.assertEqual([r.pack() for r in unpacked], [r.pack() for r in requests])
+    self.assertEqual(unpacked[0].domain.netloc, "a.com")
+    self.assertIs(unpacked[0].domain, unpacked[2].domain)
+    self.assertIs(worker.unpack_requests(message)[3].domain, unpacked[3].domain)
+
+  def test_batches(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    m = Manager(DomainsFile(MockFile("")), p, 1, None, use_robots=False, batch_size=4)
+    for i in xrange(10):
+      m.scheduler.push(Request("http://domain%d.com/" % i, m.register("domain%d.com" % i), 1))
+    m.dispatch()
+    self.assertEqual(m.dispatched, 8)
+    self.assertEqual([len(m.queue.get()[1][1]) for i in xrange(2)], [4, 4])
+
+  def test_adaptive(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    domains = ["domain%d.com" % i for i in xrange(20)]
+    controller = AIMDController(minimum=1, maximum=4, interval=0.05)
+    m = Manager(DomainsFile(MockFile("\n".join(domains))), p, 4, FakeChecker(p.keys()[0]),
+                use_robots=False, depth=3, controller=controller)
+    m.start()
+    self.assertEqual(sorted(m.domains.keys()), sorted(domains))
+    self.assertTrue(controller.decisions > 0)
+    self.assertEqual(controller.in_flight, 0)
+
+  def test_adaptive_past_workers(self):
+    # with pages that only wait on the network the window grows past the
+    # number of workers, up to what a fixed window would be
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    domains = ["domain%d.com" % i for i in xrange(20)]
+    controller = PeakController(minimum=1, maximum=2 * 2 * 4, interval=0.05, max_cpu=1.1)
+    m = Manager(DomainsFile(MockFile("\n".join(domains))), p, 2, FakeChecker(p.keys()[0]),
+                use_robots=False, depth=3, controller=controller)
+    m.start()
+    self.assertEqual(sorted(m.domains.keys()), sorted(domains))
+    self.assertTrue(controller.peak > 2, controller.peak)
+
+  def test_stop_when_found(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    domains = ["domain%d.com" % i for i in xrange(5)]
+    m = Manager(DomainsFile(MockFile("\n".join(domains))), p, 2, FakeChecker(p.keys()[0]), use_robots=False, depth=3)
+    m.start()
+    self.assertEqual(sorted(m.domains.keys()), sorted(domains))
+    self.assertEqual(len(m.hits), 5 * 3)
+    self.assertEqual(m.scheduler.pruned, 5 * 2)
+
+  def test_budget(self):
+    p = Property.from_config({"properties":[
+      {"name": "Foo", "domains": ["foo.com"]}, {"name": "Bar", "domains": ["bar.com"]}
+    ]})
+    foo = [key for key, x in p.items() if x.name == "Foo"][0]
+    m = Manager(DomainsFile(MockFile("a.com\nb.com")), p, 2, FakeChecker(foo), use_robots=False, depth=3, max_pages=4)
+    m.start()
+    self.assertEqual(sorted(m.domains.keys()), ["a.com", "b.com"])
+    self.assertEqual(m.scheduler.over_budget, 2 * 3)
+
+
+  def test_redirect(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    domains = ["domain%d.com" % i for i in xrange(5)]
+    m = Manager(DomainsFile(MockFile("\n".join(domains))), p, 2, RedirectChecker(p.keys()[0]), use_robots=False, depth=3)
+    m.start()
+    self.assertEqual(m.domains, {})
+    self.assertEqual(len(m.hits), 5 * 2)
+    for domain in domains:
+      self.assertIn(url_digest("http://%s/home" % domain), m.hits)
+
+  def test_dead_worker(self):
+    p = Property.from_config({"properties":[
+      {"name": "Foo", "domains": ["foo.com"]}, {"name": "Bar", "domains": ["bar.com"]}
+    ]})
+    foo = [key for key, x in p.items() if x.name == "Foo"][0]
+    domains = ["d%d.com" % i for i in xrange(5)]
+    checker = LinkingChecker(foo, Queue(), Value('i', 0), die_on="http://d2.com/0")
+    m = Manager(DomainsFile(MockFile("\n".join(domains))), p, 2, checker, use_robots=False, depth=2)
+    thread = threading.Thread(target=m.start)
+    thread.daemon = True
+    thread.start()
+    thread.join(30)
+    # the crawl goes on with the worker left, and the page it died on is
+    # done with nothing found
+    self.assertFalse(thread.is_alive())
+    self.assertEqual(m.domains, dict((d, [foo]) for d in domains))
+    self.assertEqual((m.smp, len(m.workers)), (1, 1))
+    self.assertEqual((m.active, m.dispatched), ({}, 0))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,139 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_matcher.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import unittest
+import random
+import re
+
+from techscav import HostMatcher, Property, PropertyMatcher, url_host
+
+class TestPropertyMatcher(unittest.TestCase):
+
+  def slow_match(self, properties, text):
+    return set(p.key for p in properties.values() if re.search(p.re, text))
+
+  def test_empty(self):
+    m = PropertyMatcher({})
+    self.assertEqual(m.match("http://foo.com"), set())
+
+  def test_single(self):
+    p = Property("Foo", ["foo.com"])
+    m = PropertyMatcher({p.key: p})
+    self.assertEqual(m.match("--http://foo.com--"), set([p.key]))
+    self.assertEqual(m.match("--http://delta.foo.com--"), set([p.key]))
+    self.assertEqual(m.match("--http://bar.com--"), set())
+    self.assertEqual(m.match("--foo.com--"), set())
+
+  def test_overlapping_domains(self):
+    a = Property("A", ["foo.com"])
+    b = Property("B", ["foo.com.br"])
+    c = Property("C", ["bar.foo.com"])
+    props = {a.key: a, b.key: b, c.key: c}
+    m = PropertyMatcher(props)
+    self.assertEqual(m.match("<a href='http://foo.com.br/'>"), set([a.key, b.key]))
+    self.assertEqual(m.match("<a href='http://bar.foo.com/'>"), set([a.key, c.key]))
+    self.assertEqual(m.match("<a href='http://foo.co/'>"), set())
+
+  def test_same_as_regexp(self):
+    rnd = random.Random(42)
+    alphabet = "abc."
+    def word():
+      return "".join(rnd.choice(alphabet) for i in xrange(rnd.randint(1, 5)))
+    props = {}
+    for i in xrange(30):
+      p = Property("P%d" % i, [word() for j in xrange(rnd.randint(1, 3))])
+      props[p.key] = p
+    m = PropertyMatcher(props)
+    for i in xrange(300):
+      text = "".join(rnd.choice(alphabet + "/") for j in xrange(40))
+      self.assertEqual(m.match(text, stop_when_complete=False), self.slow_match(props, text))
+      self.assertEqual(m.match(text), self.slow_match(props, text))
+
+  def test_stream_split(self):
+    a = Property("A", ["foo.com"])
+    b = Property("B", ["foo.com.br"])
+    m = PropertyMatcher({a.key: a, b.key: b})
+    text = "<a href='http://foo.com.br/'>"
+    for i in xrange(len(text) + 1):
+      s = m.scanner()
+      s.feed(text[:i])
+      s.feed(text[i:])
+      self.assertEqual(s.found, set([a.key, b.key]))
+      self.assertTrue(s.complete)
+
+  def test_stream_same_as_match(self):
+    rnd = random.Random(7)
+    alphabet = "abc."
+    def word():
+      return "".join(rnd.choice(alphabet) for i in xrange(rnd.randint(1, 5)))
+    props = {}
+    for i in xrange(30):
+      p = Property("P%d" % i, [word() for j in xrange(rnd.randint(1, 3))])
+      props[p.key] = p
+    m = PropertyMatcher(props)
+    for i in xrange(300):
+      text = "".join(rnd.choice(alphabet + "/") for j in xrange(60))
+      s = m.scanner()
+      start = 0
+      while start < len(text):
+        end = start + rnd.randint(1, 7)
+        s.feed(text[start:end])
+        start = end
+      self.assertEqual(s.found, self.slow_match(props, text))
+      self.assertEqual(s.scanned, len(text))
+
+class TestHostMatcher(unittest.TestCase):
+
+  def setUp(self):
+    self.a = Property("A", ["foo.com"])
+    self.b = Property("B", ["foo.com.br", "Shop.Bar.com"])
+    self.c = Property("C", ["bar.foo.com"])
+    self.m = HostMatcher(dict((p.key, p) for p in (self.a, self.b, self.c)))
+
+  def test_hosts(self):
+    a, b, c = self.a.key, self.b.key, self.c.key
+    self.assertEqual(self.m.match_host("foo.com"), set([a]))
+    self.assertEqual(self.m.match_host("cdn.bar.foo.com"), set([a, c]))
+    self.assertEqual(self.m.match_host("FOO.com.br."), set([b]))
+    self.assertEqual(self.m.match_host("eu.shop.bar.com"), set([b]))
+    self.assertEqual(self.m.match_host("bar.com"), set())
+    self.assertEqual(self.m.match_host("barfoo.com"), set())
+    self.assertEqual(self.m.match_host("foo.com.evil.net"), set())
+    self.assertEqual(self.m.match_host("com"), set())
+
+  def test_urls(self):
+    self.assertEqual(self.m.match(["/foo.com/x", "http://x.net/?u=http://foo.com", "mailto:me@foo.com"]), set())
+    self.assertEqual(self.m.match(["//user:pw@cdn.foo.com:8080/x.js", "https://foo.com.br/"]),
+                     set([self.a.key, self.b.key]))
+    self.assertEqual(self.m.match(["http://[::1]:80/", "http:///x", ""]), set())
+    self.assertEqual(url_host("HTTP://CDN.Foo.com:80/a"), "cdn.foo.com")
+    self.assertEqual(url_host("page.html"), None)
+
+  def test_same_as_regexp_on_hosts(self):
+    rnd = random.Random(42)
+    labels = ["a", "b", "ab", "ba"]
+    def host():
+      return ".".join(rnd.choice(labels) for i in xrange(rnd.randint(1, 4)))
+    props = {}
+    for i in xrange(30):
+      p = Property("P%d" % i, [host() for j in xrange(rnd.randint(1, 3))])
+      props[p.key] = p
+    m = HostMatcher(props)
+    for i in xrange(300):
+      url = "http://%s/path" % host()
+      # a domain is a parent of the host if it matches right before the path
+      expected = set(p.key for p in props.values()
+                     if any(re.search("[./]%s/" % re.escape(d), url) for d in p.domains))
+      self.assertEqual(m.match([url]), expected, url)
+
+if __name__ == '__main__':
+    unittest.main()
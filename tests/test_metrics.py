@@ -0,0 +1,143 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_metrics.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import shutil
+import urllib2
+import tempfile
+import unittest
+from multiprocessing import Process
+
+import requests
+from mocks import LinkingChecker, MockFile
+from techscav import (BUCKETS, DeadHostError, Domain, DomainsFile, Manager, Metrics, MetricsReporter, Property,
+                      Request, SimpleChecker, error_type)
+
+PORT_NUMBER = 9608
+
+def add(metrics, n):
+  for i in xrange(n):
+    metrics.observe('download', 0.2)
+    metrics.count('bytes', 10)
+
+
+class TestMetrics(unittest.TestCase):
+
+  def test_observe(self):
+    m = Metrics(2)
+    for seconds in (0.0005, 0.001, 0.2, 0.2, 100):
+      m.observe('download', seconds)
+    m.count('pages')
+    m.count('bytes', 512)
+    m.error('timeout')
+    snapshot = m.snapshot()
+    download = snapshot['stages']['download']
+    self.assertEqual(download['count'], 5)
+    self.assertAlmostEqual(download['sum'], 100.4015)
+    self.assertEqual(download['buckets'][0], 2)
+    self.assertEqual(download['buckets'][BUCKETS.index(0.25)], 2)
+    self.assertEqual(download['buckets'][-1], 1)
+    self.assertEqual(snapshot['stages']['render']['count'], 0)
+    self.assertEqual((snapshot['counters']['pages'], snapshot['counters']['bytes']), (1, 512))
+    self.assertEqual(snapshot['errors']['timeout'], 1)
+    self.assertEqual(m.quantile('download', 0.5), 0.25)
+    self.assertEqual(m.quantile('download', 1), float('inf'))
+    self.assertIsNone(m.quantile('render', 0.5))
+
+  def test_shared(self):
+    m = Metrics(4)
+    add(m, 3)
+    workers = [Process(target=add, args=(m, 100)) for i in xrange(3)]
+    for w in workers:
+      w.start()
+    for w in workers:
+      w.join()
+    snapshot = m.snapshot()
+    self.assertEqual(snapshot['stages']['download']['count'], 303)
+    self.assertEqual(snapshot['counters']['bytes'], 3030)
+
+  def test_prometheus(self):
+    m = Metrics(1)
+    m.observe('match', 0.003)
+    m.observe('match', 7)
+    m.error('dead_host')
+    text = m.prometheus({'domains_read': 3})
+    lines = text.splitlines()
+    self.assertIn('techscav_stage_seconds_bucket{stage="match",le="0.001"} 0', lines)
+    self.assertIn('techscav_stage_seconds_bucket{stage="match",le="0.005"} 1', lines)
+    self.assertIn('techscav_stage_seconds_bucket{stage="match",le="10"} 2', lines)
+    self.assertIn('techscav_stage_seconds_bucket{stage="match",le="+Inf"} 2', lines)
+    self.assertIn('techscav_stage_seconds_count{stage="match"} 2', lines)
+    self.assertIn('techscav_errors_total{type="dead_host"} 1', lines)
+    self.assertIn('techscav_domains_read 3', lines)
+    self.assertTrue(text.endswith("\n"))
+
+  def test_error_type(self):
+    self.assertEqual(error_type(DeadHostError("down")), 'dead_host')
+    self.assertEqual(error_type(requests.exceptions.ConnectTimeout()), 'timeout')
+    self.assertEqual(error_type(requests.ConnectionError()), 'connection')
+    self.assertEqual(error_type(requests.TooManyRedirects()), 'redirects')
+    self.assertEqual(error_type(ValueError()), 'other')
+
+  def test_checker_errors(self):
+    prop = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    checker = SimpleChecker(prop)
+    domain = Domain("127.0.0.1:1", use_robots=False)
+    for i in xrange(2):
+      self.assertEqual(checker.check(Request("http://127.0.0.1:1/%d" % i, domain, 1), None), [])
+    errors = checker.metrics.snapshot()['errors']
+    self.assertEqual((errors['connection'], errors['dead_host']), (1, 1))
+
+  def test_work(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}, {"name": "Bar", "domains": ["bar.com"]}]})
+    key = [key for key, x in p.items() if x.name == "Foo"][0]
+    domains = ["domain%d.com" % i for i in xrange(5)]
+    m = Manager(DomainsFile(MockFile("\n".join(domains))), p, 2, LinkingChecker(key), use_robots=False, depth=2, batch_size=1)
+    m.start()
+    snapshot = m.metrics.snapshot()
+    self.assertEqual(snapshot['counters']['pages'], 15)
+    self.assertEqual(snapshot['stages']['queue']['count'], 15)
+    self.assertEqual(m.progress(), {'domains_read': 5, 'domains_written': 5, 'requests_pending': 0})
+
+
+class TestMetricsReporter(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_report(self):
+    p = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    metrics = Metrics(1)
+    metrics.count('pages', 7)
+    manager = Manager(DomainsFile(MockFile("a.com")), p, 1, None, use_robots=False)
+    path = os.path.join(self.dir, "techscav.prom")
+    reporter = MetricsReporter(metrics, manager, interval=0.05, path=path, port=PORT_NUMBER)
+    reporter.start()
+    try:
+      manager.read_domain()
+      served = urllib2.urlopen("http://127.0.0.1:%d/metrics" % PORT_NUMBER).read()
+      self.assertIn("techscav_pages_total 7\n", served)
+      self.assertIn("techscav_domains_read 1\n", served)
+      self.assertRaises(urllib2.HTTPError, urllib2.urlopen, "http://127.0.0.1:%d/other" % PORT_NUMBER)
+    finally:
+      reporter.stop()
+    with open(path) as f:
+      written = f.read()
+    self.assertIn("techscav_pages_total 7\n", written)
+    self.assertFalse(os.path.exists(path + ".tmp"))
+    self.assertIn("# TYPE techscav_stage_seconds histogram", written)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_output.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import json
+import unittest
+from StringIO import StringIO
+
+from techscav import Property, ResultWriter
+
+class TestResultWriter(unittest.TestCase):
+
+  def setUp(self):
+    self.foo = Property("Foo", ["foo.com"])
+    self.bar = Property("Bar", ["bar.com"])
+    self.properties = {self.foo.key: self.foo, self.bar.key: self.bar}
+
+  def test_text(self):
+    out = StringIO()
+    w = ResultWriter(out, self.properties)
+    w.write("a.com", [self.foo.key, self.bar.key, self.foo.key])
+    w.write("b.com", [])
+    w.close()
+    self.assertEqual(out.getvalue(), "a.com: Bar, Foo\n")
+    # b.com is done too, even if nothing is written for it
+    self.assertEqual(w.written, 2)
+
+  def test_jsonl(self):
+    out = StringIO()
+    w = ResultWriter(out, self.properties, "jsonl")
+    w.write("a.com", [self.foo.key])
+    w.write("b.com", [])
+    w.close()
+    self.assertEqual(out.getvalue(), '{"domain": "a.com", "properties": ["Foo"]}\n'
+                                     '{"domain": "b.com", "properties": []}\n')
+
+  def test_csv(self):
+    out = StringIO()
+    w = ResultWriter(out, self.properties, "csv")
+    w.write("a.com", [self.foo.key, self.bar.key])
+    w.write("b.com", [], "unresolvable")
+    w.close()
+    self.assertEqual(out.getvalue(), "domain,properties,status\r\na.com,Bar;Foo,\r\nb.com,,unresolvable\r\n")
+
+  def test_status(self):
+    out = StringIO()
+    w = ResultWriter(out, self.properties)
+    w.write("a.com", [], "unresolvable")
+    w.close()
+    self.assertEqual(out.getvalue(), "a.com: [unresolvable]\n")
+    out = StringIO()
+    w = ResultWriter(out, self.properties, "jsonl")
+    w.write("a.com", [], "unresolvable")
+    w.close()
+    self.assertEqual(json.loads(out.getvalue()), {"domain": "a.com", "properties": [], "status": "unresolvable"})
+
+  def test_batches(self):
+    out = StringIO()
+    w = ResultWriter(out, self.properties, "jsonl", batch_size=2, interval=60)
+    w.write("a.com", [self.foo.key])
+    self.assertEqual(out.getvalue(), "")
+    w.write("b.com", [self.foo.key])
+    self.assertEqual(len(out.getvalue().splitlines()), 2)
+    w.write("c.com", [self.foo.key])
+    self.assertEqual(len(out.getvalue().splitlines()), 2)
+    w.close()
+    self.assertEqual(len(out.getvalue().splitlines()), 3)
+    self.assertEqual(w.written, 3)
+
+  def test_unknown_format(self):
+    self.assertRaises(ValueError, ResultWriter, StringIO(), self.properties, "xml")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_pagecache.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from mock import Mock
+
+from mocks import MockHandler, MockServer
+from techscav import Domain, PageCache, Property, Request, SimpleChecker, properties_signature
+
+PORT_NUMBER = 9602
+
+PAGE = '<a href="/next">next</a><script src="http://foo.com/x.js"></script>'
+
+class ConditionalHandler(MockHandler):
+  """
+  Serves a page with an ETag on /etag, one with a Last-Modified date on
+  /modified and one with neither on /plain, answering 304 when asked with
+  the validator it has. Counts the bodies sent.
+  """
+
+  def do_GET(self):
+    if self.path == "/etag" and self.headers.get("If-None-Match") == '"v1"':
+      self.send_response(304)
+      self.end_headers()
+      return
+    if self.path == "/modified" and self.headers.get("If-Modified-Since") == "Wed, 27 Apr 2016 18:46:00 GMT":
+      self.send_response(304)
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header('Content-type', 'text/html')
+    if self.path == "/etag":
+      self.send_header('ETag', '"v1"')
+    elif self.path == "/modified":
+      self.send_header('Last-Modified', "Wed, 27 Apr 2016 18:46:00 GMT")
+    self.end_headers()
+    self.wfile.write(PAGE)
+    self.server.bodies += 1
+
+
+class TestPageCache(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, "pages.db")
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_put(self):
+    pages = PageCache(self.path, "a")
+    pages.put("d1", "http://a.com/", '"x"', None, ["Foo"], ["http://a.com/b"])
+    page = pages.get("d1")
+    self.assertEqual((page.url, page.found, page.links), ("http://a.com/", ["Foo"], ["http://a.com/b"]))
+    self.assertEqual(page.headers(), {"If-None-Match": '"x"'})
+    self.assertIsNone(pages.get("d2"))
+    # the next run
+    self.assertEqual(PageCache(self.path, "a").get("d1").found, ["Foo"])
+    # searching for other properties
+    self.assertIsNone(PageCache(self.path, "b").get("d1"))
+
+  def test_since(self):
+    pages = PageCache(self.path)
+    pages.put("d1", "http://a.com/", '"x"', None, [], None)
+    self.assertIsNotNone(PageCache(self.path, since=time.time() - 60).get("d1"))
+    self.assertIsNone(PageCache(self.path, since=time.time() + 60).get("d1"))
+
+  def test_evict(self):
+    pages = PageCache(self.path, max_size=5000)
+    pages.EVICT_EVERY = 1000
+    for i in xrange(200):
+      pages.put("d%d" % i, "http://a.com/%d" % i, '"x"', None, ["Foo"], ["http://a.com/%d/next" % i])
+    pages.revalidated("d0")
+    pages.close()
+    self.assertTrue(pages.size() <= 5000)
+    self.assertTrue(pages.evicted.value > 0)
+    self.assertEqual(len(pages) + pages.evicted.value, 200)
+    # the least recently used go first
+    self.assertIsNotNone(pages.get("d0"))
+    self.assertIsNotNone(pages.get("d199"))
+    self.assertIsNone(pages.get("d1"))
+
+  def test_signature(self):
+    a = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com", "x.com"]}]})
+    b = Property.from_config({"properties":[{"name": "Foo", "domains": ["x.com", "foo.com"]}]})
+    c = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    self.assertEqual(properties_signature(a), properties_signature(b))
+    self.assertNotEqual(properties_signature(a), properties_signature(c))
+
+
+class TestIncremental(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = MockServer(PORT_NUMBER, ConditionalHandler, bodies=0)
+    cls.server.start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.close()
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, "pages.db")
+    self.domain = Domain("localhost:%d" % PORT_NUMBER, use_robots=False)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def run_once(self, path, depth=2):
+    """
+    Checks a page the way a new run would, with new property keys
+    """
+    properties = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+    pages = PageCache(self.path, properties_signature(properties))
+    checker = SimpleChecker(properties, pages=pages)
+    manager = Mock(robots=None)
+    result = checker.check(Request("http://localhost:%d%s" % (PORT_NUMBER, path), self.domain, depth), manager)
+    self.assertEqual(result, properties.keys())
+    links = [x[0][0].url for x in manager.add_new_request.call_args_list]
+    return links, pages
+
+  def test_not_modified(self):
+    for path in ("/etag", "/modified"):
+      bodies = self.server.server.bodies
+      links, pages = self.run_once(path)
+      self.assertEqual(pages.served.value, 0)
+      self.assertEqual(pages.stored.value, 1)
+      for i in xrange(2):
+        cached, pages = self.run_once(path)
+        self.assertEqual(cached, links)
+        self.assertEqual(pages.served.value, 1)
+      self.assertEqual(links, ["http://localhost:%d/next" % PORT_NUMBER])
+      self.assertEqual(self.server.server.bodies - bodies, 1)
+
+  def test_no_validators(self):
+    bodies = self.server.server.bodies
+    for i in xrange(2):
+      links, pages = self.run_once("/plain")
+      self.assertEqual((pages.served.value, len(pages)), (0, 0))
+    self.assertEqual(self.server.server.bodies - bodies, 2)
+
+  def test_links_needed(self):
+    bodies = self.server.server.bodies
+    links, pages = self.run_once("/etag", depth=1)
+    self.assertEqual(links, [])
+    # the links were not looked for, so the page is fetched whole
+    links, pages = self.run_once("/etag", depth=2)
+    self.assertEqual(pages.served.value, 0)
+    self.assertEqual(links, ["http://localhost:%d/next" % PORT_NUMBER])
+    links, pages = self.run_once("/etag", depth=1)
+    self.assertEqual(pages.served.value, 1)
+    self.assertEqual(self.server.server.bodies - bodies, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_renderer.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import sys
+import time
+import unittest
+import threading
+
+from techscav import Domain, PhantomJSChecker, Property, Request, RenderError, RendererPool, resource_extensions
+
+FAKE = [sys.executable, os.path.join(os.path.dirname(__file__), "fake_renderer.py")]
+
+class TestRendererPool(unittest.TestCase):
+
+  def test_reuse(self):
+    pool = RendererPool(FAKE, max_pages=10)
+    first = pool.render("http://foo.com/1")
+    second = pool.render("http://foo.com/2")
+    self.assertEqual(second['url'], "http://foo.com/2")
+    self.assertEqual(first['content'], second['content'])
+    self.assertEqual(pool.started, 1)
+    pool.close()
+
+  def test_recycle_after_pages(self):
+    pool = RendererPool(FAKE, max_pages=2)
+    contents = [pool.render("http://foo.com/%d" % i)['content'] for i in xrange(4)]
+    self.assertEqual(contents[0], contents[1])
+    self.assertNotEqual(contents[1], contents[2])
+    self.assertEqual(pool.started, 2)
+    self.assertEqual(pool.recycled, 2)
+    pool.close()
+
+  def test_recycle_after_memory(self):
+    pool = RendererPool(FAKE, max_memory=1)
+    pool.render("http://foo.com/1")
+    pool.render("http://foo.com/2")
+    self.assertEqual(pool.started, 2)
+    pool.close()
+
+  def test_timeout(self):
+    pool = RendererPool(FAKE, timeout=0.5)
+    started = time.time()
+    self.assertRaises(RenderError, pool.render, "http://foo.com/hang")
+    self.assertTrue(time.time() - started < 5)
+    self.assertEqual(pool.render("http://foo.com/1")['url'], "http://foo.com/1")
+    self.assertEqual(pool.started, 2)
+    pool.close()
+
+  def test_crash(self):
+    pool = RendererPool(FAKE)
+    self.assertRaises(RenderError, pool.render, "http://foo.com/crash")
+    self.assertEqual(pool.render("http://foo.com/1")['url'], "http://foo.com/1")
+    pool.close()
+
+  def test_health_check(self):
+    pool = RendererPool(FAKE, ping_after=0)
+    pool.render("http://foo.com/1")
+    renderer = pool.acquire()
+    self.assertTrue(renderer.ping())
+    renderer.kill()
+    pool.release(renderer)
+    self.assertEqual(pool.render("http://foo.com/2")['url'], "http://foo.com/2")
+    self.assertEqual(pool.started, 2)
+    pool.close()
+
+  def test_concurrent(self):
+    pool = RendererPool(FAKE, size=2)
+    results = []
+    def render(i):
+      results.append(pool.render("http://foo.com/%d" % i))
+    threads = [threading.Thread(target=render, args=(i,)) for i in xrange(6)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(len(results), 6)
+    self.assertTrue(pool.started <= 2)
+    pool.close()
+
+
+class TestPhantomJSChecker(unittest.TestCase):
+
+  def setUp(self):
+    self.p = Property("Foo", ["foo.com"])
+    self.d = Domain("bar.com", use_robots=False)
+
+  def test_check(self):
+    checker = PhantomJSChecker({self.p.key: self.p}, None, command=FAKE)
+    self.assertEqual(set(checker.check(Request("http://bar.com/", self.d, 1), None)), set([self.p.key]))
+    self.assertEqual(checker.rendered.value, 1)
+    self.assertEqual(checker.blocked.value, 0)
+    checker.close()
+
+  def test_check_once_per_property(self):
+    bar = Property("Bar", ["bar.com"])
+    checker = PhantomJSChecker({self.p.key: self.p, bar.key: bar}, None, command=FAKE)
+    result = checker.check(Request("http://bar.com/", self.d, 1), None)
+    self.assertEqual(sorted(result), sorted([self.p.key, bar.key]))
+    checker.close()
+
+  def test_resource_extensions(self):
+    self.assertEqual(resource_extensions(["font", ".PDF", "woff"]), ["woff", "woff2", "ttf", "otf", "eot", "pdf"])
+
+  def test_block(self):
+    checker = PhantomJSChecker({self.p.key: self.p}, None, command=FAKE, block=["image", "font"])
+    self.assertEqual(checker.command[-1], "--block=%s" % ",".join(resource_extensions(["image", "font"])))
+    self.assertEqual(set(checker.check(Request("http://bar.com/", self.d, 1), None)), set([self.p.key]))
+    self.assertEqual(checker.blocked.value, 2)
+    checker.close()
+
+  def test_budget(self):
+    checker = PhantomJSChecker({self.p.key: self.p}, None, command=FAKE, render_budget=0.2)
+    self.assertEqual(checker.render_timeout, 30)
+    self.assertEqual(set(checker.check(Request("http://bar.com/slow", self.d, 1), None)), set([self.p.key]))
+    self.assertEqual(checker.partial.value, 1)
+    checker.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_resolver.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import json
+import time
+import tempfile
+import unittest
+from multiprocessing import Process, Queue
+from StringIO import StringIO
+
+from mocks import MockFile, StubResolver
+from techscav import (DNSCache, DomainResolver, DomainsFile, Manager, Property, ResultWriter,
+                      SystemResolver, host_of)
+
+class FoundChecker(object):
+  """
+  Finds a property on every page, without fetching it
+  """
+  def __init__(self, key):
+    self.key = key
+
+  def check(self, request, manager):
+    return [self.key]
+
+  def close(self):
+    pass
+
+
+def lookup(cache, host, out):
+  out.put(cache.get(host))
+
+
+class TestDNSCache(unittest.TestCase):
+
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def test_ttl(self):
+    cache = DNSCache(self.path, ttl=10)
+    now = time.time()
+    cache.put("A.com", ["10.0.0.1", "10.0.0.2"], now)
+    cache.put("gone.com", [], now)
+    self.assertEqual(cache.get("a.com", now + 5), ["10.0.0.1", "10.0.0.2"])
+    self.assertEqual(cache.get("gone.com", now + 5), [])
+    self.assertIsNone(cache.get("a.com", now + 11))
+    self.assertIsNone(cache.get("b.com", now))
+    self.assertEqual((cache.hits.value, cache.misses.value), (2, 2))
+
+  def test_shared(self):
+    cache = DNSCache(self.path)
+    out = Queue()
+    p = Process(target=lookup, args=(cache, "a.com", out))
+    cache.put("a.com", ["10.0.0.1"])
+    p.start()
+    self.assertEqual(out.get(True, 5), ["10.0.0.1"])
+    p.join()
+    # and the following runs
+    self.assertEqual(DNSCache(self.path).get("a.com"), ["10.0.0.1"])
+
+  def test_temporary(self):
+    cache = DNSCache()
+    self.assertTrue(os.path.exists(cache.path))
+    cache.close()
+    self.assertFalse(os.path.exists(cache.path))
+
+
+class TestDomainResolver(unittest.TestCase):
+
+  def test_resolve(self):
+    stub = StubResolver({"a.com": ["10.0.0.1"]})
+    resolver = DomainResolver(stub)
+    self.assertEqual(resolver.resolve("a.com:8080"), ["10.0.0.1"])
+    self.assertEqual(resolver.resolve("a.com"), ["10.0.0.1"])
+    self.assertEqual(resolver.resolve("gone.com"), [])
+    self.assertEqual(resolver.resolve("gone.com"), [])
+    self.assertEqual(stub.lookups, ["a.com", "gone.com"])
+    resolver.close()
+
+  def test_unknown_is_not_kept(self):
+    stub = StubResolver({})
+    stub.resolve = lambda host: None
+    resolver = DomainResolver(stub)
+    self.assertIsNone(resolver.resolve("slow.com"))
+    self.assertIsNone(resolver.cache.get("slow.com"))
+    resolver.close()
+
+  def test_host_of(self):
+    self.assertEqual(host_of("a.com"), "a.com")
+    self.assertEqual(host_of("a.com:8080"), "a.com")
+    self.assertEqual(host_of("[::1]:8080"), "::1")
+
+  def test_system(self):
+    self.assertIn("127.0.0.1", SystemResolver().resolve("127.0.0.1"))
+
+
+class TestPreResolution(unittest.TestCase):
+
+  def setUp(self):
+    self.properties = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+
+  def crawl(self, domains, stub, threads=8):
+    out = StringIO()
+    resolver = DomainResolver(stub, threads=threads)
+    m = Manager(DomainsFile(MockFile("\n".join(domains))), self.properties, 2, FoundChecker(self.properties.keys()[0]),
+                use_robots=False, writer=ResultWriter(out, self.properties, "jsonl"), resolver=resolver)
+    m.start()
+    m.dump()
+    return m, dict((x["domain"], x) for x in map(json.loads, out.getvalue().splitlines()))
+
+  def test_unresolvable(self):
+    domains = ["a%d.test" % i for i in xrange(10)] + ["gone%d.test" % i for i in xrange(5)]
+    stub = StubResolver(dict((d, ["127.0.0.1"]) for d in domains if d.startswith("a")))
+    m, results = self.crawl(domains, stub)
+    self.assertEqual(sorted(results), sorted(domains))
+    for domain in domains:
+      if domain.startswith("gone"):
+        self.assertEqual(results[domain], {"domain": domain, "properties": [], "status": "unresolvable"})
+      else:
+        self.assertEqual(results[domain], {"domain": domain, "properties": ["Foo"]})
+    self.assertEqual((m.resolver.resolved, m.resolver.unresolvable), (10, 5))
+    # only the domains that resolved were crawled
+    self.assertEqual(len(m.hits), 10)
+    self.assertEqual(m.resolving, {})
+
+  def test_concurrent(self):
+    domains = ["a%d.test" % i for i in xrange(40)]
+    stub = StubResolver(dict((d, ["127.0.0.1"]) for d in domains), delay=0.2)
+    started = time.time()
+    m, results = self.crawl(domains, stub, threads=20)
+    # one at a time it would take 8s
+    self.assertTrue(time.time() - started < 4)
+    self.assertEqual(len(results), 40)
+
+if __name__ == '__main__':
+    unittest.main()
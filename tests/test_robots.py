@@ -0,0 +1,137 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_robots.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Process
+
+from mocks import MockHandler, MockServer
+from techscav import Domain, RobotRules, RobotsCache
+
+PORT_NUMBER = 9597
+
+class MockServerHandler(MockHandler):
+
+  def do_GET(self):
+    self.server.fetches += 1
+    self.send_response(200)
+    self.send_header('Content-type','text/plain')
+    self.end_headers()
+    self.wfile.write("""User-agent: *
+Disallow: /search
+Crawl-delay: 3
+""")
+
+def lookup(path):
+  RobotsCache(path).get("localhost:%d" % PORT_NUMBER)
+
+
+class TestRobotRules(unittest.TestCase):
+
+  def test_crawl_delay(self):
+    r = RobotRules()
+    r.parse("""User-agent: slowbot
+Crawl-delay: 20
+
+User-agent: *
+Disallow: /search
+Crawl-delay: 5
+""".split("\n"))
+    self.assertEqual(r.crawl_delay("*"), 5)
+    self.assertEqual(r.crawl_delay("SlowBot/1.0"), 20)
+    self.assertFalse(r.can_fetch("*", "http://foo.com/search"))
+
+  def test_no_crawl_delay(self):
+    r = RobotRules()
+    r.parse(["User-agent: *", "Disallow: /search"])
+    self.assertEqual(r.crawl_delay("*"), None)
+
+  def test_from_response(self):
+    self.assertFalse(RobotRules.from_response(403, "").can_fetch("*", "http://foo.com/"))
+    self.assertTrue(RobotRules.from_response(404, "").can_fetch("*", "http://foo.com/"))
+    self.assertTrue(RobotRules.from_response(0, "").can_fetch("*", "http://foo.com/"))
+
+
+class TestRobotsCache(unittest.TestCase):
+
+  def setUp(self):
+    self.server = MockServer(PORT_NUMBER, MockServerHandler, fetches=0)
+    self.server.start()
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, "robots.db")
+    self.netloc = "localhost:%d" % PORT_NUMBER
+
+  def test_hit_and_miss(self):
+    cache = RobotsCache(self.path)
+    self.assertEqual(cache.peek(self.netloc), None)
+    self.assertFalse(cache.can_fetch(self.netloc, "*", "http://%s/search" % self.netloc))
+    self.assertTrue(cache.can_fetch(self.netloc, "*", "http://%s/home" % self.netloc))
+    self.assertEqual(cache.crawl_delay(self.netloc, "*"), 3)
+    self.assertEqual(cache.misses.value, 1)
+    self.assertEqual(cache.hits.value, 1)
+    self.assertEqual(self.server.server.fetches, 1)
+
+  def test_persistent(self):
+    RobotsCache(self.path).get(self.netloc)
+    cache = RobotsCache(self.path)
+    self.assertFalse(cache.can_fetch(self.netloc, "*", "http://%s/search" % self.netloc))
+    self.assertEqual(cache.misses.value, 0)
+    self.assertEqual(self.server.server.fetches, 1)
+
+  def test_ttl(self):
+    cache = RobotsCache(self.path, ttl=0.2)
+    cache.get(self.netloc)
+    time.sleep(0.3)
+    cache.get(self.netloc)
+    self.assertEqual(cache.misses.value, 2)
+    self.assertEqual(self.server.server.fetches, 2)
+
+  def test_shared(self):
+    cache = RobotsCache(self.path)
+    p = Process(target=cache.get, args=(self.netloc,))
+    p.start()
+    p.join()
+    self.assertNotEqual(cache.peek(self.netloc), None)
+    self.assertEqual(cache.misses.value, 1)
+
+  def test_prefetch(self):
+    cache = RobotsCache(self.path)
+    cache.prefetch(self.netloc)
+    for i in xrange(50):
+      if cache.peek(self.netloc):
+        break
+      time.sleep(0.1)
+    self.assertEqual(cache.crawl_delay(self.netloc, "*"), 3)
+    cache.close()
+    self.assertTrue(os.path.exists(self.path))
+
+  def test_unreachable(self):
+    cache = RobotsCache(timeout=1)
+    self.assertTrue(cache.can_fetch("127.0.0.1:1", "*", "http://127.0.0.1:1/search"))
+    cache.close()
+    self.assertFalse(os.path.exists(cache.path))
+
+  def test_domain(self):
+    cache = RobotsCache(self.path)
+    d = Domain(self.netloc, use_robots=True)
+    self.assertFalse(d.can_i_visit("http://%s/search" % self.netloc, cache))
+    self.assertEqual(d.crawl_delay(cache), 3)
+
+  def tearDown(self):
+    self.server.close()
+    shutil.rmtree(self.dir)
+
+if __name__ == '__main__':
+    unittest.main()
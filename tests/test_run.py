@@ -0,0 +1,69 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_run.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from mocks import MockServer, PagesHandler
+
+PORT_NUMBER = 9609
+
+RUN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "run.py")
+
+class RobotsHandler(PagesHandler):
+  pages = {
+    "/robots.txt": "User-agent: *\nDisallow: /private\n",
+    "/": '<html><body><a href="/private">Private</a></body></html>',
+    "/private": '<html><body><script src="http://cdn.foo.com/foo.js"></script></body></html>',
+  }
+
+
+class TestRun(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = MockServer(PORT_NUMBER, RobotsHandler)
+    cls.server.start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.close()
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.properties = os.path.join(self.dir, "properties.json")
+    with open(self.properties, "w") as f:
+      json.dump({"properties":[{"name": "Foo", "domains": ["foo.com"]}]}, f)
+    self.domains = os.path.join(self.dir, "domains.txt")
+    with open(self.domains, "w") as f:
+      f.write("localhost:%d\n" % PORT_NUMBER)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def run_crawl(self, *args):
+    output = subprocess.check_output([sys.executable, RUN, "-p", self.properties, "-f", "jsonl", "-t", "1", "-d", "2",
+                                      "--resolver-threads", "0"] + list(args) + [self.domains])
+    return [json.loads(x)["properties"] for x in output.splitlines()]
+
+  def test_robots(self):
+    # the page with the property is disallowed unless robots.txt is ignored
+    self.assertEqual(self.run_crawl(), [[]])
+    self.assertEqual(self.run_crawl("-i"), [["Foo"]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_scheduler.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import unittest
+
+from techscav import Domain, HostScheduler, KeywordPriority, Request
+
+class TestHostScheduler(unittest.TestCase):
+
+  def setUp(self):
+    self.foo = Domain("foo.com", use_robots=False, depth=2)
+    self.bar = Domain("bar.com", use_robots=False, depth=2)
+
+  def test_max_per_host(self):
+    s = HostScheduler(max_per_host=2)
+    for i in xrange(3):
+      s.push(Request("http://foo.com/%d" % i, self.foo, 1))
+    self.assertEqual(len(s), 3)
+    self.assertEqual(s.pop(0).url, "http://foo.com/0")
+    self.assertEqual(s.pop(0).url, "http://foo.com/1")
+    self.assertEqual(s.pop(0), None)
+    self.assertEqual(s.next_ready(), None)
+    s.done("foo.com")
+    self.assertEqual(s.pop(0).url, "http://foo.com/2")
+    s.done("foo.com")
+    s.done("foo.com")
+    self.assertEqual(s.hosts, {})
+
+  def test_interleave(self):
+    s = HostScheduler(max_per_host=5)
+    for i in xrange(3):
+      s.push(Request("http://foo.com/%d" % i, self.foo, 1))
+    for i in xrange(2):
+      s.push(Request("http://bar.com/%d" % i, self.bar, 1))
+    urls = [s.pop(0).url for i in xrange(5)]
+    self.assertEqual(urls, ["http://foo.com/0", "http://bar.com/0", "http://foo.com/1",
+                            "http://bar.com/1", "http://foo.com/2"])
+
+  def test_delay(self):
+    s = HostScheduler(max_per_host=5, delay=10)
+    for i in xrange(2):
+      s.push(Request("http://foo.com/%d" % i, self.foo, 1))
+    s.push(Request("http://bar.com/0", self.bar, 1))
+    self.assertEqual(s.pop(100).url, "http://foo.com/0")
+    self.assertEqual(s.pop(100).url, "http://bar.com/0")
+    self.assertEqual(s.pop(105), None)
+    self.assertEqual(s.next_ready(), 110)
+    self.assertEqual(s.pop(110).url, "http://foo.com/1")
+
+  def test_crawl_delay(self):
+    s = HostScheduler(max_per_host=5, delay=1)
+    self.foo.crawl_delay = lambda robots=None: 30
+    for i in xrange(2):
+      s.push(Request("http://foo.com/%d" % i, self.foo, 1))
+    s.pop(0)
+    self.assertEqual(s.next_ready(), 30)
+
+  def test_best_first(self):
+    s = HostScheduler(max_per_host=1)
+    for path in ["about", "blog/2016", "help/contact", "cart"]:
+      s.push(Request("http://foo.com/%s" % path, self.foo, 1))
+    urls = []
+    for i in xrange(4):
+      urls.append(s.pop(0).url)
+      s.done("foo.com")
+    self.assertEqual(urls, ["http://foo.com/help/contact", "http://foo.com/cart",
+                            "http://foo.com/about", "http://foo.com/blog/2016"])
+
+  def test_keyword_priority(self):
+    priority = KeywordPriority(["Help", "cart"])
+    self.assertEqual(priority("http://help.foo.com/"), 0)
+    self.assertEqual(priority("http://foo.com/HELP/cart?next=cart"), 3)
+    self.assertEqual(KeywordPriority([])("http://foo.com/help"), 0)
+
+  def test_budget(self):
+    s = HostScheduler(max_pages=2)
+    self.assertTrue(s.push(Request("http://foo.com/0", self.foo, 1)))
+    self.assertTrue(s.push(Request("http://foo.com/1", self.foo, 1)))
+    self.assertFalse(s.push(Request("http://foo.com/2", self.foo, 1)))
+    self.assertTrue(s.push(Request("http://bar.com/0", self.bar, 1)))
+    self.assertEqual(s.over_budget, 1)
+    self.assertEqual(len(s), 3)
+
+  def test_close(self):
+    s = HostScheduler(max_per_host=1)
+    for i in xrange(3):
+      s.push(Request("http://foo.com/%d" % i, self.foo, 1))
+    s.push(Request("http://bar.com/0", self.bar, 1))
+    self.assertEqual(s.pop(0).url, "http://foo.com/0")
+    s.done("foo.com")
+    s.close("foo.com")
+    self.assertFalse(s.push(Request("http://foo.com/3", self.foo, 1)))
+    self.assertEqual(s.pruned, 3)
+    self.assertEqual(len(s), 1)
+    self.assertEqual(s.pop(0).url, "http://bar.com/0")
+    self.assertEqual(s.pop(0), None)
+    self.assertTrue(s.done("bar.com"))
+
+  def test_retry(self):
+    s = HostScheduler(max_per_host=1, max_pages=2)
+    s.push(Request("http://foo.com/0", self.foo, 1))
+    s.push(Request("http://foo.com/1", self.foo, 1))
+    r = s.pop(0)
+    self.assertEqual(s.pop(0), None)
+    # the slot is free again and the page does not count twice on the budget
+    self.assertTrue(s.retry(r))
+    self.assertEqual(len(s), 2)
+    self.assertEqual(sorted(x.url for x in s.requests()), ["http://foo.com/0", "http://foo.com/1"])
+    r = s.pop(0)
+    s.close("foo.com")
+    self.assertFalse(s.retry(r))
+    self.assertTrue(s.done("foo.com"))
+
+  def test_journal(self):
+    s = HostScheduler(max_per_host=1, max_pages=2)
+    s.journal = []
+    for i in xrange(3):
+      s.push(Request("http://foo.com/%d" % i, self.foo, 1))
+    r = s.pop(0)
+    s.close("foo.com")
+    # the request over budget is not there
+    self.assertEqual(s.journal, [
+      ('+', ("http://foo.com/0", "foo.com", 1)),
+      ('+', ("http://foo.com/1", "foo.com", 1)),
+      ('-', ("foo.com", r.digest)),
+      ('x', "foo.com"),
+    ])
+
+
+  def test_spill(self):
+    domains = {1: Domain("foo.com", use_robots=False, id=1), 2: Domain("bar.com", use_robots=False, id=2)}
+    unpack = lambda row: Request(row[1], domains[row[0]], row[2], row[3])
+    s = HostScheduler(max_per_host=1, memory=50, pack=Request.pack, unpack=unpack)
+    plain = HostScheduler(max_per_host=1)
+    for i in xrange(1000):
+      for domain in domains.values():
+        path = "help/%d" % i if i % 7 == 0 else "page/%d" % i
+        s.push(Request("http://%s/%s" % (domain.netloc, path), domain, 1))
+        plain.push(Request("http://%s/%s" % (domain.netloc, path), domain, 1))
+    self.assertEqual(s.in_memory, 50)
+    self.assertEqual(s.spilled, 2000 - 50)
+    self.assertTrue(os.path.isdir(s.path))
+    self.assertEqual(sorted(r.url for r in s.requests()), sorted(r.url for r in plain.requests()))
+    for i in xrange(2000):
+      a, b = s.pop(0), plain.pop(0)
+      self.assertEqual((a.url, a.domain, a.digest), (b.url, b.domain, b.digest))
+      self.assertTrue(s.in_memory <= 50)
+      s.done(a.domain.netloc)
+      plain.done(b.domain.netloc)
+    self.assertEqual((len(s), s.in_memory, s.hosts), (0, 0, {}))
+    path = s.path
+    s.cleanup()
+    self.assertFalse(os.path.exists(path))
+
+  def test_close_spilled(self):
+    s = HostScheduler(memory=1)
+    for i in xrange(3):
+      s.push(Request("http://foo.com/%d" % i, self.foo, 1))
+    s.close("foo.com")
+    self.assertEqual((len(s), s.in_memory, s.pruned), (0, 0, 3))
+    self.assertEqual(os.listdir(s.path), [])
+    s.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_session.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import time
+import unittest
+from mock import Mock
+from multiprocessing import Process
+
+import requests
+from mocks import MockHandler, MockServer
+from techscav import DeadHostError, DeadHosts, DNSCache, Domain, Property, Request, SessionPool, SimpleChecker
+
+PORT_NUMBER = 9601
+
+class KeepAliveHandler(MockHandler):
+  """
+  Serves a small page on connections that are kept open, counting them
+  """
+  protocol_version = "HTTP/1.1"
+
+  def setup(self):
+    MockHandler.setup(self)
+    self.server.connections += 1
+
+  def do_GET(self):
+    body = '<a href="/next">next</a><script src="http://foo.com/x.js"></script>'
+    self.send_response(200)
+    if self.path.startswith("/close"):
+      self.send_header('Connection', 'close')
+    self.send_header('Content-type', 'text/html')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+def mark(dead, host):
+  dead.add(host)
+
+
+class TestSessionPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+      cls.server = MockServer(PORT_NUMBER, KeepAliveHandler, connections=0)
+      cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+      cls.server.close()
+
+    def test_reuse(self):
+      http = SessionPool()
+      connections = self.server.server.connections
+      for i in xrange(5):
+        r = http.get("http://localhost:%d/%d" % (PORT_NUMBER, i))
+        self.assertEqual(r.status_code, 200)
+      self.assertEqual(self.server.server.connections - connections, 1)
+      self.assertEqual((http.requests.value, http.reused.value), (5, 4))
+      http.close()
+
+    def test_closed(self):
+      # connections closed by the server are counted, and never reused
+      http = SessionPool()
+      for i in xrange(3):
+        r = http.get("http://localhost:%d/close/%d" % (PORT_NUMBER, i), stream=True)
+        self.assertEqual(r.status_code, 200)
+        r.close()
+      self.assertEqual((http.requests.value, http.reused.value), (3, 0))
+      http.close()
+
+    def test_checker(self):
+      prop = Property.from_config({"properties":[{"name": "Foo", "domains": ["foo.com"]}]})
+      checker = SimpleChecker(prop)
+      domain = Domain("localhost:%d" % PORT_NUMBER, use_robots=False)
+      for i in xrange(3):
+        request = Request("http://localhost:%d/%d" % (PORT_NUMBER, i), domain, 1)
+        self.assertEqual(checker.check(request, None), prop.keys())
+      self.assertEqual((checker.http.requests.value, checker.http.reused.value), (3, 2))
+      # a single connection was opened for the three pages
+      stages = checker.metrics.snapshot()['stages']
+      self.assertEqual((stages['connect']['count'], stages['download']['count']), (1, 3))
+      checker.close()
+
+    def test_resolved(self):
+      dns = DNSCache()
+      dns.put("site.test", ["127.0.0.1"])
+      http = SessionPool(dns=dns)
+      for i in xrange(2):
+        r = http.get("http://site.test:%d/" % PORT_NUMBER)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.url, "http://site.test:%d/" % PORT_NUMBER)
+      self.assertEqual(http.reused.value, 1)
+      self.assertRaises(requests.ConnectionError, SessionPool().get, "http://site.test:%d/" % PORT_NUMBER)
+      dns.close()
+
+    def test_dead_host(self):
+      http = SessionPool(timeout=2)
+      self.assertRaises(requests.ConnectionError, http.get, "http://127.0.0.1:1/a")
+      self.assertIn("127.0.0.1:1", http.dead)
+      started = time.time()
+      for i in xrange(10):
+        self.assertRaises(DeadHostError, http.get, "http://127.0.0.1:1/%d" % i)
+      self.assertTrue(time.time() - started < 0.1)
+      self.assertEqual(http.fast_failed.value, 10)
+      # other hosts are still reached
+      self.assertEqual(http.get("http://localhost:%d/" % PORT_NUMBER).status_code, 200)
+
+    def test_read_errors_are_not_dead(self):
+      http = SessionPool(timeout=2)
+      http.session().get = Mock(side_effect=requests.exceptions.ReadTimeout("read timed out"))
+      self.assertRaises(requests.exceptions.ReadTimeout, http.get, "http://slow.com/")
+      self.assertNotIn("slow.com", http.dead)
+
+    def test_no_dead_hosts(self):
+      http = SessionPool(timeout=2, dead_ttl=0)
+      self.assertIsNone(http.dead)
+      for i in xrange(2):
+        self.assertRaises(requests.ConnectionError, http.get, "http://127.0.0.1:1/")
+      self.assertEqual(http.fast_failed.value, 0)
+
+
+class TestDeadHosts(unittest.TestCase):
+
+    def test_ttl(self):
+      dead = DeadHosts(ttl=10)
+      now = time.time()
+      dead.add("a.com", now)
+      self.assertTrue(dead.dead("a.com", now + 5))
+      self.assertFalse(dead.dead("a.com", now + 11))
+      self.assertFalse(dead.dead("b.com", now))
+      self.assertEqual(dead.marked.value, 1)
+
+    def test_unicode(self):
+      dead = DeadHosts()
+      dead.add(u"b\u00fccher.de")
+      self.assertIn(u"b\u00fccher.de", dead)
+      self.assertNotIn(u"bucher.de", dead)
+      http = SessionPool()
+      http.dead.add(u"b\u00fccher.de")
+      self.assertRaises(DeadHostError, http.get, u"http://b\u00fccher.de/page")
+
+    def test_shared(self):
+      dead = DeadHosts()
+      p = Process(target=mark, args=(dead, "a.com"))
+      p.start()
+      p.join()
+      self.assertIn("a.com", dead)
+      self.assertNotIn("b.com", dead)
+
+    def test_collisions(self):
+      dead = DeadHosts(size=4)
+      hosts = ["host%d.com" % i for i in xrange(20)]
+      for host in hosts:
+        dead.add(host)
+      # a slot holds the last host that landed on it, never another
+      self.assertTrue(1 <= sum(host in dead for host in hosts) <= 4)
+      self.assertNotIn("other.com", dead)
+
+if __name__ == '__main__':
+    unittest.main()
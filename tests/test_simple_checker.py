@@ -10,31 +10,18 @@
 # Author: Artur Ventura
 #
 
+import time
+import socket
 import unittest
-import threading
-from BaseHTTPServer import BaseHTTPRequestHandler,HTTPServer
+from mock import Mock
 
-from techscav import Property, SimpleChecker
+from mocks import MockHandler, MockServer
+from techscav import HTML_TYPES, Domain, Property, Request, SimpleChecker
 
 PORT_NUMBER = 9595
+STREAM_PORT_NUMBER = 9598
 
-class MockServer(threading.Thread):
-    def __init__(self):
-      super(MockServer, self).__init__()
-      self.daemon = True
-      self.server = HTTPServer(('', PORT_NUMBER), MockServerHandler)
-
-    def run(self):
-      self.server.handle_request()
-
-    def close(self):
-      self.server.server_close()
-
-
-class MockServerHandler(BaseHTTPRequestHandler):
-  
-  def log_message(self, *args, **kwargs):
-    pass
+class MockServerHandler(MockHandler):
 
   #Handler for the GET requests
   def do_GET(self):
@@ -55,7 +42,7 @@ class MockServerHandler(BaseHTTPRequestHandler):
 class TestSimpleChecker(unittest.TestCase):
 
     def setUp(self):
-      self.server = MockServer()
+      self.server = MockServer(PORT_NUMBER, MockServerHandler)
       self.server.start()
 
     def test_simple(self):
@@ -78,5 +65,109 @@ class TestSimpleChecker(unittest.TestCase):
     def tearDown(self):
       self.server.close()
 
+
+class StreamingServerHandler(MockHandler):
+  """
+  Serves a page that goes on for 50 MB with a reference to foo.com at the
+  start, or a 1 MB one with a link and the reference at the end, which
+  /moved redirects to
+  """
+
+  def do_GET(self):
+    if self.path == "/moved":
+      self.send_response(302)
+      self.send_header('Location', '/end')
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header('Content-type', 'image/png' if self.path == "/image" else 'text/html; charset=utf-8')
+    self.end_headers()
+    filler = "<p>lorem ipsum dolor sit amet</p>\n" * 1000
+    try:
+      if self.path in ("/start", "/image"):
+        self.wfile.write('<script src="http://foo.com/x.js"></script>')
+      size = 1 if self.path == "/end" else 50
+      for i in xrange(size * 1024 * 1024 / len(filler)):
+        self.wfile.write(filler)
+      if self.path == "/end":
+        self.wfile.write('<a href="/next">next</a><script src="http://foo.com/x.js"></script>')
+    except socket.error:
+      pass
+
+
+class TestStreaming(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+      cls.server = MockServer(STREAM_PORT_NUMBER, StreamingServerHandler)
+      cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+      cls.server.close()
+
+    def setUp(self):
+      self.prop = Property.from_config({
+        "properties":[{"name": "Foo", "domains": ["foo.com"]}]
+      })
+      self.domain = Domain("localhost:%d" % STREAM_PORT_NUMBER, use_robots=False)
+
+    def request(self, path, depth=1):
+      return Request("http://localhost:%d%s" % (STREAM_PORT_NUMBER, path), self.domain, depth)
+
+    def test_stop_when_found(self):
+      checker = SimpleChecker(self.prop, max_bytes=None)
+      started = time.time()
+      self.assertEqual(checker.check(self.request("/start"), None), self.prop.keys())
+      self.assertTrue(time.time() - started < 5)
+      self.assertEqual(checker.stopped.value, 1)
+
+    def test_max_bytes(self):
+      checker = SimpleChecker(self.prop, max_bytes=100000)
+      self.assertEqual(checker.check(self.request("/end"), None), [])
+      self.assertEqual(checker.truncated.value, 1)
+
+    def test_content_type(self):
+      checker = SimpleChecker(self.prop)
+      self.assertEqual(checker.check(self.request("/image"), None), [])
+      self.assertEqual(checker.skipped.value, 1)
+      checker = SimpleChecker(self.prop, max_bytes=100000, content_types=None)
+      self.assertEqual(checker.check(self.request("/image"), None), self.prop.keys())
+      # each checker has its own types
+      types = ['image/png']
+      checker = SimpleChecker(self.prop, content_types=types)
+      types.append('text/html')
+      self.assertEqual(checker.content_types, ('image/png',))
+      self.assertEqual(SimpleChecker(self.prop).content_types, HTML_TYPES)
+
+    def test_links_keep_reading(self):
+      checker = SimpleChecker(self.prop, max_bytes=None)
+      manager = Mock(robots=None)
+      self.assertEqual(checker.check(self.request("/end", depth=2), manager), self.prop.keys())
+      self.assertEqual(checker.stopped.value, 0)
+      request = manager.add_new_request.call_args[0][0]
+      self.assertEqual(request.url, "http://localhost:%d/next" % STREAM_PORT_NUMBER)
+
+    def test_redirect(self):
+      checker = SimpleChecker(self.prop, max_bytes=None)
+      manager = Mock(robots=None)
+      request = self.request("/moved", depth=2)
+      self.assertEqual(checker.check(request, manager), self.prop.keys())
+      manager.add_redirect.assert_called_once_with(request, "http://localhost:%d/end" % STREAM_PORT_NUMBER)
+      manager = Mock(robots=None)
+      checker.check(self.request("/end", depth=2), manager)
+      self.assertFalse(manager.add_redirect.called)
+
+    def test_content_cache(self):
+      checker = SimpleChecker(self.prop, max_bytes=None)
+      checker.extractor = Mock(wraps=checker.extractor)
+      for path in ("/end", "/moved"):
+        manager = Mock(robots=None)
+        self.assertEqual(checker.check(self.request(path, depth=2), manager), self.prop.keys())
+        request = manager.add_new_request.call_args[0][0]
+        self.assertEqual(request.url, "http://localhost:%d/next" % STREAM_PORT_NUMBER)
+      self.assertEqual(checker.extractor.extract.call_count, 1)
+      self.assertEqual((checker.cache.hits.value, checker.cache.misses.value), (1, 1))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+#! /usr/bin/python
+
+# -*- Mode: Python -*-
+# -*- coding: UTF-8 -*-
+# Copyright (C) 2016 by Artur Ventura
+#
+# File: test_tiered.py
+# Time-stamp: Wed Apr 27 18:46:00 2016
+#
+# Author: Artur Ventura
+#
+
+import os
+import sys
+import unittest
+from mock import Mock
+
+from mocks import MockServer, PagesHandler
+from techscav import Domain, EscalationPolicy, PhantomJSChecker, Property, Request, TieredChecker
+
+FAKE = [sys.executable, os.path.join(os.path.dirname(__file__), "fake_renderer.py")]
+
+PORT_NUMBER = 9600
+
+PAGES = {
+  "/static-match": """<html><body>
+<script src="http://cdn.foo.com/foo.js"></script>
+<a href="/about">About</a>
+</body></html>""",
+  "/static": """<html><body>
+<script src="/a.js"></script><script src="/b.js"></script><script src="/c.js"></script>
+<p>%s</p>
+<a href="/about">About</a>
+</body></html>""" % ("A page with plenty of text to read. " * 50),
+  "/app": """<html><body>
+<div id="app"></div>
+<script src="/bundle.js"></script>
+</body></html>""",
+  "/scripts": """<html><head><title>Shop</title></head><body>
+<script src="/a.js"></script><script src="/b.js"></script>
+<script>var config = {"text": "%s"};</script>
+<noscript>Please enable JavaScript</noscript>
+</body></html>""" % ("x" * 5000),
+}
+
+SPA = """<html><body><div ng-app="shop"></div>
+<script src="/a.js"></script></body></html>"""
+
+class MockServerHandler(PagesHandler):
+  pages = PAGES
+
+
+class TestEscalationPolicy(unittest.TestCase):
+
+  def test_escalate(self):
+    policy = EscalationPolicy()
+    self.assertIsNone(policy.escalate(PAGES["/static"]))
+    self.assertIn("script(s)", policy.escalate(PAGES["/scripts"]))
+    self.assertIn("matches", policy.escalate(PAGES["/app"]))
+    self.assertIn("matches", policy.escalate(SPA))
+    self.assertIsNone(EscalationPolicy(markers=[]).escalate(PAGES["/app"]))
+    self.assertIsNotNone(EscalationPolicy(always=True).escalate(PAGES["/static"]))
+    self.assertIsNotNone(EscalationPolicy(max_text=5000).escalate(PAGES["/static"]))
+
+  def test_text_length(self):
+    policy = EscalationPolicy()
+    self.assertEqual(policy.text_length(PAGES["/scripts"]), len("Shop"))
+
+
+class TestTieredChecker(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = MockServer(PORT_NUMBER, MockServerHandler)
+    cls.server.start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.close()
+
+  def setUp(self):
+    self.p = Property("Foo", ["foo.com"])
+    self.domain = Domain("localhost:%d" % PORT_NUMBER, use_robots=False)
+    self.renderer = PhantomJSChecker({self.p.key: self.p}, None, command=FAKE)
+    self.checker = TieredChecker({self.p.key: self.p}, self.renderer)
+
+  def tearDown(self):
+    self.checker.close()
+
+  def check(self, path, depth=1, manager=None):
+    request = Request("http://localhost:%d%s" % (PORT_NUMBER, path), self.domain, depth)
+    return self.checker.check(request, manager)
+
+  def test_tiers(self):
+    self.assertEqual(self.check("/static-match"), [self.p.key])
+    self.assertEqual(self.check("/static"), [])
+    self.assertEqual(self.renderer.rendered.value, 0)
+    self.assertEqual(set(self.check("/app")), set([self.p.key]))
+    self.assertEqual(set(self.check("/scripts")), set([self.p.key]))
+    self.assertEqual(self.renderer.rendered.value, 2)
+    self.assertEqual(self.checker.checked.value, 4)
+    self.assertEqual(self.checker.escalated.value, 2)
+
+  def test_links(self):
+    manager = Mock(robots=None)
+    self.check("/static", depth=2, manager=manager)
+    self.assertEqual(manager.add_new_request.call_args[0][0].url, "http://localhost:%d/about" % PORT_NUMBER)
+    manager = Mock(robots=None)
+    self.check("/app", depth=2, manager=manager)
+    self.assertEqual(manager.add_new_request.call_args[0][0].url, "http://localhost:%d/next" % PORT_NUMBER)
+
+if __name__ == '__main__':
+    unittest.main()